@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Departamento, Trabajador, Ubicacion, Mapa, ProcedimientoEmergencia
+from .models import Departamento, Trabajador, Ubicacion, Mapa, ProcedimientoEmergencia, ReglaCargo
 
 # Registro de modelos
 @admin.register(Departamento)
@@ -37,3 +37,11 @@ class ProcedimientoEmergenciaAdmin(admin.ModelAdmin):
     list_display = ('titulo', 'tipo_emergencia')
     list_filter = ('tipo_emergencia',)
     search_fields = ('titulo',)
+
+@admin.register(ReglaCargo)
+class ReglaCargoAdmin(admin.ModelAdmin):
+    list_display = ('patron', 'prioridad', 'activa')
+    list_editable = ('prioridad', 'activa')
+    list_filter = ('activa',)
+    search_fields = ('patron',)
+
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AppTouchConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_touch'
+
+    def ready(self):
+        from app_touch import signals  # noqa: F401
@@ -0,0 +1,358 @@
+# busqueda.py
+import heapq
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from functools import lru_cache
+
+from app_touch.directorio import plegar_texto
+
+# Campos indexados y su peso en el puntaje (nombre y apellido pesan más)
+CAMPOS_BUSQUEDA = (
+    ('givenName', 3.0),
+    ('sn', 3.0),
+    ('mail', 2.0),
+    ('title', 1.0),
+    ('department', 1.0),
+)
+
+# Calidad de la coincidencia de un término con una palabra del documento
+CALIDAD_EXACTA = 1.0
+CALIDAD_PREFIJO = 0.8
+CALIDAD_SUBCADENA = 0.5
+CALIDAD_APROXIMADA = 0.4
+
+_SEPARADORES = re.compile(r'[^0-9a-z]+')
+
+# Términos distintos cuyas coincidencias se memorizan por índice
+MAX_TERMINOS_MEMORIZADOS = 2048
+
+
+def palabras(texto):
+    """Palabras sin tildes ni mayúsculas ("Pérez-Soto" -> ["perez", "soto"])"""
+    return [p for p in _SEPARADORES.split(plegar_texto(texto)) if p]
+
+
+def trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def errores_tolerados(termino):
+    """Errores de tipeo admitidos según el largo del término"""
+    if len(termino) < 4:
+        return 0
+    if len(termino) < 8:
+        return 1
+    return 2
+
+
+def distancia_acotada(a, b, maximo):
+    """Distancia de edición entre a y b (una transposición cuenta como un error)
+
+    Devuelve maximo + 1 apenas se sabe que la distancia lo supera.
+    """
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+
+    previa = None
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        actual = [i] + [0] * len(b)
+        for j, cb in enumerate(b, start=1):
+            actual[j] = min(
+                anterior[j] + 1,
+                actual[j - 1] + 1,
+                anterior[j - 1] + (ca != cb)
+            )
+            if previa is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                actual[j] = min(actual[j], previa[j - 2] + 1)
+        if min(actual) > maximo:
+            return maximo + 1
+        previa, anterior = anterior, actual
+    return anterior[-1]
+
+
+def calidad_coincidencia(termino, palabra):
+    """Calidad con que un término coincide con una palabra (0 si no coincide)"""
+    if palabra == termino:
+        return CALIDAD_EXACTA
+    if palabra.startswith(termino):
+        return CALIDAD_PREFIJO
+    if termino in palabra:
+        return CALIDAD_SUBCADENA
+
+    errores = errores_tolerados(termino)
+    if errores and min(
+        distancia_acotada(termino, palabra, errores),
+        distancia_acotada(termino, palabra[:len(termino)], errores)
+    ) <= errores:
+        return CALIDAD_APROXIMADA
+    return 0.0
+
+
+class IndiceBusqueda:
+    """Índice de trigramas en memoria para buscar personas del directorio
+
+    Cada persona activa es un documento formado por las palabras de su
+    nombre, apellido, correo, cargo y departamento, sin tildes ni
+    mayúsculas. Los trigramas se indexan sobre el vocabulario (cada
+    palabra distinta una sola vez), incluyendo los de inicio de palabra
+    ("  j", " ju"), y cada palabra apunta a los documentos que la
+    contienen con el peso de su campo.
+
+    Un término se compara solo contra las palabras candidatas según sus
+    trigramas: coincidencia exacta, prefijo, subcadena o aproximada (con
+    errores de tipeo). El puntaje de un documento suma, por término, la
+    mejor calidad x peso entre sus palabras; todos los términos deben
+    coincidir, igual que en la búsqueda en AD. Las coincidencias de cada
+    término se memorizan, ya que la misma consulta llega letra a letra.
+    """
+
+    def __init__(self, personas, campos=CAMPOS_BUSQUEDA):
+        self.campos = campos
+        self.personas = []
+        self.vocabulario = []
+        self.documentos = []  # por palabra: {documento: peso máximo}
+        self.postings = {}
+        self._ids_palabras = {}
+        # Orden secundario estable por nombre visible (los dos primeros campos)
+        self._orden_nombre = []
+
+        for persona in personas:
+            if persona.get('activo', True):
+                self._indexar(persona)
+        self.coincidencias = lru_cache(maxsize=MAX_TERMINOS_MEMORIZADOS)(self._coincidencias)
+
+    def _indexar(self, persona):
+        documento = len(self.personas)
+        self.personas.append(persona)
+        self._orden_nombre.append(plegar_texto(' '.join(str(persona.get(c) or '') for c, _ in self.campos[:2])))
+
+        for campo, peso in self.campos:
+            for palabra in palabras(persona.get(campo)):
+                id_palabra = self._ids_palabras.get(palabra)
+                if id_palabra is None:
+                    id_palabra = self._ids_palabras[palabra] = len(self.vocabulario)
+                    self.vocabulario.append(palabra)
+                    self.documentos.append({})
+                    for grama in trigramas(f"  {palabra} "):
+                        self.postings.setdefault(grama, array('i')).append(id_palabra)
+                pesos = self.documentos[id_palabra]
+                if pesos.get(documento, 0) < peso:
+                    pesos[documento] = peso
+        return documento
+
+    def __len__(self):
+        return len(self.personas)
+
+    def _palabras_candidatas(self, termino):
+        """Ids de palabras que pueden coincidir con el término según sus trigramas"""
+        if len(termino) < 3:
+            # Términos cortos: basta recorrer el vocabulario
+            return range(len(self.vocabulario))
+
+        gramas = trigramas(f"  {termino}")
+        internos = trigramas(termino)
+        aciertos = Counter()
+        aciertos_internos = Counter()
+        for grama in gramas:
+            lista = self.postings.get(grama)
+            if lista is None:
+                continue
+            aciertos.update(lista)
+            if grama in internos:
+                aciertos_internos.update(lista)
+
+        # Un error cambia hasta 3 trigramas; una transposición, hasta 4
+        umbral = max(1, len(gramas) - 4 * errores_tolerados(termino))
+        candidatas = {p for p, n in aciertos.items() if n >= umbral}
+        candidatas.update(p for p, n in aciertos_internos.items() if n == len(internos))
+        return candidatas
+
+    def _coincidencias(self, termino):
+        """{documento: puntaje} del término (mejor calidad x peso por documento)"""
+        puntajes = {}
+        for id_palabra in self._palabras_candidatas(termino):
+            calidad = calidad_coincidencia(termino, self.vocabulario[id_palabra])
+            if not calidad:
+                continue
+            for documento, peso in self.documentos[id_palabra].items():
+                puntaje = calidad * peso
+                if puntajes.get(documento, 0) < puntaje:
+                    puntajes[documento] = puntaje
+        return puntajes
+
+    def buscar_con_puntaje(self, consulta):
+        """[(persona, puntaje)] que coinciden con todos los términos, de mayor a menor
+
+        El puntaje va normalizado entre 0 y 1 (1 = todos los términos
+        exactos en el campo de mayor peso), para comparar índices distintos.
+        """
+        terminos = list(dict.fromkeys(palabras(consulta)))
+        if not terminos:
+            return []
+
+        por_termino = sorted((self.coincidencias(t) for t in terminos), key=len)
+        totales = dict(por_termino[0])
+        for puntajes in por_termino[1:]:
+            totales = {d: total + puntajes[d] for d, total in totales.items() if d in puntajes}
+            if not totales:
+                return []
+
+        maximo = len(terminos) * max(peso for _, peso in self.campos)
+        orden = sorted(totales, key=lambda d: (-totales[d], self._orden_nombre[d], d))
+        return [(self.personas[documento], totales[documento] / maximo) for documento in orden]
+
+    def buscar(self, consulta):
+        """Personas que coinciden con todos los términos, de mayor a menor puntaje"""
+        return [persona for persona, _ in self.buscar_con_puntaje(consulta)]
+
+
+class IndiceEditable(IndiceBusqueda):
+    """Índice de búsqueda que admite agregar y quitar documentos por clave
+
+    Para tablas pequeñas editadas desde el admin (ubicaciones,
+    procedimientos): un cambio reindexa solo ese documento. Los documentos
+    quitados dejan de apuntarse desde sus palabras; el vocabulario no se
+    compacta, lo que no afecta los resultados.
+    """
+
+    def __init__(self, documentos, campos, clave='id'):
+        self.clave = clave
+        self._por_clave = {}
+        super().__init__([], campos)
+        for documento in documentos:
+            self.agregar(documento)
+
+    def __len__(self):
+        return len(self._por_clave)
+
+    def agregar(self, documento):
+        """Indexar un documento, reemplazando el que tenga la misma clave"""
+        self.quitar(documento[self.clave])
+        self._por_clave[documento[self.clave]] = self._indexar(documento)
+        self.coincidencias.cache_clear()
+
+    def quitar(self, clave):
+        id_documento = self._por_clave.pop(clave, None)
+        if id_documento is None:
+            return
+        for campo, _ in self.campos:
+            for palabra in palabras(self.personas[id_documento].get(campo)):
+                self.documentos[self._ids_palabras[palabra]].pop(id_documento, None)
+        self.coincidencias.cache_clear()
+
+
+# Sugerencias por prefijo: largo hasta el que se precalcula el top-k y k máximo
+LARGO_PREFIJO_PRECALCULADO = 3
+MAX_SUGERENCIAS = 20
+
+
+class IndiceSugerencias:
+    """Autocompletado por prefijo sobre nombres, apellidos y departamentos
+
+    Cada sugerencia (persona, nombre, apellido o departamento) tiene un
+    peso de popularidad precalculado: personas = 1 + reportes directos,
+    nombres y apellidos = cuántas personas los llevan, departamentos =
+    personas activas. Las claves (texto sin tildes ni mayúsculas, más las
+    variantes "apellido nombre" y cada palabra de un departamento) se
+    guardan en un arreglo ordenado y un prefijo se resuelve con dos
+    búsquedas binarias. Para prefijos de hasta LARGO_PREFIJO_PRECALCULADO
+    letras, donde el rango es grande, el top-k ya viene calculado.
+    """
+
+    def __init__(self, personas, departamentos):
+        personas = [p for p in personas if p.get('activo', True)]
+        reportes = Counter(str(p['manager']).lower() for p in personas if p.get('manager'))
+
+        self.tipos = []
+        self.textos = []
+        self.pesos = []
+        self.correos = []
+        ids = {}
+        claves = []
+
+        def agregar(tipo, texto, peso, correo=None, acumular=False):
+            texto = ' '.join(str(texto or '').split())
+            if not texto:
+                return None
+            clave_entrada = (tipo, texto if tipo != 'persona' else correo or texto)
+            id_entrada = ids.get(clave_entrada)
+            if id_entrada is None:
+                id_entrada = ids[clave_entrada] = len(self.textos)
+                self.tipos.append(tipo)
+                self.textos.append(texto)
+                self.pesos.append(0)
+                self.correos.append(correo)
+            self.pesos[id_entrada] = self.pesos[id_entrada] + peso if acumular else max(self.pesos[id_entrada], peso)
+            return id_entrada
+
+        for persona in personas:
+            nombre = ' '.join(str(persona.get('givenName') or '').split())
+            apellido = ' '.join(str(persona.get('sn') or '').split())
+            dn = str(persona.get('distinguishedName') or '').lower()
+
+            completo = f"{nombre} {apellido}".strip()
+            id_persona = agregar('persona', completo, 1 + reportes.get(dn, 0), correo=persona.get('mail'))
+            if id_persona is not None:
+                claves.append((plegar_texto(completo), id_persona))
+                if nombre and apellido:
+                    claves.append((plegar_texto(f"{apellido} {nombre}"), id_persona))
+
+            for tipo, texto in (('nombre', nombre), ('apellido', apellido)):
+                id_entrada = agregar(tipo, texto, 1, acumular=True)
+                if id_entrada is not None and self.pesos[id_entrada] == 1:
+                    claves.append((plegar_texto(texto), id_entrada))
+
+        for nombre, total in departamentos:
+            id_entrada = agregar('departamento', nombre, total)
+            if id_entrada is None:
+                continue
+            palabras_departamento = plegar_texto(nombre).split()
+            for i in range(len(palabras_departamento)):
+                claves.append((' '.join(palabras_departamento[i:]), id_entrada))
+
+        claves.sort()
+        self.claves = [clave for clave, _ in claves]
+        self.entradas = array('i', (id_entrada for _, id_entrada in claves))
+        self._top = self._precalcular()
+
+    def __len__(self):
+        return len(self.textos)
+
+    def _mejores(self, ids_entradas, k):
+        return heapq.nsmallest(k, set(ids_entradas), key=lambda e: (-self.pesos[e], self.textos[e]))
+
+    def _precalcular(self):
+        por_prefijo = {}
+        for clave, id_entrada in zip(self.claves, self.entradas):
+            for largo in range(1, min(len(clave), LARGO_PREFIJO_PRECALCULADO) + 1):
+                por_prefijo.setdefault(clave[:largo], []).append(id_entrada)
+        return {prefijo: self._mejores(ids_entradas, MAX_SUGERENCIAS) for prefijo, ids_entradas in por_prefijo.items()}
+
+    def sugerir(self, prefijo, k=8):
+        """Las k sugerencias más populares que comienzan con el prefijo"""
+        prefijo = plegar_texto(prefijo)
+        if not prefijo:
+            return []
+        k = min(k, MAX_SUGERENCIAS)
+
+        if len(prefijo) <= LARGO_PREFIJO_PRECALCULADO:
+            mejores = self._top.get(prefijo, [])[:k]
+        else:
+            inicio = bisect_left(self.claves, prefijo)
+            fin = bisect_right(self.claves, prefijo + '\uffff', inicio)
+            mejores = self._mejores(self.entradas[inicio:fin], k)
+
+        sugerencias = []
+        for id_entrada in mejores:
+            sugerencia = {
+                'texto': self.textos[id_entrada],
+                'tipo': self.tipos[id_entrada],
+                'peso': self.pesos[id_entrada],
+            }
+            if self.correos[id_entrada]:
+                sugerencia['correo'] = self.correos[id_entrada]
+            sugerencias.append(sugerencia)
+        return sugerencias
@@ -0,0 +1,108 @@
+# busqueda_fts.py
+import time
+from datetime import datetime
+
+from django.db import DatabaseError, connection
+
+from app_touch.busqueda import palabras
+from app_touch.models import Departamento, Trabajador, VersionIndiceFts
+
+# Tabla virtual FTS5 creada por la migración 0017 (solo en SQLite)
+TABLA_FTS = 'app_touch_trabajador_fts'
+
+# Pesos BM25 por columna: nombre, apellido, email, cargo, departamento
+PESOS_BM25 = (3.0, 3.0, 2.0, 1.0, 1.0)
+
+
+def version_fts():
+    """Versión del índice FTS5, o None si no se puede buscar en él
+
+    Una sola consulta por búsqueda responde si el índice existe y tiene
+    filas y con qué versión armar los cursores. La versión vive en la base
+    de datos (no en el cache, que puede descartarla) y la escribe
+    `reconstruir_indice_fts` en la misma transacción que el índice.
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    try:
+        return VersionIndiceFts.objects.filter(pk=1, total_filas__gt=0).values_list('version', flat=True).first()
+    except DatabaseError:
+        # Migraciones pendientes: se busca en el índice en memoria
+        return None
+
+
+def reconstruir_indice_fts():
+    """Rellenar la tabla FTS5 con los trabajadores activos y publicar una versión nueva"""
+    if connection.vendor != 'sqlite':
+        return
+    trabajadores = Trabajador._meta.db_table
+    departamentos = Departamento._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA_FTS}")
+        cursor.execute(
+            f"INSERT INTO {TABLA_FTS} (rowid, nombre, apellido, email, cargo, departamento) "
+            f"SELECT t.id, t.nombre, t.apellido, t.email, t.cargo, COALESCE(d.nombre, '') "
+            f"FROM {trabajadores} t LEFT JOIN {departamentos} d ON d.id = t.departamento_id "
+            f"WHERE t.cuenta_activa"
+        )
+        total_filas = cursor.rowcount
+
+    # Invalida los cursores de búsqueda emitidos con el índice anterior
+    VersionIndiceFts.objects.update_or_create(pk=1, defaults={
+        'version': f"fts{time.time_ns():x}",
+        'total_filas': max(total_filas, 0),
+    })
+
+
+def consulta_fts(texto):
+    """Expresión MATCH con cada palabra como prefijo ("juan per" -> "juan"* AND "per"*)"""
+    terminos = list(dict.fromkeys(palabras(texto)))
+    if not terminos:
+        return None
+    return ' AND '.join(f'"{termino}"*' for termino in terminos)
+
+
+def buscar_fts(texto, limite, desplazamiento=0):
+    """(total, filas) de trabajadores activos ordenados por BM25, con fragmento resaltado"""
+    consulta = consulta_fts(texto)
+    if consulta is None:
+        return 0, []
+
+    pesos = ', '.join(str(peso) for peso in PESOS_BM25)
+    trabajadores = Trabajador._meta.db_table
+    departamentos = Departamento._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s", [consulta])
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            f"SELECT t.nombre, t.apellido, t.email, t.cargo, COALESCE(d.nombre, ''), t.telefono, "
+            f"t.ultima_conexion, t.compañia, "
+            f"snippet({TABLA_FTS}, -1, '<b>', '</b>', '…', 8) "
+            f"FROM {TABLA_FTS} f JOIN {trabajadores} t ON t.id = f.rowid "
+            f"LEFT JOIN {departamentos} d ON d.id = t.departamento_id "
+            f"WHERE {TABLA_FTS} MATCH %s "
+            f"ORDER BY bm25({TABLA_FTS}, {pesos}), t.nombre, t.apellido "
+            f"LIMIT %s OFFSET %s",
+            [consulta, limite, desplazamiento]
+        )
+        filas = cursor.fetchall()
+
+    resultados = []
+    for nombre, apellido, email, cargo, departamento, telefono, ultima_conexion, compania, fragmento in filas:
+        if isinstance(ultima_conexion, str):
+            ultima_conexion = datetime.fromisoformat(ultima_conexion)
+        resultados.append({
+            'givenName': nombre,
+            'sn': apellido,
+            'mail': email,
+            'title': cargo,
+            'department': departamento,
+            'lastLogonTimestamp': ultima_conexion.isoformat() if ultima_conexion else None,
+            'telephoneNumber': telefono,
+            'company': compania,
+            'distinguishedName': None,
+            'DisplayName': f"{nombre} {apellido}".strip(),
+            'userAccountControl_enabled': True,
+            'coincidencia': fragmento,
+        })
+    return total, resultados
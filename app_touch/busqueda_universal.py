@@ -0,0 +1,132 @@
+# busqueda_universal.py
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from app_touch.busqueda import IndiceBusqueda, IndiceEditable
+
+logger = logging.getLogger(__name__)
+
+# Campos indexados de cada tipo de entidad local y su peso
+CAMPOS_DEPARTAMENTO = (('nombre', 3.0), ('variantes', 1.0))
+CAMPOS_UBICACION = (('nombre', 3.0), ('categoria_nombre', 1.0))
+CAMPOS_PROCEDIMIENTO = (('titulo', 3.0), ('descripcion', 1.0))
+
+# Cada cuántos segundos un proceso verifica si otro proceso editó ubicaciones o procedimientos
+LUGARES_TTL = getattr(settings, 'BUSQUEDA_LUGARES_TTL', 60)
+CLAVE_VERSION_LUGARES = 'busqueda_lugares_version'
+
+
+def documento_ubicacion(ubicacion):
+    return {
+        'id': ubicacion.id,
+        'nombre': ubicacion.nombre,
+        'categoria': ubicacion.categoria,
+        'categoria_nombre': ubicacion.get_categoria_display(),
+        'coordenada_x': ubicacion.coordenada_x,
+        'coordenada_y': ubicacion.coordenada_y,
+        'departamento_id': ubicacion.departamento_id,
+    }
+
+
+def documento_procedimiento(procedimiento):
+    return {
+        'id': procedimiento.id,
+        'titulo': procedimiento.titulo,
+        'descripcion': procedimiento.descripcion,
+        'tipo_emergencia': procedimiento.tipo_emergencia,
+    }
+
+
+def construir_indice_departamentos(registro):
+    """Índice de los departamentos canónicos (nombre y variantes vistas en AD)"""
+    return IndiceBusqueda(
+        [{
+            'id': entrada.id,
+            'nombre': entrada.nombre,
+            'variantes': ' '.join(entrada.variantes),
+            'total_personas': len(entrada.miembros_activos),
+        } for entrada in registro.departamentos],
+        CAMPOS_DEPARTAMENTO
+    )
+
+
+class IndicesLugares:
+    """Índices editables de ubicaciones y procedimientos de emergencia"""
+
+    def __init__(self, ubicaciones, procedimientos):
+        self.ubicaciones = IndiceEditable(ubicaciones, CAMPOS_UBICACION)
+        self.procedimientos = IndiceEditable(procedimientos, CAMPOS_PROCEDIMIENTO)
+
+
+_lugares = None
+_version = None
+_verificado_en = 0.0
+_lock = threading.RLock()
+
+
+def _cargar_lugares():
+    from app_touch.models import ProcedimientoEmergencia, Ubicacion
+
+    inicio = time.time()
+    indices = IndicesLugares(
+        [documento_ubicacion(u) for u in Ubicacion.objects.all()],
+        [documento_procedimiento(p) for p in ProcedimientoEmergencia.objects.all()]
+    )
+    logger.info(
+        f"🗺️ Índice de lugares cargado: {len(indices.ubicaciones)} ubicaciones, "
+        f"{len(indices.procedimientos)} procedimientos en {(time.time() - inicio) * 1000:.1f}ms"
+    )
+    return indices
+
+
+def _vigentes():
+    """Índices de lugares del proceso; se recargan si otro proceso los modificó"""
+    global _lugares, _version, _verificado_en
+
+    ahora = time.time()
+    if _lugares is not None and ahora - _verificado_en < LUGARES_TTL:
+        return _lugares
+
+    version = cache.get(CLAVE_VERSION_LUGARES)
+    if _lugares is None or version != _version:
+        _lugares = _cargar_lugares()
+        _version = version
+    _verificado_en = ahora
+    return _lugares
+
+
+def buscar_lugares(consulta):
+    """(ubicaciones, procedimientos) como listas de (documento, puntaje)"""
+    with _lock:
+        lugares = _vigentes()
+        return lugares.ubicaciones.buscar_con_puntaje(consulta), lugares.procedimientos.buscar_con_puntaje(consulta)
+
+
+def _publicar_cambio():
+    """Nueva versión para los demás procesos; este ya tiene el índice al día"""
+    global _version
+    _version = time.time()
+    cache.set(CLAVE_VERSION_LUGARES, _version, None)
+
+
+def actualizar_documento(tipo, documento=None, clave=None):
+    """Reindexar (o quitar, sin documento) una ubicación o un procedimiento
+
+    Solo toca el índice si este proceso lo tenía cargado y al día; si no,
+    se construirá completo desde la base de datos en la próxima búsqueda.
+    """
+    global _lugares
+    with _lock:
+        if _lugares is not None and cache.get(CLAVE_VERSION_LUGARES) != _version:
+            _lugares = None
+        if _lugares is not None:
+            indice = getattr(_lugares, tipo)
+            if documento is not None:
+                indice.agregar(documento)
+            else:
+                indice.quitar(clave)
+        _publicar_cambio()
@@ -0,0 +1,134 @@
+# cache_helpers.py
+import hashlib
+import json
+import time
+from urllib.parse import parse_qsl, urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Parámetros de texto libre cuyo valor no distingue mayúsculas ni espacios
+PARAMETROS_TEXTO = ('q', 'correo', 'nombre', 'nombre_departamento')
+
+# Marca que identifica una referencia a un payload direccionado por contenido
+MARCA_CAS = '__cas__'
+PREFIJO_PAYLOAD = 'cas_payload_'
+
+# Tamaño (JSON, en bytes) desde el que un payload se guarda aparte y se comparte.
+# Más chicos van directo bajo su clave: una fila del cache en vez de dos.
+MIN_BYTES_CAS = getattr(settings, 'CACHE_CAS_MIN_BYTES', 8 * 1024)
+
+# Largo máximo de la parte variable de la clave antes de resumirla con un hash
+MAX_LARGO_CLAVE = 180
+
+
+def normalizar_texto_clave(valor):
+    """Normalizar texto libre: minúsculas y espacios colapsados"""
+    return ' '.join(str(valor).split()).lower()
+
+
+def canonicalizar_parametros(parametros, campos_texto=PARAMETROS_TEXTO):
+    """Construir representación canónica de los parámetros de una consulta
+
+    Acepta un querystring o un diccionario. Los parámetros se ordenan por
+    nombre y los campos de texto libre se normalizan, de modo que
+    "q=Juan" y "q=juan " producen la misma clave.
+    """
+    if isinstance(parametros, str):
+        pares = parse_qsl(parametros, keep_blank_values=True)
+    else:
+        pares = list(parametros.items())
+
+    canonicos = []
+    for nombre, valor in pares:
+        nombre = str(nombre).strip().lower()
+        if nombre in campos_texto:
+            valor = normalizar_texto_clave(valor)
+        else:
+            valor = str(valor).strip()
+        canonicos.append((nombre, valor))
+
+    return urlencode(sorted(canonicos))
+
+
+def construir_clave_cache(key_prefix, nombre_funcion, querystring='', kwargs=None):
+    """Clave de cache canónica para una vista (querystring + argumentos de ruta)"""
+    partes = canonicalizar_parametros(querystring)
+    if kwargs:
+        partes_ruta = canonicalizar_parametros(kwargs)
+        partes = f"{partes_ruta}&{partes}" if partes else partes_ruta
+
+    if len(partes) > MAX_LARGO_CLAVE:
+        partes = hashlib.sha1(partes.encode('utf-8')).hexdigest()
+
+    return f"{key_prefix}_{nombre_funcion}_{partes}"
+
+
+def _serializar_payload(payload):
+    return json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False).encode('utf-8')
+
+
+def hash_payload(payload):
+    """Hash estable del contenido de una respuesta"""
+    return hashlib.sha256(_serializar_payload(payload)).hexdigest()
+
+
+def _es_referencia(valor):
+    return isinstance(valor, tuple) and len(valor) == 2 and valor[0] == MARCA_CAS
+
+
+def _es_entrada_payload(valor):
+    return isinstance(valor, tuple) and len(valor) == 3 and valor[0] == MARCA_CAS
+
+
+def _expira_antes(expira, otra):
+    """True si el vencimiento expira es anterior a otra (None = no vence)"""
+    return expira is not None and (otra is None or expira < otra)
+
+
+def cache_get_contenido(cache_key):
+    """Obtener un valor guardado con cache_set_contenido (None si no existe)
+
+    Los payloads chicos (y las entradas antiguas) están directamente bajo
+    la clave y se devuelven tal cual.
+    """
+    valor = cache.get(cache_key)
+    if valor is None or not _es_referencia(valor):
+        return valor
+
+    entrada = cache.get(f"{PREFIJO_PAYLOAD}{valor[1]}")
+    if not _es_entrada_payload(entrada):
+        # El payload fue descartado por el cull: la referencia quedó huérfana
+        cache.delete(cache_key)
+        return None
+    return entrada[2]
+
+
+def cache_set_contenido(cache_key, payload, timeout):
+    """Guardar un payload bajo cache_key, compartiéndolo si es grande
+
+    Un payload de menos de MIN_BYTES_CAS se guarda directo bajo la clave
+    (devuelve None). Uno grande se guarda una sola vez por contenido y la
+    clave solo lo referencia (devuelve el hash): claves distintas con
+    respuestas idénticas comparten la misma entrada de payload, que guarda
+    su propio vencimiento. El vencimiento solo se extiende (al mayor de los
+    timeouts de las claves que lo usan), así ninguna referencia vigente
+    apunta a un payload ya vencido. Un payload que ya nadie referencia
+    simplemente expira; si el cull lo descarta antes, la referencia se
+    trata como un miss.
+    """
+    serializado = _serializar_payload(payload)
+    if len(serializado) < MIN_BYTES_CAS:
+        cache.set(cache_key, payload, timeout)
+        return None
+
+    digest = hashlib.sha256(serializado).hexdigest()
+    clave_payload = f"{PREFIJO_PAYLOAD}{digest}"
+    expira = None if timeout is None else time.time() + timeout
+
+    entrada = cache.get(clave_payload)
+    if not _es_entrada_payload(entrada) or _expira_antes(entrada[1], expira):
+        cache.set(clave_payload, (MARCA_CAS, expira, payload), timeout)
+
+    cache.set(cache_key, (MARCA_CAS, digest), timeout)
+    return digest
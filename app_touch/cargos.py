@@ -0,0 +1,176 @@
+# cargos.py
+import hashlib
+import logging
+import re
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+from app_touch.directorio import plegar_texto
+
+logger = logging.getLogger(__name__)
+
+# Reglas usadas si la tabla ReglaCargo aún no existe (menor prioridad = mayor jerarquía)
+REGLAS_CARGO_POR_DEFECTO = (
+    ('gerente general', 1),
+    ('gerente', 2),
+    ('subgerente', 3),
+    ('jefe', 4),
+    ('jefa', 4),
+    ('especialista', 4),
+    ('coordinador', 5),
+    ('coordinadora', 5),
+    ('encargado', 5),
+    ('encargada', 5),
+)
+
+PRIORIDAD_SIN_CARGO = 999
+
+# Cada cuántos segundos un proceso verifica si otro proceso cambió las reglas
+REGLAS_CARGO_TTL = getattr(settings, 'REGLAS_CARGO_TTL', 60)
+CLAVE_VERSION_REGLAS = 'reglas_cargo_version'
+
+# Títulos distintos memorizados por clasificador
+MAX_TITULOS_MEMORIZADOS = 4096
+
+
+class ClasificadorCargos:
+    """Clasificación de títulos con una sola expresión regular compilada
+
+    Las reglas son pares (patrón, prioridad). Los patrones se comparan como
+    palabras completas, sin distinguir mayúsculas ni tildes, y un título
+    recibe la mejor (menor) prioridad entre todas las reglas que contiene.
+    El resultado se memoriza por título.
+    """
+
+    def __init__(self, reglas):
+        self.prioridades = {}
+        for patron, prioridad in reglas:
+            clave = plegar_texto(patron)
+            if clave:
+                self.prioridades[clave] = min(prioridad, self.prioridades.get(clave, prioridad))
+
+        self.expresion = None
+        if self.prioridades:
+            # Los patrones más largos primero para que "gerente general" gane a "gerente"
+            alternativas = sorted(self.prioridades, key=len, reverse=True)
+            self.expresion = re.compile(r'\b(?:' + '|'.join(map(re.escape, alternativas)) + r')\b')
+
+        # Identifica el conjunto de reglas: las estructuras que dependen de
+        # la clasificación se guardan con esta versión
+        self.reglas = tuple(sorted(self.prioridades.items()))
+        self.version = hashlib.sha1(repr(self.reglas).encode('utf-8')).hexdigest()[:12]
+
+        self.clasificar = lru_cache(maxsize=MAX_TITULOS_MEMORIZADOS)(self._clasificar)
+
+    def _clasificar(self, titulo):
+        if not titulo or self.expresion is None:
+            return False, PRIORIDAD_SIN_CARGO
+
+        coincidencias = self.expresion.findall(plegar_texto(titulo))
+        if not coincidencias:
+            return False, PRIORIDAD_SIN_CARGO
+        return True, min(self.prioridades[c] for c in coincidencias)
+
+
+_clasificador = None
+_version = None
+_verificado_en = 0.0
+_lock = threading.Lock()
+
+
+def _cargar_reglas():
+    """Reglas activas desde la base de datos (las por defecto si no hay tabla)"""
+    from app_touch.models import ReglaCargo
+
+    try:
+        return list(ReglaCargo.objects.filter(activa=True).values_list('patron', 'prioridad'))
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudieron leer las reglas de cargo, usando las por defecto: {e}")
+        return list(REGLAS_CARGO_POR_DEFECTO)
+
+
+def obtener_clasificador() -> ClasificadorCargos:
+    """Clasificador vigente; se recarga si otro proceso invalidó las reglas"""
+    global _clasificador, _version, _verificado_en
+
+    ahora = time.time()
+    if _clasificador is not None and ahora - _verificado_en < REGLAS_CARGO_TTL:
+        return _clasificador
+
+    with _lock:
+        if _clasificador is not None and ahora - _verificado_en < REGLAS_CARGO_TTL:
+            return _clasificador
+
+        version = cache.get(CLAVE_VERSION_REGLAS)
+        if _clasificador is None or version != _version:
+            reglas = _cargar_reglas()
+            _clasificador = ClasificadorCargos(reglas)
+            _version = version
+            logger.info(f"🏷️ Clasificador de cargos cargado con {len(_clasificador.prioridades)} reglas")
+        _verificado_en = ahora
+        return _clasificador
+
+
+def invalidar_reglas():
+    """Forzar la recarga de las reglas en este y en los demás procesos"""
+    global _clasificador
+    cache.set(CLAVE_VERSION_REGLAS, time.time(), None)
+    with _lock:
+        _clasificador = None
+
+
+def version_reglas():
+    """Versión de las reglas vigentes (para claves de cache y derivados)"""
+    return obtener_clasificador().version
+
+
+def fijar_reglas(reglas):
+    """Usar exactamente estas reglas en este proceso
+
+    Un cálculo enviado al pool de procesos recibe las reglas del proceso que
+    lo pide: el hijo podría tener todavía las anteriores en memoria.
+    """
+    global _clasificador, _verificado_en
+
+    clasificador = ClasificadorCargos(reglas)
+    with _lock:
+        if _clasificador is None or _clasificador.version != clasificador.version:
+            _clasificador = clasificador
+        _verificado_en = time.time()
+
+
+def clasificar_titulo(titulo):
+    """(es_cargo_jerarquico, prioridad) de un título"""
+    if isinstance(titulo, list):
+        titulo = titulo[0] if titulo else ''
+    return obtener_clasificador().clasificar(str(titulo or ''))
+
+
+def es_cargo_jerarquico_valido(persona):
+    """Determinar si es un cargo jerárquico válido"""
+    if not persona or not persona.get('title'):
+        return False
+    return clasificar_titulo(persona.get('title'))[0]
+
+
+def obtener_prioridad_jerarquia(titulo):
+    """Obtener prioridad numérica de un cargo para determinar el jerarca"""
+    return clasificar_titulo(titulo)[1]
+
+
+def info_clasificador():
+    """Reglas cargadas y uso de la memoria de títulos (por proceso)"""
+    if _clasificador is None:
+        return {'cargado': False}
+    memoria = _clasificador.clasificar.cache_info()
+    return {
+        'cargado': True,
+        'reglas': len(_clasificador.prioridades),
+        'titulos_memorizados': memoria.currsize,
+        'hits': memoria.hits,
+        'misses': memoria.misses,
+    }
@@ -0,0 +1,161 @@
+# cierre_supervision.py
+import logging
+import time
+
+from django.db.models import Count
+
+from app_touch.models import CierreSupervision, Trabajador
+
+logger = logging.getLogger(__name__)
+
+# Valores por sentencia en los IN (...) y en bulk_create
+TAMANO_LOTE_CIERRE = 500
+
+
+def _trozos(valores, tamano=TAMANO_LOTE_CIERRE):
+    valores = list(valores)
+    for i in range(0, len(valores), tamano):
+        yield valores[i:i + tamano]
+
+
+def _relaciones():
+    """(hijos, padres) de supervisa_a como diccionarios de ids"""
+    hijos = {}
+    padres = {}
+    for jefe, subordinado in Trabajador.supervisa_a.through.objects.values_list('from_trabajador_id', 'to_trabajador_id'):
+        hijos.setdefault(jefe, []).append(subordinado)
+        padres.setdefault(subordinado, []).append(jefe)
+    return hijos, padres
+
+
+def _distancias(vecinos, origen):
+    """{nodo: distancia mínima} alcanzables desde origen (sin incluirlo), recorriendo por niveles"""
+    distancias = {}
+    visitados = {origen}
+    frontera = vecinos.get(origen, ())
+    profundidad = 1
+    while frontera:
+        siguiente = []
+        for nodo in frontera:
+            if nodo in visitados:
+                continue
+            visitados.add(nodo)
+            distancias[nodo] = profundidad
+            siguiente.extend(vecinos.get(nodo, ()))
+        frontera = siguiente
+        profundidad += 1
+    return distancias
+
+
+def _aplicar(deseados, existentes):
+    """Escribir solo la diferencia entre las filas deseadas y las existentes
+
+    deseados: {(jefe, subordinado): profundidad}
+    existentes: {(jefe, subordinado): (id, profundidad)}
+    """
+    sobrantes = [id_fila for par, (id_fila, _) in existentes.items() if par not in deseados]
+    nuevos = [par for par in deseados if par not in existentes]
+    cambios = {}
+    for par, (id_fila, profundidad) in existentes.items():
+        if par in deseados and deseados[par] != profundidad:
+            cambios.setdefault(deseados[par], []).append(id_fila)
+
+    for trozo in _trozos(sobrantes):
+        CierreSupervision.objects.filter(id__in=trozo).delete()
+    CierreSupervision.objects.bulk_create(
+        [CierreSupervision(jefe_id=jefe, subordinado_id=subordinado, profundidad=deseados[(jefe, subordinado)])
+         for jefe, subordinado in nuevos],
+        batch_size=TAMANO_LOTE_CIERRE
+    )
+    for profundidad, ids in cambios.items():
+        for trozo in _trozos(ids):
+            CierreSupervision.objects.filter(id__in=trozo).update(profundidad=profundidad)
+
+    return {
+        'cierre_creados': len(nuevos),
+        'cierre_eliminados': len(sobrantes),
+        'cierre_actualizados': sum(len(ids) for ids in cambios.values()),
+    }
+
+
+def reconstruir_cierre():
+    """Recalcular la clausura completa desde supervisa_a (tras la sincronización masiva)"""
+    inicio = time.time()
+    hijos, _ = _relaciones()
+    deseados = {}
+    for jefe in hijos:
+        for subordinado, profundidad in _distancias(hijos, jefe).items():
+            deseados[(jefe, subordinado)] = profundidad
+
+    existentes = {
+        (jefe, subordinado): (id_fila, profundidad)
+        for id_fila, jefe, subordinado, profundidad in
+        CierreSupervision.objects.values_list('id', 'jefe_id', 'subordinado_id', 'profundidad')
+    }
+    estadisticas = _aplicar(deseados, existentes)
+    estadisticas['cierre_filas'] = len(deseados)
+    logger.info(f"🌳 Cierre de supervisión reconstruido en {time.time() - inicio:.2f}s: {estadisticas}")
+    return estadisticas
+
+
+def descendientes(ids):
+    """Ids de los subordinados directos e indirectos de ids, incluidos ellos mismos"""
+    ids = set(ids)
+    resultado = set(ids)
+    for trozo in _trozos(ids):
+        resultado.update(CierreSupervision.objects.filter(jefe_id__in=trozo).values_list('subordinado_id', flat=True))
+    return resultado
+
+
+def actualizar_cierre(afectados):
+    """Recalcular las filas de los trabajadores cuyos jefes cambiaron y de sus subordinados
+
+    Un cambio en los jefes de un trabajador solo altera los caminos que
+    llegan a él o a su subárbol, así que se recalculan los jefes (hacia
+    arriba) de ese conjunto y se escribe la diferencia.
+    """
+    afectados = descendientes(afectados)
+    if not afectados:
+        return {}
+
+    _, padres = _relaciones()
+    deseados = {}
+    for subordinado in afectados:
+        for jefe, profundidad in _distancias(padres, subordinado).items():
+            deseados[(jefe, subordinado)] = profundidad
+
+    existentes = {}
+    for trozo in _trozos(afectados):
+        for id_fila, jefe, subordinado, profundidad in CierreSupervision.objects.filter(
+                subordinado_id__in=trozo).values_list('id', 'jefe_id', 'subordinado_id', 'profundidad'):
+            existentes[(jefe, subordinado)] = (id_fila, profundidad)
+    return _aplicar(deseados, existentes)
+
+
+# ========== CONSULTAS (un SELECT indexado cada una) ==========
+
+def subordinados(trabajador_id, profundidad_max=None):
+    """Filas del subárbol bajo el trabajador, por nivel"""
+    filas = CierreSupervision.objects.filter(jefe_id=trabajador_id)
+    if profundidad_max is not None:
+        filas = filas.filter(profundidad__lte=profundidad_max)
+    return filas.select_related('subordinado', 'subordinado__departamento').order_by('profundidad', 'subordinado_id')
+
+
+def cadena_mando(trabajador_id):
+    """Filas de los jefes del trabajador, del directo hacia arriba"""
+    return (
+        CierreSupervision.objects.filter(subordinado_id=trabajador_id)
+        .select_related('jefe', 'jefe__departamento')
+        .order_by('profundidad', 'jefe_id')
+    )
+
+
+def conteo_subordinados(trabajador_id):
+    """{profundidad: personas} bajo el trabajador"""
+    return dict(
+        CierreSupervision.objects.filter(jefe_id=trabajador_id)
+        .values_list('profundidad')
+        .annotate(total=Count('id'))
+        .order_by('profundidad')
+    )
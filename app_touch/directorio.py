@@ -0,0 +1,580 @@
+# directorio.py
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.utils.text import slugify
+
+from app_touch.filtro_bloom import FiltroBloom
+from app_touch.ldap_helpers import get_ldap_connection, is_enabled
+
+logger = logging.getLogger(__name__)
+
+COMPANIA = 'Envases CMF S.A.'
+FILTRO_DIRECTORIO = f"(&(objectClass=person)(company={COMPANIA}))"
+
+# Superconjunto de atributos que usan las vistas del directorio
+ATRIBUTOS_DIRECTORIO = [
+    'givenName', 'sn', 'mail', 'title', 'department',
+    'telephoneNumber', 'lastLogonTimestamp', 'company',
+    'userAccountControl', 'manager', 'distinguishedName', 'DisplayName'
+]
+
+# Tiempo de vida del snapshot en memoria (segundos)
+DIRECTORIO_TTL = getattr(settings, 'DIRECTORIO_TTL', 60 * 60)
+
+# Espera antes de reintentar una carga fallida del directorio (segundos)
+DIRECTORIO_REINTENTO = getattr(settings, 'DIRECTORIO_REINTENTO', 60)
+
+# Edad máxima del filtro de correos para confiar en que un correo no existe (segundos)
+DIRECTORIO_NEGATIVO_TTL = getattr(settings, 'DIRECTORIO_NEGATIVO_TTL', 5 * 60)
+
+# Tasa de falsos positivos de los filtros de pertenencia
+TASA_FALSOS_POSITIVOS = 0.001
+
+# Dígitos finales del teléfono que forman el anexo cuando no viene explícito
+DIGITOS_ANEXO = getattr(settings, 'DIGITOS_ANEXO', 4)
+
+
+def _valor_simple(value):
+    """Primer valor de un atributo LDAP (o None si está vacío)"""
+    if isinstance(value, list):
+        return value[0] if value and value[0] not in [None, ''] else None
+    return value
+
+
+def normalizar_correo(correo) -> str:
+    return str(correo or '').strip().lower()
+
+
+def plegar_texto(texto) -> str:
+    """Minúsculas, sin tildes y con espacios colapsados ("Jefé  TI" -> "jefe ti")"""
+    descompuesto = unicodedata.normalize('NFKD', str(texto or ''))
+    sin_tildes = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_tildes.split()).lower()
+
+
+def normalizar_departamento(nombre) -> str:
+    """Clave de comparación de departamentos: sin mayúsculas, tildes ni espacios extra"""
+    return plegar_texto(nombre)
+
+
+class DirectorioSnapshot:
+    """Copia inmutable del directorio activo cargada en una sola búsqueda
+
+    `personas` incluye cuentas deshabilitadas (con `activo=False`) para que
+    los consumidores decidan cómo tratarlas. Las estructuras derivadas
+    (filtros, índices, árboles) se construyen una vez por snapshot con
+    `derivado()`, de modo que cada recarga del directorio las reconstruye.
+    `anterior` apunta al snapshot reemplazado (solo un nivel) para que un
+    derivado pueda actualizarse a partir del anterior en vez de rehacerse.
+    """
+
+    def __init__(self, personas, cargado_en=None):
+        self.personas = personas
+        self.cargado_en = cargado_en or time.time()
+        self.version = self._calcular_version(personas)
+        self.anterior = None
+        self._derivados = {}
+        self._lock = threading.RLock()  # los derivados pueden depender de otros derivados
+
+    @staticmethod
+    def _calcular_version(personas) -> str:
+        digest = hashlib.sha1()
+        for persona in sorted(personas, key=lambda p: p.get('distinguishedName') or ''):
+            for attr in ATRIBUTOS_DIRECTORIO:
+                if attr == 'lastLogonTimestamp':
+                    continue
+                digest.update(str(persona.get(attr) or '').encode('utf-8'))
+                digest.update(b'\x1f')
+            digest.update(b'\x1e')
+        return digest.hexdigest()[:16]
+
+    @property
+    def personas_activas(self):
+        return self.derivado('personas_activas', lambda s: [p for p in s.personas if p['activo']])
+
+    def esta_vigente(self) -> bool:
+        return time.time() - self.cargado_en < DIRECTORIO_TTL
+
+    def derivado_existente(self, nombre):
+        """Estructura derivada ya construida (None si no se ha construido)"""
+        return self._derivados.get(nombre)
+
+    def derivado(self, nombre, constructor):
+        """Obtener (o construir una sola vez) una estructura derivada del snapshot"""
+        valor = self._derivados.get(nombre)
+        if valor is not None:
+            return valor
+
+        with self._lock:
+            valor = self._derivados.get(nombre)
+            if valor is None:
+                inicio = time.time()
+                valor = constructor(self)
+                self._derivados[nombre] = valor
+                logger.debug(f"🧱 Derivado '{nombre}' construido en {time.time() - inicio:.3f}s (v{self.version})")
+        return valor
+
+
+def iterar_directorio():
+    """Personas del directorio a medida que llegan las páginas de LDAP (500 por página)"""
+    with get_ldap_connection() as conn:
+        resultados = conn.extend.standard.paged_search(
+            search_base=settings.LDAP_CONFIG['BASE_DN'],
+            search_filter=FILTRO_DIRECTORIO,
+            attributes=ATRIBUTOS_DIRECTORIO,
+            paged_size=500,
+            generator=True
+        )
+
+        for resultado in resultados:
+            if resultado.get('type') != 'searchResEntry':
+                continue
+
+            attrs = resultado.get('attributes', {})
+            persona = {attr: _valor_simple(attrs.get(attr)) for attr in ATRIBUTOS_DIRECTORIO}
+            persona['distinguishedName'] = persona['distinguishedName'] or resultado.get('dn')
+
+            if persona.get('company') != COMPANIA:
+                continue
+
+            persona['activo'] = is_enabled(persona.get('userAccountControl') or 0)
+            yield persona
+
+
+def cargar_directorio() -> DirectorioSnapshot:
+    """Leer el directorio completo desde LDAP con búsqueda paginada"""
+    inicio = time.time()
+    personas = list(iterar_directorio())
+
+    snapshot = DirectorioSnapshot(personas)
+    logger.info(
+        f"📇 Directorio cargado: {len(personas)} personas "
+        f"(v{snapshot.version}) en {time.time() - inicio:.2f}s"
+    )
+    return snapshot
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+_ultimo_error = None
+_reintentar_en = 0.0
+
+
+def directorio_cargado():
+    """Snapshot actual en memoria, sin consultar LDAP (puede ser None)"""
+    return _snapshot
+
+
+def obtener_directorio(forzar: bool = False) -> DirectorioSnapshot:
+    """Snapshot vigente del directorio, recargándolo desde LDAP si expiró
+
+    Mientras un hilo recarga, los demás siguen con el snapshot vencido en
+    vez de esperarlo. Si la recarga falla se usa el snapshot anterior y no
+    se vuelve a intentar hasta pasados DIRECTORIO_REINTENTO segundos; sin
+    snapshot anterior, en ese lapso se relanza el último error sin
+    consultar LDAP.
+    """
+    actual = _snapshot
+    if actual is not None and actual.esta_vigente() and not forzar:
+        return actual
+
+    if not forzar and time.time() < _reintentar_en:
+        if actual is not None:
+            return actual
+        raise _ultimo_error.with_traceback(None)
+
+    if actual is not None and not forzar:
+        if not _snapshot_lock.acquire(blocking=False):
+            return actual
+    else:
+        _snapshot_lock.acquire()
+    try:
+        return _recargar_directorio(forzar)
+    finally:
+        _snapshot_lock.release()
+
+
+def _recargar_directorio(forzar):
+    """Cargar y publicar un snapshot nuevo (con _snapshot_lock tomado)"""
+    global _snapshot, _ultimo_error, _reintentar_en
+
+    actual = _snapshot
+    if actual is not None and actual.esta_vigente() and not forzar:
+        return actual
+
+    try:
+        nuevo = cargar_directorio()
+    except Exception as e:
+        _ultimo_error = e
+        _reintentar_en = time.time() + DIRECTORIO_REINTENTO
+        if actual is None:
+            raise
+        logger.warning(f"⚠️ No se pudo recargar el directorio, usando snapshot v{actual.version}: {e}")
+        return actual
+
+    # Índices de contacto listos antes de publicar el snapshot
+    nuevo.derivado('indice_contactos', construir_indice_contactos)
+
+    if actual is not None:
+        actual.anterior = None
+    nuevo.anterior = actual
+    _snapshot = nuevo
+    _ultimo_error = None
+    _reintentar_en = 0.0
+    return _snapshot
+
+
+def _recargar_en_segundo_plano():
+    """Lanzar una recarga sin bloquear la request (si no hay otra en curso ni un reintento pendiente)"""
+    if _snapshot_lock.locked() or time.time() < _reintentar_en:
+        return
+
+    def recargar():
+        try:
+            obtener_directorio()
+        except Exception as e:
+            logger.warning(f"⚠️ Recarga del directorio en segundo plano fallida: {e}")
+
+    threading.Thread(target=recargar, name='recarga-directorio', daemon=True).start()
+
+
+def info_directorio() -> dict:
+    """Resumen del snapshot en memoria para endpoints de monitoreo"""
+    actual = _snapshot
+    if actual is None:
+        return {'cargado': False}
+    return {
+        'cargado': True,
+        'version': actual.version,
+        'total_personas': len(actual.personas),
+        'personas_activas': len(actual.personas_activas),
+        'cargado_en': datetime.fromtimestamp(actual.cargado_en).isoformat(),
+        'vigente': actual.esta_vigente(),
+        'derivados': sorted(actual._derivados.keys()),
+        'filtro_correos_en': (
+            datetime.fromtimestamp(_filtro_correos[1]).isoformat() if _filtro_correos else None
+        ),
+    }
+
+
+# ========== FILTROS DE PERTENENCIA (CACHE NEGATIVO) ==========
+
+def _construir_filtro_correos(snapshot):
+    correos = {normalizar_correo(p.get('mail')) for p in snapshot.personas if p.get('mail')}
+    return FiltroBloom.desde_valores(correos, TASA_FALSOS_POSITIVOS)
+
+
+def snapshot_sin_bloquear():
+    """Snapshot en memoria (aunque esté vencido) sin cargar LDAP en la request
+
+    Si falta o venció se pide una recarga en segundo plano; mientras tanto
+    se responde con lo que haya (None si aún no hay ninguno).
+    """
+    actual = _snapshot
+    if actual is None or not actual.esta_vigente():
+        _recargar_en_segundo_plano()
+    return actual
+
+
+def iterar_correos():
+    """Correos del directorio (solo ese atributo) para refrescar el filtro sin la carga completa"""
+    with get_ldap_connection() as conn:
+        resultados = conn.extend.standard.paged_search(
+            search_base=settings.LDAP_CONFIG['BASE_DN'],
+            search_filter=FILTRO_DIRECTORIO,
+            attributes=['mail'],
+            paged_size=1000,
+            generator=True
+        )
+
+        for resultado in resultados:
+            if resultado.get('type') != 'searchResEntry':
+                continue
+            correo = _valor_simple(resultado.get('attributes', {}).get('mail'))
+            if correo:
+                yield normalizar_correo(correo)
+
+
+# Filtro de correos refrescado aparte del snapshot: (filtro, construido_en)
+_filtro_correos = None
+_filtro_lock = threading.Lock()
+_filtro_reintentar_en = 0.0
+
+
+def refrescar_filtro_correos():
+    """Reconstruir el filtro de correos leyendo solo `mail` desde LDAP"""
+    global _filtro_correos
+    inicio = time.time()
+    correos = set(iterar_correos())
+    _filtro_correos = (FiltroBloom.desde_valores(correos, TASA_FALSOS_POSITIVOS), inicio)
+    logger.debug(f"📧 Filtro de correos refrescado: {len(correos)} correos en {time.time() - inicio:.2f}s")
+    return _filtro_correos
+
+
+def _refrescar_filtro_en_segundo_plano():
+    """Lanzar un refresco del filtro sin bloquear la request (uno a la vez, con espera tras fallar)"""
+    if _filtro_lock.locked() or time.time() < _filtro_reintentar_en:
+        return
+
+    def refrescar():
+        global _filtro_reintentar_en
+        if not _filtro_lock.acquire(blocking=False):
+            return
+        try:
+            refrescar_filtro_correos()
+        except Exception as e:
+            _filtro_reintentar_en = time.time() + DIRECTORIO_REINTENTO
+            logger.warning(f"⚠️ No se pudo refrescar el filtro de correos: {e}")
+        finally:
+            _filtro_lock.release()
+
+    threading.Thread(target=refrescar, name='filtro-correos', daemon=True).start()
+
+
+def correo_puede_existir(correo) -> bool:
+    """False solo si el correo definitivamente no estaba en el directorio hace poco
+
+    El "no" del filtro solo vale durante DIRECTORIO_NEGATIVO_TTL desde que
+    se construyó, igual que el cache de no encontrados, para que un ingreso
+    nuevo no reciba 404 por más de ese lapso. Recién cargado el snapshot se
+    usa su filtro; después, uno refrescado en segundo plano con una lectura
+    liviana de los correos cada DIRECTORIO_NEGATIVO_TTL. Mientras no haya
+    filtro reciente, o sin directorio, se responde True y decide LDAP.
+    """
+    snapshot = snapshot_sin_bloquear()
+    if snapshot is None:
+        return True
+
+    ahora = time.time()
+    if ahora - snapshot.cargado_en <= DIRECTORIO_NEGATIVO_TTL:
+        filtro = snapshot.derivado('filtro_correos', _construir_filtro_correos)
+    else:
+        refrescado = _filtro_correos
+        if refrescado is None or ahora - refrescado[1] > DIRECTORIO_NEGATIVO_TTL:
+            # Con el snapshot vencido ya viene una recarga completa que trae su filtro
+            if snapshot.esta_vigente():
+                _refrescar_filtro_en_segundo_plano()
+            return True
+        filtro = refrescado[0]
+    return normalizar_correo(correo) in filtro
+
+
+# ========== ÍNDICES POR CORREO Y POR MANAGER ==========
+
+def _construir_personas_por_correo(snapshot):
+    personas = {}
+    for persona in snapshot.personas:
+        correo = normalizar_correo(persona.get('mail'))
+        if correo:
+            personas.setdefault(correo, persona)
+    return personas
+
+
+def _construir_reportes_directos(snapshot):
+    """DN del manager (en minúsculas) -> personas que le reportan, en orden del directorio"""
+    reportes = {}
+    for persona in snapshot.personas:
+        manager = persona.get('manager')
+        if manager:
+            reportes.setdefault(str(manager).lower(), []).append(persona)
+    return reportes
+
+
+def persona_por_correo(snapshot, correo):
+    """Persona del snapshot con ese correo (None si no está)"""
+    return snapshot.derivado('personas_por_correo', _construir_personas_por_correo).get(normalizar_correo(correo))
+
+
+def reportes_directos(snapshot, dn):
+    """Personas (habilitadas o no) cuyo manager es `dn`, sin consultar LDAP"""
+    if not dn:
+        return []
+    return snapshot.derivado('reportes_directos', _construir_reportes_directos).get(str(dn).lower(), [])
+
+
+
+# ========== ÍNDICES DE CONTACTO (TELÉFONO, ANEXO Y CORREO) ==========
+
+# "x" solo cuenta como marca de anexo tras un dígito o un espacio ("2345 x12", no "Fax 12")
+_ANEXO_EXPLICITO = re.compile(r'(?:anexo|anx|ext|(?<=[\d\s])x)\.?\s*(\d+)\s*$', re.IGNORECASE)
+
+CAMPOS_CONTACTO = ('telefono', 'anexo', 'correo')
+
+
+def solo_digitos(texto) -> str:
+    return re.sub(r'\D', '', str(texto or ''))
+
+
+def anexo_telefono(telefono) -> str:
+    """Anexo de un teléfono: el indicado con "anexo"/"ext" o los últimos DIGITOS_ANEXO dígitos"""
+    telefono = str(telefono or '').strip()
+    explicito = _ANEXO_EXPLICITO.search(telefono)
+    if explicito:
+        return explicito.group(1)
+    digitos = solo_digitos(telefono)
+    return digitos[-DIGITOS_ANEXO:] if len(digitos) >= DIGITOS_ANEXO else ''
+
+
+def parte_local_correo(correo) -> str:
+    return normalizar_correo(correo).split('@', 1)[0]
+
+
+class IndiceContactos:
+    """Búsqueda exacta y por prefijo en teléfono, anexo y parte local del correo
+
+    Cada campo es un arreglo ordenado de claves normalizadas (solo dígitos
+    para teléfono y anexo, minúsculas para el correo) con la posición de
+    la persona en un arreglo paralelo. Tanto la búsqueda exacta como la
+    por prefijo son dos búsquedas binarias: O(log n + resultados).
+    """
+
+    def __init__(self, personas):
+        self.personas = [p for p in personas if p.get('activo', True)]
+        extractores = {
+            'telefono': lambda p: solo_digitos(p.get('telephoneNumber')),
+            'anexo': lambda p: anexo_telefono(p.get('telephoneNumber')),
+            'correo': lambda p: parte_local_correo(p.get('mail')),
+        }
+        self.claves = {}
+        self.posiciones = {}
+        for campo, extraer in extractores.items():
+            pares = sorted(
+                (clave, posicion) for posicion, clave in
+                ((posicion, extraer(persona)) for posicion, persona in enumerate(self.personas)) if clave
+            )
+            self.claves[campo] = [clave for clave, _ in pares]
+            self.posiciones[campo] = [posicion for _, posicion in pares]
+
+    @staticmethod
+    def normalizar(campo, valor) -> str:
+        if campo == 'correo':
+            return parte_local_correo(valor)
+        return solo_digitos(valor)
+
+    def rango(self, campo, valor, prefijo=False):
+        """(inicio, fin) de las claves del campo iguales al valor o que comienzan con él"""
+        clave = self.normalizar(campo, valor)
+        claves = self.claves[campo]
+        if not clave:
+            return 0, 0
+        inicio = bisect_left(claves, clave)
+        fin = bisect_right(claves, clave + '\uffff' if prefijo else clave, inicio)
+        return inicio, fin
+
+    def contar(self, campos, valor, prefijo=False):
+        """Personas distintas que coinciden en alguno de los campos"""
+        if len(campos) == 1:
+            inicio, fin = self.rango(campos[0], valor, prefijo)
+            return fin - inicio
+        coincidencias = set()
+        for campo in campos:
+            inicio, fin = self.rango(campo, valor, prefijo)
+            coincidencias.update(self.posiciones[campo][inicio:fin])
+        return len(coincidencias)
+
+    def buscar(self, campo, valor, prefijo=False, limite=None):
+        """(total, [(persona, clave)]) ordenados por clave"""
+        inicio, fin = self.rango(campo, valor, prefijo)
+        tope = fin if limite is None else min(fin, inicio + limite)
+        claves = self.claves[campo]
+        posiciones = self.posiciones[campo]
+        return fin - inicio, [(self.personas[posiciones[i]], claves[i]) for i in range(inicio, tope)]
+
+
+def construir_indice_contactos(snapshot):
+    return IndiceContactos(snapshot.personas)
+
+# ========== REGISTRO DE DEPARTAMENTOS ==========
+
+class EntradaDepartamento:
+    """Departamento real del directorio con todas las formas en que aparece escrito"""
+
+    __slots__ = ('id', 'clave', 'nombre', 'variantes', 'miembros')
+
+    def __init__(self, id, clave, nombre, variantes, miembros):
+        self.id = id
+        self.clave = clave
+        self.nombre = nombre
+        self.variantes = variantes
+        self.miembros = miembros
+
+    @property
+    def miembros_activos(self):
+        return [p for p in self.miembros if p['activo']]
+
+
+_CLAVE_SLUG_EXACTO = re.compile(r'[a-z0-9]+(?: [a-z0-9]+)*')
+
+
+def id_departamento(clave) -> str:
+    """Slug de un departamento que depende solo de su clave normalizada
+
+    Si la clave es solo letras, dígitos y espacios el slug la representa sin
+    pérdida; si no (puntuación, símbolos) dos claves podrían dar el mismo
+    slug y se agrega un sufijo con el hash de la clave. Así el id no depende
+    de qué otros departamentos existan ni del orden en que se leen.
+    """
+    if _CLAVE_SLUG_EXACTO.fullmatch(clave):
+        return clave.replace(' ', '-')
+    sufijo = hashlib.sha1(clave.encode('utf-8')).hexdigest()[:8]
+    return f"{slugify(clave) or 'departamento'}-{sufijo}"
+
+
+class RegistroDepartamentos:
+    """Tabla canónica de departamentos construida una vez por snapshot
+
+    Los nombres se agrupan por `normalizar_departamento`, de modo que
+    "Producción", "produccion" y "PRODUCCION " son el mismo departamento.
+    El nombre canónico es la variante más usada (en empate, la primera que
+    aparece) y el id es un slug estable entre recargas del directorio (ver
+    `id_departamento`). `resolver` acepta cualquier variante o el id en O(1).
+    """
+
+    def __init__(self, personas):
+        agrupados = {}
+        for persona in personas:
+            bruto = persona.get('department')
+            clave = normalizar_departamento(bruto)
+            if not clave:
+                continue
+            grupo = agrupados.setdefault(clave, {'variantes': Counter(), 'miembros': []})
+            grupo['variantes'][' '.join(str(bruto).split())] += 1
+            grupo['miembros'].append(persona)
+
+        self.departamentos = []
+        self._por_clave = {}
+        self._por_id = {}
+        for clave in sorted(agrupados):
+            grupo = agrupados[clave]
+            entrada = EntradaDepartamento(
+                id=id_departamento(clave),
+                clave=clave,
+                nombre=grupo['variantes'].most_common(1)[0][0],
+                variantes=list(grupo['variantes']),
+                miembros=grupo['miembros'],
+            )
+            self.departamentos.append(entrada)
+            self._por_clave[clave] = entrada
+            self._por_id[entrada.id] = entrada
+
+    def __len__(self):
+        return len(self.departamentos)
+
+    def resolver(self, nombre):
+        """Departamento correspondiente a un nombre, variante o id (None si no existe)"""
+        clave = normalizar_departamento(nombre)
+        return self._por_clave.get(clave) or self._por_id.get(clave)
+
+
+def construir_registro_departamentos(snapshot):
+    return RegistroDepartamentos(snapshot.personas)
+
@@ -0,0 +1,156 @@
+# ejecutor.py
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Procesos del pool de cálculo (0 = todo se ejecuta en el hilo de la request)
+EJECUTOR_PROCESOS = getattr(settings, 'EJECUTOR_PROCESOS', 2)
+
+# Segundos de espera de un resultado del pool antes de registrarlo como lento
+# (se sigue esperando el mismo cálculo: repetirlo en línea duplicaría el trabajo)
+EJECUTOR_TIMEOUT = getattr(settings, 'EJECUTOR_TIMEOUT', 30)
+
+_pool = None
+_pool_lock = threading.Lock()
+_en_proceso_hijo = False
+
+_estadisticas = {}
+_estadisticas_lock = threading.Lock()
+
+
+def _inicializar_proceso():
+    """Preparar Django en el proceso hijo
+
+    Con spawn hay que inicializar Django; con fork el hijo hereda las
+    conexiones abiertas del padre (base de datos y cache), que no pueden
+    compartirse entre procesos: se cierran para que el hijo abra las suyas.
+    """
+    global _en_proceso_hijo
+    _en_proceso_hijo = True
+
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+    from django.db import connections
+    connections.close_all()
+
+
+def _ejecutar_en_proceso(funcion, args):
+    inicio = time.time()
+    resultado = funcion(*args)
+    return resultado, inicio, time.time()
+
+
+def _obtener_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=EJECUTOR_PROCESOS,
+                    initializer=_inicializar_proceso
+                )
+                logger.info(f"⚙️ Pool de cálculo iniciado con {EJECUTOR_PROCESOS} procesos")
+    return _pool
+
+
+def _descartar_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _registrar(nombre, modo, espera=0.0, calculo=0.0):
+    with _estadisticas_lock:
+        stats = _estadisticas.setdefault(nombre, {
+            'pool': 0, 'inline': 0, 'timeouts': 0, 'errores_pool': 0,
+            'espera_total': 0.0, 'espera_max': 0.0,
+            'calculo_total': 0.0, 'calculo_max': 0.0,
+        })
+        stats[modo] += 1
+        if modo in ('pool', 'inline'):
+            stats['espera_total'] += espera
+            stats['espera_max'] = max(stats['espera_max'], espera)
+            stats['calculo_total'] += calculo
+            stats['calculo_max'] = max(stats['calculo_max'], calculo)
+
+
+def _ejecutar_inline(nombre, funcion, args):
+    inicio = time.time()
+    resultado = funcion(*args)
+    _registrar(nombre, 'inline', calculo=time.time() - inicio)
+    return resultado
+
+
+def ejecutar_calculo(nombre, funcion, *args, timeout=None):
+    """Ejecutar un cálculo puro en el pool de procesos y devolver su resultado
+
+    `funcion` debe ser una función de módulo y sus argumentos y resultado
+    deben poder serializarse con pickle. Si el pool está deshabilitado o
+    falla, el cálculo se hace en el proceso actual, de modo que el llamador
+    siempre obtiene un resultado. Si no responde dentro de `timeout`
+    segundos se registra y se sigue esperando el mismo cálculo: cancelar
+    no detiene una tarea que ya está corriendo.
+    """
+    if EJECUTOR_PROCESOS <= 0 or _en_proceso_hijo:
+        return _ejecutar_inline(nombre, funcion, args)
+
+    timeout = EJECUTOR_TIMEOUT if timeout is None else timeout
+    pool = _obtener_pool()
+    enviado = time.time()
+
+    try:
+        futuro = pool.submit(_ejecutar_en_proceso, funcion, args)
+        try:
+            resultado, inicio, fin = futuro.result(timeout=timeout)
+        except FuturesTimeout:
+            _registrar(nombre, 'timeouts')
+            logger.warning(f"⏱️ Cálculo '{nombre}' lleva más de {timeout}s en el pool, se sigue esperando")
+            resultado, inicio, fin = futuro.result()
+    except BrokenProcessPool as e:
+        _descartar_pool(pool)
+        _registrar(nombre, 'errores_pool')
+        logger.error(f"💥 Pool de cálculo caído durante '{nombre}', se ejecuta en línea: {e}")
+        return _ejecutar_inline(nombre, funcion, args)
+    except Exception as e:
+        # Errores de serialización u otros fallos del propio cálculo
+        _registrar(nombre, 'errores_pool')
+        logger.warning(f"⚠️ Cálculo '{nombre}' falló en el pool, se ejecuta en línea: {e}")
+        return _ejecutar_inline(nombre, funcion, args)
+
+    _registrar(nombre, 'pool', espera=max(inicio - enviado, 0.0), calculo=fin - inicio)
+    logger.debug(f"⚙️ Cálculo '{nombre}' en pool: espera {inicio - enviado:.3f}s, cálculo {fin - inicio:.3f}s")
+    return resultado
+
+
+def estadisticas_ejecutor():
+    """Ejecuciones, esperas en cola y tiempos de cálculo por tipo (por proceso)"""
+    with _estadisticas_lock:
+        resultado = {}
+        for nombre, stats in _estadisticas.items():
+            ejecuciones = stats['pool'] + stats['inline']
+            resultado[nombre] = {
+                'pool': stats['pool'],
+                'inline': stats['inline'],
+                'timeouts': stats['timeouts'],
+                'errores_pool': stats['errores_pool'],
+                'espera_promedio': round(stats['espera_total'] / ejecuciones, 4) if ejecuciones else 0.0,
+                'espera_max': round(stats['espera_max'], 4),
+                'calculo_promedio': round(stats['calculo_total'] / ejecuciones, 4) if ejecuciones else 0.0,
+                'calculo_max': round(stats['calculo_max'], 4),
+            }
+        return {
+            'procesos': EJECUTOR_PROCESOS,
+            'pool_activo': _pool is not None,
+            'calculos': resultado,
+        }
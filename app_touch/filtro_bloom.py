@@ -0,0 +1,53 @@
+# filtro_bloom.py
+import hashlib
+import math
+
+
+class FiltroBloom:
+    """Filtro de Bloom para pertenencia aproximada
+
+    Nunca da falsos negativos: si `valor in filtro` es False, el valor
+    definitivamente no fue agregado. Los falsos positivos ocurren con una
+    tasa cercana a `tasa_falsos_positivos` para `capacidad` elementos.
+    """
+
+    def __init__(self, capacidad: int, tasa_falsos_positivos: float = 0.01):
+        capacidad = max(int(capacidad), 1)
+        num_bits = -capacidad * math.log(tasa_falsos_positivos) / (math.log(2) ** 2)
+        self.num_bits = max(int(math.ceil(num_bits)), 8)
+        self.num_hashes = max(int(round(self.num_bits / capacidad * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.total = 0
+
+    @classmethod
+    def desde_valores(cls, valores, tasa_falsos_positivos: float = 0.01):
+        """Construir un filtro dimensionado para los valores entregados"""
+        valores = list(valores)
+        filtro = cls(len(valores), tasa_falsos_positivos)
+        for valor in valores:
+            filtro.agregar(valor)
+        return filtro
+
+    def _posiciones(self, valor: str):
+        # Doble hashing mejorado (Dillinger-Manolios) sobre un único digest
+        digest = hashlib.blake2b(valor.encode('utf-8'), digest_size=16).digest()
+        h = int.from_bytes(digest[:8], 'little')
+        delta = int.from_bytes(digest[8:], 'little')
+        for i in range(self.num_hashes):
+            yield h % self.num_bits
+            h += delta
+            delta += i + 1
+
+    def agregar(self, valor: str):
+        for posicion in self._posiciones(valor):
+            self.bits[posicion >> 3] |= 1 << (posicion & 7)
+        self.total += 1
+
+    def __contains__(self, valor: str) -> bool:
+        return all(
+            self.bits[posicion >> 3] & (1 << (posicion & 7))
+            for posicion in self._posiciones(valor)
+        )
+
+    def __len__(self):
+        return self.total
@@ -0,0 +1,129 @@
+# grafo_organizacion.py
+from array import array
+
+from app_touch.directorio import normalizar_departamento
+
+
+class GrafoOrganizacion:
+    """Representación columnar de la relación persona -> manager
+
+    Cada persona es un entero (el mismo id que usa `IndiceAncestros`) y sus
+    datos viven en arreglos paralelos: `padre`, `profundidad` y
+    `departamento` (código entero). Los agregados se calculan con pasadas
+    lineales sobre los arreglos, procesando los nodos de mayor a menor
+    profundidad para acumular cada subárbol en su padre.
+    """
+
+    def __init__(self, personas, padre, profundidad):
+        total = len(personas)
+        self.personas = personas
+        self.padre = array('i', padre)
+        self.profundidad = array('i', profundidad)
+
+        # Departamentos codificados como enteros (-1 = sin departamento)
+        self.departamentos = []
+        codigos = {}
+        self.departamento = array('i', [-1]) * total
+        for i, persona in enumerate(personas):
+            nombre = ' '.join(str(persona.get('department') or '').split())
+            if not nombre:
+                continue
+            clave = normalizar_departamento(nombre)
+            codigo = codigos.get(clave)
+            if codigo is None:
+                codigo = codigos[clave] = len(self.departamentos)
+                self.departamentos.append(nombre)
+            self.departamento[i] = codigo
+
+        self.orden = self._ordenar_por_profundidad()
+        self.reportes_directos = array('i', [0]) * total
+        self.total_subordinados = array('i', [0]) * total
+        self.altura = array('i', [0]) * total
+        self._acumular_subarboles()
+
+    def __len__(self):
+        return len(self.personas)
+
+    def _ordenar_por_profundidad(self):
+        """Ids ordenados de mayor a menor profundidad (counting sort)"""
+        max_profundidad = max(self.profundidad, default=0)
+        por_nivel = array('i', [0]) * (max_profundidad + 2)
+        for nivel in self.profundidad:
+            por_nivel[max_profundidad - nivel + 1] += 1
+        for nivel in range(1, len(por_nivel)):
+            por_nivel[nivel] += por_nivel[nivel - 1]
+
+        orden = array('i', [0]) * len(self.profundidad)
+        for i, nivel in enumerate(self.profundidad):
+            posicion = max_profundidad - nivel
+            orden[por_nivel[posicion]] = i
+            por_nivel[posicion] += 1
+        return orden
+
+    def _acumular_subarboles(self):
+        padre = self.padre
+        tamano = array('i', [1]) * len(padre)
+        for i in self.orden:
+            p = padre[i]
+            if p == -1:
+                continue
+            tamano[p] += tamano[i]
+            self.reportes_directos[p] += 1
+            if self.altura[i] + 1 > self.altura[p]:
+                self.altura[p] = self.altura[i] + 1
+
+        for i in range(len(padre)):
+            self.total_subordinados[i] = tamano[i] - 1
+
+    def estadisticas_persona(self, i):
+        """Reportes directos, indirectos y niveles bajo una persona"""
+        directos = self.reportes_directos[i]
+        return {
+            'reportes_directos': directos,
+            'reportes_indirectos': self.total_subordinados[i] - directos,
+            'total_subordinados': self.total_subordinados[i],
+            'niveles_bajo_mando': self.altura[i],
+            'profundidad': self.profundidad[i],
+        }
+
+    def resumen_span_de_control(self):
+        """Tramo de control de toda la organización (solo personas con reportes)"""
+        jefes = [d for d in self.reportes_directos if d > 0]
+        raices = sum(1 for p in self.padre if p == -1)
+        return {
+            'total_jefes': len(jefes),
+            'promedio_reportes_directos': round(sum(jefes) / len(jefes), 2) if jefes else 0,
+            'max_reportes_directos': max(jefes, default=0),
+            'profundidad_maxima': max(self.profundidad, default=0),
+            'total_raices': raices,
+        }
+
+    def estadisticas_departamentos(self):
+        """Personas y profundidad (mín., máx., promedio) por departamento"""
+        total = len(self.departamentos)
+        personas = array('i', [0]) * total
+        suma = array('q', [0]) * total
+        minimo = array('i', [-1]) * total
+        maximo = array('i', [0]) * total
+
+        for codigo, nivel in zip(self.departamento, self.profundidad):
+            if codigo == -1:
+                continue
+            personas[codigo] += 1
+            suma[codigo] += nivel
+            if minimo[codigo] == -1 or nivel < minimo[codigo]:
+                minimo[codigo] = nivel
+            if nivel > maximo[codigo]:
+                maximo[codigo] = nivel
+
+        return [
+            {
+                'departamento': self.departamentos[codigo],
+                'personas': personas[codigo],
+                'profundidad_min': minimo[codigo],
+                'profundidad_max': maximo[codigo],
+                'profundidad_promedio': round(suma[codigo] / personas[codigo], 2),
+            }
+            for codigo in sorted(range(total), key=lambda c: self.departamentos[c].lower())
+            if personas[codigo]
+        ]
@@ -0,0 +1,583 @@
+# jerarquia.py
+import logging
+from bisect import bisect_right
+
+from app_touch.cargos import clasificar_titulo
+
+logger = logging.getLogger(__name__)
+
+
+def posiciones(personas):
+    """DN -> posición de su primera aparición en la lista (el orden de LDAP)"""
+    orden = {}
+    for posicion, persona in enumerate(personas):
+        orden.setdefault(persona.get('distinguishedName'), posicion)
+    return orden
+
+
+class MotorJerarquia:
+    """Directorio indexado para resolver el jerarca de cada departamento
+
+    Se construye con una pasada sobre las personas (índice por DN y
+    miembros por departamento, en el orden original) y resuelve todos los
+    jerarcas con una pasada por los miembros de cada departamento, sin
+    volver a recorrer la lista completa de personas.
+
+    Se mantiene la precedencia del cálculo original por departamento:
+      1. Persona del departamento con cargo jerárquico (mejor prioridad)
+      2. Manager de algún miembro que tenga cargo jerárquico
+      3. Cualquier manager de algún miembro
+      4. Primera persona del departamento sin manager
+      5. Primera persona del departamento
+    Los empates se resuelven por orden de aparición en la lista recibida
+    (el orden en que LDAP devolvió las personas), igual que el `sorted`
+    estable de la versión original.
+
+    El motor también admite cambios incrementales (`aplicar_eventos`): los
+    miembros de cada departamento se mantienen en el orden de la lista
+    nueva, de modo que el resultado es el mismo que reconstruir el motor
+    con esa lista. Los DN deben ser únicos.
+    """
+
+    def __init__(self, personas):
+        self.total_personas = len(personas)
+        self.por_dn = {}
+        self.por_departamento = {}
+        self.jerarcas = {}
+        self.reportes_de = {}
+        # Posición de cada miembro en la lista de entrada, paralela a por_departamento
+        self._claves_departamento = {}
+
+        for posicion, persona in enumerate(personas):
+            dn = persona.get('distinguishedName')
+            if dn and dn not in self.por_dn:
+                self.por_dn[dn] = persona
+                if persona.get('manager'):
+                    self.reportes_de.setdefault(persona['manager'], set()).add(dn)
+            departamento = persona.get('department')
+            self.por_departamento.setdefault(departamento, []).append(persona)
+            self._claves_departamento.setdefault(departamento, []).append(posicion)
+
+    def copiar(self):
+        """Copia independiente de los índices (las personas se comparten, no se modifican)"""
+        copia = MotorJerarquia.__new__(type(self))
+        copia.__dict__.update(self.__dict__)
+        copia.por_dn = dict(self.por_dn)
+        copia.por_departamento = {d: list(miembros) for d, miembros in self.por_departamento.items()}
+        copia.jerarcas = dict(self.jerarcas)
+        copia.reportes_de = {dn: set(reportes) for dn, reportes in self.reportes_de.items()}
+        copia._claves_departamento = {d: list(claves) for d, claves in self._claves_departamento.items()}
+        return copia
+
+    def clasificar(self, persona):
+        """(es_cargo_jerarquico, prioridad) según el clasificador de cargos"""
+        return clasificar_titulo(persona.get('title'))
+
+    def manager_de(self, persona):
+        """Persona que figura como manager (None si no está en el directorio)"""
+        manager_dn = persona.get('manager')
+        if not manager_dn:
+            return None
+        return self.por_dn.get(manager_dn)
+
+    def resolver_miembros(self, miembros):
+        """Jerarca de un conjunto de miembros de departamento"""
+        if not miembros:
+            return None
+
+        mejor_interno = None
+        mejor_manager_jerarquico = None
+        mejor_manager = None
+        primero_sin_manager = None
+
+        for persona in miembros:
+            es_valido, prioridad = self.clasificar(persona)
+            if es_valido and (mejor_interno is None or prioridad < mejor_interno[0]):
+                mejor_interno = (prioridad, persona)
+
+            if not persona.get('manager'):
+                if primero_sin_manager is None:
+                    primero_sin_manager = persona
+                continue
+
+            manager = self.manager_de(persona)
+            if manager is None:
+                continue
+
+            manager_valido, prioridad_manager = self.clasificar(manager)
+            if mejor_manager is None or prioridad_manager < mejor_manager[0]:
+                mejor_manager = (prioridad_manager, manager)
+            if manager_valido and (mejor_manager_jerarquico is None or prioridad_manager < mejor_manager_jerarquico[0]):
+                mejor_manager_jerarquico = (prioridad_manager, manager)
+
+        if mejor_interno:
+            return mejor_interno[1]
+        if mejor_manager_jerarquico:
+            return mejor_manager_jerarquico[1]
+        if mejor_manager:
+            return mejor_manager[1]
+        if primero_sin_manager:
+            return primero_sin_manager
+        return miembros[0]
+
+    def resolver_jerarcas(self):
+        """Jerarca de todos los departamentos: {departamento: persona}"""
+        self.jerarcas = {
+            departamento: self.resolver_miembros(miembros)
+            for departamento, miembros in self.por_departamento.items()
+        }
+        logger.info(f"🧭 Jerarcas resueltos para {len(self.jerarcas)} departamentos ({self.total_personas} personas)")
+        return self.jerarcas
+
+    def departamentos_ordenados(self):
+        """Departamentos en el orden de su primer miembro (igual que una reconstrucción)"""
+        return sorted(self.por_departamento, key=lambda d: (self._claves_departamento[d][0], str(d)))
+
+    # ---------- Cambios incrementales ----------
+
+    def _quitar(self, dn):
+        persona = self.por_dn.pop(dn)
+        departamento = persona.get('department')
+
+        claves = self._claves_departamento[departamento]
+        posicion = next(i for i, miembro in enumerate(self.por_departamento[departamento]) if miembro is persona)
+        del claves[posicion]
+        del self.por_departamento[departamento][posicion]
+        if not claves:
+            del self._claves_departamento[departamento]
+            del self.por_departamento[departamento]
+
+        manager_dn = persona.get('manager')
+        if manager_dn:
+            reportes = self.reportes_de.get(manager_dn)
+            reportes.discard(dn)
+            if not reportes:
+                del self.reportes_de[manager_dn]
+
+        self.total_personas -= 1
+        return persona
+
+    def _agregar(self, dn, persona, clave):
+        departamento = persona.get('department')
+        claves = self._claves_departamento.setdefault(departamento, [])
+        miembros = self.por_departamento.setdefault(departamento, [])
+        posicion = bisect_right(claves, clave)
+        claves.insert(posicion, clave)
+        miembros.insert(posicion, persona)
+
+        self.por_dn[dn] = persona
+        if persona.get('manager'):
+            self.reportes_de.setdefault(persona['manager'], set()).add(dn)
+        self.total_personas += 1
+
+    def _reordenar(self, orden):
+        """Pasar las claves a las posiciones de la lista nueva
+
+        Devuelve los departamentos cuyos miembros cambiaron de orden
+        relativo: sus empates pueden resolverse distinto.
+        """
+        reordenados = set()
+        for departamento, miembros in self.por_departamento.items():
+            claves = [orden[miembro.get('distinguishedName')] for miembro in miembros]
+            if any(a > b for a, b in zip(claves, claves[1:])):
+                pares = sorted(zip(claves, range(len(miembros))))
+                self.por_departamento[departamento] = [miembros[i] for _, i in pares]
+                claves = [clave for clave, _ in pares]
+                reordenados.add(departamento)
+            self._claves_departamento[departamento] = claves
+        return reordenados
+
+    def aplicar_eventos(self, eventos, personas):
+        """Aplicar cambios y recalcular solo los jerarcas afectados
+
+        `eventos` son los de diferencias_directorio: dicts con 'tipo' (ver
+        TIPOS_EVENTO), 'dn' y 'persona' (datos nuevos; None en una baja).
+        `personas` es la lista nueva completa; su orden define los empates.
+        Devuelve el conjunto de departamentos cuyo jerarca o miembros pueden
+        haber cambiado (incluye los departamentos que quedaron vacíos).
+        """
+        orden = posiciones(personas)
+        afectados = set()
+        for evento in eventos:
+            if evento['dn'] in self.por_dn:
+                afectados.add(self._quitar(evento['dn']).get('department'))
+
+        afectados |= self._reordenar(orden)
+
+        for evento in eventos:
+            nueva = evento.get('persona')
+            if nueva is not None:
+                self._agregar(evento['dn'], nueva, orden[evento['dn']])
+                afectados.add(nueva.get('department'))
+
+        # El jerarca de un departamento depende de los managers de sus miembros
+        for evento in eventos:
+            for dn_reporte in self.reportes_de.get(evento['dn'], ()):
+                afectados.add(self.por_dn[dn_reporte].get('department'))
+
+        for departamento in afectados:
+            miembros = self.por_departamento.get(departamento)
+            if miembros:
+                self.jerarcas[departamento] = self.resolver_miembros(miembros)
+            else:
+                self.jerarcas.pop(departamento, None)
+
+        logger.info(f"🧭 {len(eventos)} cambios aplicados, {len(afectados)} departamentos recalculados")
+        return afectados
+
+
+# Tipos de cambio entre dos lecturas del directorio
+ALTA = 'alta'
+BAJA = 'baja'
+TRASLADO = 'traslado'
+CAMBIO_MANAGER = 'cambio_manager'
+ACTUALIZACION = 'actualizacion'
+TIPOS_EVENTO = (ALTA, BAJA, TRASLADO, CAMBIO_MANAGER, ACTUALIZACION)
+
+
+def diferencias_directorio(anteriores, nuevas):
+    """Eventos que transforman la lista de personas `anteriores` en `nuevas`
+
+    Las personas se identifican por distinguishedName. Una baja incluye
+    cuentas deshabilitadas (que ya no aparecen entre las personas activas).
+    """
+    previas = {}
+    for persona in anteriores:
+        previas.setdefault(persona.get('distinguishedName'), persona)
+
+    eventos = []
+    vistos = set()
+    for persona in nuevas:
+        dn = persona.get('distinguishedName')
+        if dn in vistos:
+            continue
+        vistos.add(dn)
+
+        previa = previas.get(dn)
+        if previa is None:
+            eventos.append({'tipo': ALTA, 'dn': dn, 'persona': persona})
+        elif previa != persona:
+            if previa.get('department') != persona.get('department'):
+                tipo = TRASLADO
+            elif previa.get('manager') != persona.get('manager'):
+                tipo = CAMBIO_MANAGER
+            else:
+                tipo = ACTUALIZACION
+            eventos.append({'tipo': tipo, 'dn': dn, 'persona': persona})
+
+    for dn in previas:
+        if dn not in vistos:
+            eventos.append({'tipo': BAJA, 'dn': dn, 'persona': None})
+
+    return eventos
+
+
+# ========== ÁRBOL DE DEPARTAMENTOS ==========
+
+def componentes_fuertemente_conexas(nodos, hijos):
+    """Tarjan iterativo: lista de componentes (listas de nodos) del grafo `hijos`"""
+    indice = {}
+    bajo = {}
+    en_pila = set()
+    pila = []
+    componentes = []
+    contador = 0
+
+    for inicio in nodos:
+        if inicio in indice:
+            continue
+
+        indice[inicio] = bajo[inicio] = contador
+        contador += 1
+        pila.append(inicio)
+        en_pila.add(inicio)
+        trabajo = [(inicio, iter(hijos.get(inicio, ())))]
+
+        while trabajo:
+            nodo, iterador = trabajo[-1]
+            avanzo = False
+            for hijo in iterador:
+                if hijo not in indice:
+                    indice[hijo] = bajo[hijo] = contador
+                    contador += 1
+                    pila.append(hijo)
+                    en_pila.add(hijo)
+                    trabajo.append((hijo, iter(hijos.get(hijo, ()))))
+                    avanzo = True
+                    break
+                if hijo in en_pila:
+                    bajo[nodo] = min(bajo[nodo], indice[hijo])
+            if avanzo:
+                continue
+
+            trabajo.pop()
+            if trabajo:
+                padre = trabajo[-1][0]
+                bajo[padre] = min(bajo[padre], bajo[nodo])
+
+            if bajo[nodo] == indice[nodo]:
+                componente = []
+                while True:
+                    miembro = pila.pop()
+                    en_pila.discard(miembro)
+                    componente.append(miembro)
+                    if miembro == nodo:
+                        break
+                componentes.append(componente)
+
+    return componentes
+
+
+def construir_arbol_departamentos(departamentos, padre_de):
+    """Armar el árbol anidado de departamentos sin recursión, en tiempo lineal
+
+    `departamentos` es la lista de nodos (dicts con 'nombre') y `padre_de`
+    mapea nombre -> nombre del departamento padre. Los ciclos de
+    supervisión se detectan con Tarjan; en cada ciclo el primer
+    departamento (según el orden de entrada) pasa a ser raíz, de modo que
+    ningún departamento queda fuera del árbol.
+
+    Devuelve (arbol, ciclos), donde cada ciclo es
+    {'departamentos': [...], 'raiz_asignada': nombre}.
+    """
+    orden = {depto['nombre']: posicion for posicion, depto in enumerate(departamentos)}
+    padre_de = {
+        hijo: padre for hijo, padre in padre_de.items()
+        if hijo in orden and padre in orden and hijo != padre
+    }
+
+    hijos = {}
+    for depto in departamentos:
+        padre = padre_de.get(depto['nombre'])
+        if padre is not None:
+            hijos.setdefault(padre, []).append(depto['nombre'])
+
+    ciclos = []
+    for componente in componentes_fuertemente_conexas(list(orden), hijos):
+        if len(componente) < 2:
+            continue
+        componente.sort(key=orden.get)
+        raiz = componente[0]
+        ciclos.append({'departamentos': componente, 'raiz_asignada': raiz})
+        hijos[padre_de.pop(raiz)].remove(raiz)
+
+    arbol = []
+    pendientes = []
+    for depto in departamentos:
+        if depto['nombre'] in padre_de:
+            continue
+        nodo = dict(depto)
+        nodo['subordinados'] = []
+        arbol.append(nodo)
+        pendientes.append(nodo)
+
+    mapa_departamentos = {depto['nombre']: depto for depto in departamentos}
+    while pendientes:
+        nodo = pendientes.pop()
+        for nombre_hijo in hijos.get(nodo['nombre'], ()):
+            hijo = dict(mapa_departamentos[nombre_hijo])
+            hijo['subordinados'] = []
+            nodo['subordinados'].append(hijo)
+            pendientes.append(hijo)
+
+    return arbol, ciclos
+
+
+class IndiceArbol:
+    """Índice plano del árbol de departamentos para servir subárboles
+
+    Guarda cada nodo sin sus subordinados, la lista de hijos por nombre y
+    los conteos de descendientes, de modo que cada expansión del árbol se
+    arma en tiempo proporcional al tamaño de la respuesta.
+    """
+
+    def __init__(self, estructura):
+        self.estructura = estructura
+        self.raices = [nodo['nombre'] for nodo in estructura]
+        self.nodos = {}
+        self.hijos = {}
+        self.nivel = {}
+        self.descendientes = {}
+        self._por_clave = {}
+
+        orden = []
+        pendientes = [(nodo, 0) for nodo in reversed(estructura)]
+        while pendientes:
+            nodo, nivel = pendientes.pop()
+            nombre = nodo['nombre']
+            subordinados = nodo.get('subordinados') or []
+            self.nodos[nombre] = {k: v for k, v in nodo.items() if k != 'subordinados'}
+            self.hijos[nombre] = [hijo['nombre'] for hijo in subordinados]
+            self.nivel[nombre] = nivel
+            self._por_clave.setdefault(' '.join(nombre.split()).lower(), nombre)
+            orden.append(nombre)
+            pendientes.extend((hijo, nivel + 1) for hijo in reversed(subordinados))
+
+        for nombre in reversed(orden):
+            self.descendientes[nombre] = sum(
+                1 + self.descendientes[hijo] for hijo in self.hijos[nombre]
+            )
+
+    def resolver(self, nombre):
+        """Nombre exacto del nodo (tolera mayúsculas y espacios), o None"""
+        if nombre in self.nodos:
+            return nombre
+        return self._por_clave.get(' '.join(str(nombre).split()).lower())
+
+    def _nodo(self, nombre, conteos, estadisticas):
+        nodo = dict(self.nodos[nombre])
+        if not estadisticas:
+            nodo.pop('estadisticas', None)
+        if conteos:
+            nodo['total_subordinados'] = len(self.hijos[nombre])
+            nodo['total_descendientes'] = self.descendientes[nombre]
+            nodo['tiene_subordinados'] = bool(self.hijos[nombre])
+        nodo['subordinados'] = []
+        return nodo
+
+    def subarbol(self, raiz=None, profundidad=1, conteos=True, estadisticas=False):
+        """Nodos hasta `profundidad` niveles bajo `raiz` (o bajo las raíces)
+
+        Con raiz=None se devuelven las raíces del árbol; con una raíz se
+        devuelve una lista con ese único nodo. Los nodos del último nivel
+        llegan con 'subordinados' vacío y, si `conteos`, con la cantidad de
+        hijos para que el cliente sepa si puede expandirlos.
+        """
+        nombres = self.raices if raiz is None else [raiz]
+        resultado = [self._nodo(nombre, conteos, estadisticas) for nombre in nombres]
+
+        pendientes = [(nodo, 1) for nodo in resultado]
+        while pendientes:
+            nodo, nivel = pendientes.pop()
+            if nivel >= profundidad:
+                continue
+            for hijo in self.hijos[nodo['nombre']]:
+                nodo_hijo = self._nodo(hijo, conteos, estadisticas)
+                nodo['subordinados'].append(nodo_hijo)
+                pendientes.append((nodo_hijo, nivel + 1))
+
+        return resultado
+
+
+# ========== CADENA DE MANDO ==========
+
+class IndiceAncestros:
+    """Tablas de ancestros (binary lifting) sobre la relación persona -> manager
+
+    Cada persona recibe un id entero; `padre[i]` es el id de su manager
+    (-1 si no tiene uno dentro del directorio) y `saltos[k][i]` su ancestro
+    2^k niveles arriba. Con eso el jefe común más cercano de dos personas
+    se obtiene en O(log n). Los ciclos de manager se cortan en el primer
+    miembro del ciclo que se encuentra, que pasa a ser raíz.
+    """
+
+    def __init__(self, personas):
+        self.personas = []
+        self.id_por_dn = {}
+        self.id_por_correo = {}
+
+        for persona in personas:
+            dn = persona.get('distinguishedName')
+            if not dn or dn in self.id_por_dn:
+                continue
+            self.id_por_dn[dn] = len(self.personas)
+            correo = str(persona.get('mail') or '').strip().lower()
+            if correo:
+                self.id_por_correo.setdefault(correo, len(self.personas))
+            self.personas.append(persona)
+
+        total = len(self.personas)
+        self.padre = [
+            self.id_por_dn.get(persona.get('manager'), -1) if persona.get('manager') else -1
+            for persona in self.personas
+        ]
+        self.ciclos_cortados = self._cortar_ciclos()
+        self.profundidad = self._calcular_profundidades()
+
+        niveles = max(max(self.profundidad, default=0).bit_length(), 1)
+        self.saltos = [self.padre[:]]
+        for k in range(1, niveles):
+            anterior = self.saltos[k - 1]
+            self.saltos.append([anterior[anterior[i]] if anterior[i] != -1 else -1 for i in range(total)])
+
+    def _cortar_ciclos(self):
+        """Cortar ciclos de manager recorriendo cada cadena una sola vez"""
+        estado = [0] * len(self.personas)  # 0 = sin visitar, 1 = en recorrido, 2 = resuelto
+        cortados = []
+
+        for inicio in range(len(self.personas)):
+            camino = []
+            actual = inicio
+            while actual != -1 and estado[actual] == 0:
+                estado[actual] = 1
+                camino.append(actual)
+                actual = self.padre[actual]
+
+            if actual != -1 and estado[actual] == 1:
+                # `actual` cierra un ciclo: deja de tener manager
+                cortados.append(actual)
+                self.padre[actual] = -1
+
+            for nodo in camino:
+                estado[nodo] = 2
+
+        return cortados
+
+    def _calcular_profundidades(self):
+        hijos = [[] for _ in self.personas]
+        raices = []
+        for i, padre in enumerate(self.padre):
+            if padre == -1:
+                raices.append(i)
+            else:
+                hijos[padre].append(i)
+
+        profundidad = [0] * len(self.personas)
+        pendientes = list(raices)
+        while pendientes:
+            nodo = pendientes.pop()
+            for hijo in hijos[nodo]:
+                profundidad[hijo] = profundidad[nodo] + 1
+                pendientes.append(hijo)
+        return profundidad
+
+    def buscar(self, correo):
+        """Id de la persona con ese correo, o None"""
+        return self.id_por_correo.get(str(correo or '').strip().lower())
+
+    def cadena_de_mando(self, persona_id):
+        """Ids de los managers desde el jefe directo hasta la raíz"""
+        cadena = []
+        actual = self.padre[persona_id]
+        while actual != -1:
+            cadena.append(actual)
+            actual = self.padre[actual]
+        return cadena
+
+    def ancestro(self, persona_id, niveles):
+        """Ancestro `niveles` arriba (-1 si no existe)"""
+        k = 0
+        while niveles and persona_id != -1:
+            if niveles & 1:
+                if k >= len(self.saltos):
+                    return -1
+                persona_id = self.saltos[k][persona_id]
+            niveles >>= 1
+            k += 1
+        return persona_id
+
+    def jefe_comun(self, a, b):
+        """Ancestro común más cercano de a y b (-1 si están en árboles distintos)"""
+        if self.profundidad[a] < self.profundidad[b]:
+            a, b = b, a
+        a = self.ancestro(a, self.profundidad[a] - self.profundidad[b])
+        if a == b:
+            return a
+
+        for k in range(len(self.saltos) - 1, -1, -1):
+            salto_a = self.saltos[k][a]
+            salto_b = self.saltos[k][b]
+            if salto_a != salto_b:
+                a, b = salto_a, salto_b
+
+        return self.padre[a] if self.padre[a] == self.padre[b] else -1
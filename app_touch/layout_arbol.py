@@ -0,0 +1,247 @@
+# layout_arbol.py
+
+# Separación horizontal mínima entre nodos vecinos y vertical entre niveles (unidades de layout)
+SEPARACION_NODOS = 1.0
+SEPARACION_NIVELES = 1.0
+
+
+class _Nodo:
+    __slots__ = (
+        'nombre', 'padre', 'hijos', 'numero', 'x', 'mod', 'shift', 'change',
+        'thread', 'ancestor', 'y', 'punto_medio', 'ext_x_min', 'ext_x_max', 'ext_y_max'
+    )
+
+    def __init__(self, nombre, padre, numero):
+        self.nombre = nombre
+        self.padre = padre
+        self.hijos = []
+        self.numero = numero  # posición entre sus hermanos (1..n)
+        self.x = 0.0
+        self.mod = 0.0
+        self.shift = 0.0
+        self.change = 0.0
+        self.thread = None
+        self.ancestor = self
+        self.y = 0
+        self.punto_medio = 0.0
+
+    def siguiente_izquierda(self):
+        return self.hijos[0] if self.hijos else self.thread
+
+    def siguiente_derecha(self):
+        return self.hijos[-1] if self.hijos else self.thread
+
+    def hermano_izquierdo(self):
+        if self.padre is None or self.numero == 1:
+            return None
+        return self.padre.hijos[self.numero - 2]
+
+    def primer_hermano(self):
+        if self.padre is None or self.numero == 1:
+            return None
+        return self.padre.hijos[0]
+
+
+class LayoutArbol:
+    """Layout "tidy tree" (Reingold-Tilford con las mejoras de Walker/Buchheim)
+
+    Calcula en tiempo lineal una posición (x, y) para cada departamento:
+    los padres quedan centrados sobre sus hijos, los subárboles iguales se
+    dibujan iguales y ningún par de nodos del mismo nivel queda a menos de
+    `separacion`. Los recorridos son iterativos, así que no depende de la
+    profundidad del árbol. Un bosque se dispone bajo una raíz virtual que
+    no aparece en el resultado.
+
+    Cada nodo incluye la extensión de su subárbol (x mínima y máxima, y
+    máxima), útil para recortar por ventana sin recorrer ramas invisibles.
+    """
+
+    def __init__(self, raices, hijos, separacion=SEPARACION_NODOS, separacion_niveles=SEPARACION_NIVELES):
+        self.separacion = separacion
+        self.separacion_niveles = separacion_niveles
+
+        self._raiz = _Nodo(None, None, 1)
+        self._orden = []  # preorden, empezando por la raíz virtual
+        pendientes = [(self._raiz, raices)]
+        while pendientes:
+            nodo, nombres = pendientes.pop()
+            self._orden.append(nodo)
+            for numero, nombre in enumerate(nombres, start=1):
+                nodo.hijos.append(_Nodo(nombre, nodo, numero))
+            for hijo in reversed(nodo.hijos):
+                pendientes.append((hijo, hijos.get(hijo.nombre, ())))
+
+        self._primer_recorrido()
+        self._segundo_recorrido()
+        self._calcular_extensiones()
+
+        self.nodos = {}
+        for nodo in self._orden[1:]:
+            self.nodos[nodo.nombre] = {
+                'nombre': nodo.nombre,
+                'padre': nodo.padre.nombre,
+                'x': round(nodo.x, 4),
+                'y': round(nodo.y * self.separacion_niveles, 4),
+                'extension': {
+                    'x_min': round(nodo.ext_x_min, 4),
+                    'x_max': round(nodo.ext_x_max, 4),
+                    'y_max': round(nodo.ext_y_max * self.separacion_niveles, 4),
+                },
+            }
+        self.raices = list(raices)
+        self.hijos = {nombre: list(hijos.get(nombre, ())) for nombre in self.nodos}
+
+        visibles = self._orden[1:]
+        self.ancho = round(max((n.x for n in visibles), default=0.0), 4)
+        self.alto = round(max((n.y for n in visibles), default=0) * self.separacion_niveles, 4)
+
+    # ---------- Algoritmo de Buchheim, Jünger y Leipert ----------
+
+    def _postorden(self):
+        """Hijos de izquierda a derecha y luego el padre"""
+        orden = []
+        pendientes = [self._raiz]
+        while pendientes:
+            v = pendientes.pop()
+            orden.append(v)
+            pendientes.extend(v.hijos)
+        orden.reverse()
+        return orden
+
+    def _primer_recorrido(self):
+        for v in self._postorden():
+            if not v.hijos:
+                continue
+
+            # Cada hijo se ubica junto a su hermano izquierdo ya desplazado
+            ancestro_por_defecto = v.hijos[0]
+            for w in v.hijos:
+                self._posicion_preliminar(w)
+                ancestro_por_defecto = self._repartir(w, ancestro_por_defecto)
+            self._ejecutar_desplazamientos(v)
+            v.punto_medio = (v.hijos[0].x + v.hijos[-1].x) / 2
+
+        self._posicion_preliminar(self._raiz)
+
+    def _posicion_preliminar(self, v):
+        hermano = v.hermano_izquierdo()
+        if not v.hijos:
+            v.x = hermano.x + self.separacion if hermano else 0.0
+        elif hermano:
+            v.x = hermano.x + self.separacion
+            v.mod = v.x - v.punto_medio
+        else:
+            v.x = v.punto_medio
+
+    def _repartir(self, v, ancestro_por_defecto):
+        w = v.hermano_izquierdo()
+        if w is None:
+            return ancestro_por_defecto
+
+        vir = vor = v
+        vil = w
+        vol = v.primer_hermano()
+        sir = sor = v.mod
+        sil = vil.mod
+        sol = vol.mod
+
+        while vil.siguiente_derecha() and vir.siguiente_izquierda():
+            vil = vil.siguiente_derecha()
+            vir = vir.siguiente_izquierda()
+            vol = vol.siguiente_izquierda()
+            vor = vor.siguiente_derecha()
+            vor.ancestor = v
+            desplazamiento = (vil.x + sil) - (vir.x + sir) + self.separacion
+            if desplazamiento > 0:
+                self._mover_subarbol(self._ancestro(vil, v, ancestro_por_defecto), v, desplazamiento)
+                sir += desplazamiento
+                sor += desplazamiento
+            sil += vil.mod
+            sir += vir.mod
+            sol += vol.mod
+            sor += vor.mod
+
+        if vil.siguiente_derecha() and not vor.siguiente_derecha():
+            vor.thread = vil.siguiente_derecha()
+            vor.mod += sil - sor
+        else:
+            if vir.siguiente_izquierda() and not vol.siguiente_izquierda():
+                vol.thread = vir.siguiente_izquierda()
+                vol.mod += sir - sol
+            ancestro_por_defecto = v
+        return ancestro_por_defecto
+
+    @staticmethod
+    def _ancestro(vil, v, ancestro_por_defecto):
+        if vil.ancestor.padre is v.padre:
+            return vil.ancestor
+        return ancestro_por_defecto
+
+    @staticmethod
+    def _mover_subarbol(wl, wr, desplazamiento):
+        subarboles = wr.numero - wl.numero
+        wr.change -= desplazamiento / subarboles
+        wr.shift += desplazamiento
+        wl.change += desplazamiento / subarboles
+        wr.x += desplazamiento
+        wr.mod += desplazamiento
+
+    @staticmethod
+    def _ejecutar_desplazamientos(v):
+        desplazamiento = 0.0
+        cambio = 0.0
+        for w in reversed(v.hijos):
+            w.x += desplazamiento
+            w.mod += desplazamiento
+            cambio += w.change
+            desplazamiento += w.shift + cambio
+
+    def _segundo_recorrido(self):
+        # La raíz virtual queda en y = -1 para que las raíces reales queden en 0
+        pendientes = [(self._raiz, 0.0, -1)]
+        while pendientes:
+            v, m, nivel = pendientes.pop()
+            v.x += m
+            v.y = nivel
+            for w in v.hijos:
+                pendientes.append((w, m + v.mod, nivel + 1))
+
+        # Normalizar para que la x mínima sea 0
+        minimo = min((n.x for n in self._orden[1:]), default=0.0)
+        for n in self._orden:
+            n.x -= minimo
+
+    def _calcular_extensiones(self):
+        for v in reversed(self._orden):
+            v.ext_x_min = v.ext_x_max = v.x
+            v.ext_y_max = v.y
+            for w in v.hijos:
+                v.ext_x_min = min(v.ext_x_min, w.ext_x_min)
+                v.ext_x_max = max(v.ext_x_max, w.ext_x_max)
+                v.ext_y_max = max(v.ext_y_max, w.ext_y_max)
+
+    # ---------- Consultas ----------
+
+    def recortar(self, x_min=None, x_max=None, y_min=None, y_max=None):
+        """Nodos cuya posición cae dentro de la ventana, en preorden
+
+        Las ramas cuya extensión no intersecta la ventana se descartan sin
+        recorrerlas.
+        """
+        x_min = float('-inf') if x_min is None else x_min
+        x_max = float('inf') if x_max is None else x_max
+        y_min = float('-inf') if y_min is None else y_min
+        y_max = float('inf') if y_max is None else y_max
+
+        visibles = []
+        pendientes = list(reversed(self.raices))
+        while pendientes:
+            nodo = self.nodos[pendientes.pop()]
+            extension = nodo['extension']
+            if (extension['x_max'] < x_min or extension['x_min'] > x_max
+                    or extension['y_max'] < y_min or nodo['y'] > y_max):
+                continue
+            if x_min <= nodo['x'] <= x_max and y_min <= nodo['y'] <= y_max:
+                visibles.append(nodo)
+            pendientes.extend(reversed(self.hijos[nodo['nombre']]))
+        return visibles
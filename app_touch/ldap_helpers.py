@@ -1,4 +1,8 @@
 # ldap_helpers.py
+import hashlib
+import logging
+import re
+import threading
 from contextlib import contextmanager
 from ldap3 import Server, Connection, SIMPLE, ALL
 from django.conf import settings
@@ -6,6 +10,8 @@ from django.core.cache import cache
 from datetime import datetime, timedelta
 from django.utils.timezone import make_aware
 
+logger = logging.getLogger(__name__)
+
 @contextmanager
 def get_ldap_connection():
     """Context manager para conexiones LDAP"""
@@ -83,24 +89,6 @@ def procesar_last_logon(persona):
         return None
     return None
 
-def obtener_prioridad_jerarquia(titulo):
-    """Obtener prioridad jerárquica basada en título"""
-    if not titulo:
-        return 999
-        
-    # Si titulo es una lista, tomar el primer elemento
-    if isinstance(titulo, list):
-        titulo = titulo[0] if titulo else ''
-        
-    titulo_lower = str(titulo).lower()
-    if 'gerente' in titulo_lower and 'subgerente' not in titulo_lower:
-        return 1  # Máxima prioridad
-    elif 'subgerente' in titulo_lower:
-        return 2
-    elif 'jefe' in titulo_lower:
-        return 3
-    return 999
-
 def buscar_personas_ldap(search_filter, attributes_adicionales=None):
     """Búsqueda genérica de personas en LDAP"""
     attributes_base = [
@@ -212,4 +200,193 @@ def obtener_telefono_seguro(persona):
         if isinstance(telefono_value, list):
             return telefono_value[0] if telefono_value else ''
         return telefono_value
-    return ''
\ No newline at end of file
+    return ''
+
+
+
+# ========== CACHE DE CONSULTAS LDAP COMPARTIDO ==========
+
+# Perfiles de atributos: superconjuntos que comparten varios endpoints.
+# Una consulta pide siempre el perfil completo para que la búsqueda de
+# respaldo, el detalle de trabajador y el lote reutilicen el mismo resultado.
+PERFILES_ATRIBUTOS = {
+    'persona': [
+        'givenName', 'sn', 'mail', 'title', 'department',
+        'telephoneNumber', 'lastLogonTimestamp', 'company',
+        'userAccountControl', 'manager', 'distinguishedName', 'DisplayName'
+    ],
+}
+
+LDAP_QUERY_CACHE_TIMEOUT = getattr(settings, 'LDAP_QUERY_CACHE_TIMEOUT', 60 * 60)
+# Un resultado vacío dura poco: una cuenta recién creada debe aparecer pronto
+LDAP_QUERY_CACHE_VACIO_TIMEOUT = getattr(settings, 'LDAP_QUERY_CACHE_VACIO_TIMEOUT', 5 * 60)
+
+_ITEM_FILTRO = re.compile(r'^([A-Za-z][\w-]*)(~=|>=|<=|=)([^()]*)$', re.DOTALL)
+
+_estadisticas_consultas = {}
+_estadisticas_lock = threading.Lock()
+
+
+def _parsear_filtro(filtro, pos=0):
+    """Parsear un filtro LDAP a (operador, hijos) o ('item', attr, op, valor)
+
+    Los valores deben venir escapados (escape_filter_chars): un paréntesis
+    sin escapar hace el filtro inválido.
+    """
+    if filtro[pos:pos + 1] != '(':
+        raise ValueError(f"Filtro LDAP inválido en posición {pos}: {filtro}")
+    pos += 1
+
+    if filtro[pos:pos + 1] in ('&', '|', '!'):
+        operador = filtro[pos]
+        pos += 1
+        hijos = []
+        while filtro[pos:pos + 1] == '(':
+            hijo, pos = _parsear_filtro(filtro, pos)
+            hijos.append(hijo)
+        if filtro[pos:pos + 1] != ')' or not hijos or (operador == '!' and len(hijos) != 1):
+            raise ValueError(f"Filtro LDAP inválido en posición {pos}: {filtro}")
+        return (operador, hijos), pos + 1
+
+    fin = filtro.find(')', pos)
+    match = _ITEM_FILTRO.match(filtro[pos:fin]) if fin >= 0 else None
+    if not match:
+        raise ValueError(f"Item de filtro LDAP inválido: {filtro[pos:]}")
+    attr, op, valor = match.groups()
+    return ('item', attr, op, valor), fin + 1
+
+
+def _simplificar(nodo):
+    """Aplanar & y | anidados del mismo tipo y quitar los de un solo componente"""
+    if nodo[0] == 'item':
+        return nodo
+    operador, hijos = nodo
+    planos = []
+    for hijo in map(_simplificar, hijos):
+        if operador in '&|' and hijo[0] == operador:
+            planos.extend(hijo[1])
+        else:
+            planos.append(hijo)
+    if operador in '&|' and len(planos) == 1:
+        return planos[0]
+    return (operador, planos)
+
+
+def _serializar_filtro(nodo, forma=False):
+    if nodo[0] == 'item':
+        _, attr, op, valor = nodo
+        attr = attr.lower()
+        valor = ' '.join(valor.split()).lower()
+        if forma and attr != 'objectclass':
+            valor = '*' if '*' in valor else '?'
+        return f"({attr}{op}{valor})"
+
+    operador, hijos = nodo
+    partes = [_serializar_filtro(hijo, forma) for hijo in hijos]
+    if operador in '&|':
+        partes = sorted(set(partes))
+    return f"({operador}{''.join(partes)})"
+
+
+def _arbol_filtro(search_filter):
+    filtro = search_filter.strip()
+    nodo, fin = _parsear_filtro(filtro)
+    if fin != len(filtro):
+        raise ValueError(f"Texto sobrante en el filtro LDAP: {filtro[fin:]}")
+    return _simplificar(nodo)
+
+
+def normalizar_filtro(search_filter):
+    """Forma canónica de un filtro: atributos y valores en minúsculas, espacios
+    colapsados, & / | anidados aplanados y sus componentes ordenados (AD
+    compara sin distinguir mayúsculas en los atributos de texto que usa la app)"""
+    return _serializar_filtro(_arbol_filtro(search_filter))
+
+
+def forma_filtro(search_filter):
+    """Forma del filtro sin valores concretos, para agrupar estadísticas"""
+    try:
+        return _serializar_filtro(_arbol_filtro(search_filter), forma=True)
+    except ValueError:
+        return 'invalido'
+
+
+def _registrar_consulta(forma, hit):
+    with _estadisticas_lock:
+        stats = _estadisticas_consultas.setdefault(forma, {'hits': 0, 'misses': 0})
+        stats['hits' if hit else 'misses'] += 1
+
+
+def estadisticas_consultas_ldap():
+    """Tasa de aciertos del cache de consultas por forma de filtro (por proceso)"""
+    with _estadisticas_lock:
+        resultado = {}
+        for forma, stats in _estadisticas_consultas.items():
+            total = stats['hits'] + stats['misses']
+            resultado[forma] = {
+                'hits': stats['hits'],
+                'misses': stats['misses'],
+                'hit_rate': round(stats['hits'] / total, 3) if total else 0.0
+            }
+        return resultado
+
+
+@contextmanager
+def _conexion(conectar):
+    """Conexión de `conectar` (o la de get_ldap_connection), cerrada al salir"""
+    if conectar is None:
+        with get_ldap_connection() as conn:
+            yield conn
+        return
+    conn = conectar()
+    try:
+        yield conn
+    finally:
+        conn.unbind()
+
+
+def _consultar_ad(conectar, search_filter, atributos, size_limit):
+    with _conexion(conectar) as conn:
+        conn.search(
+            search_base=settings.LDAP_CONFIG['BASE_DN'],
+            search_filter=search_filter,
+            attributes=atributos,
+            size_limit=size_limit
+        )
+        return [dict(entry.entry_attributes_as_dict) for entry in conn.entries]
+
+
+def buscar_entradas_cacheadas(search_filter, perfil='persona', size_limit=0, conectar=None):
+    """Ejecutar una búsqueda LDAP compartiendo el resultado entre endpoints
+
+    La clave es el filtro normalizado más el perfil de atributos, así que
+    el detalle de un trabajador `(mail=x)` y un lote de un solo correo
+    `(|(mail=x))` usan un único resultado de AD aunque pidan listas de
+    atributos distintas. Devuelve una lista de diccionarios con el mismo
+    formato que `entry.entry_attributes_as_dict`. `conectar` devuelve una
+    conexión abierta y solo se llama si hay que ir a AD. Un filtro que no
+    se puede normalizar se ejecuta sin cache.
+    """
+    atributos = PERFILES_ATRIBUTOS[perfil]
+    try:
+        filtro_normalizado = normalizar_filtro(search_filter)
+    except ValueError as e:
+        logger.warning(f"⚠️ Consulta LDAP sin cache, filtro no normalizable: {e}")
+        _registrar_consulta('invalido', False)
+        return _consultar_ad(conectar, search_filter, atributos, size_limit)
+
+    forma = forma_filtro(search_filter)
+    digest = hashlib.sha1(f"{perfil}|{size_limit}|{filtro_normalizado}".encode('utf-8')).hexdigest()
+    cache_key = f"ldap_query_{perfil}_{digest}"
+
+    entradas = cache.get(cache_key)
+    if entradas is not None:
+        _registrar_consulta(forma, True)
+        logger.debug(f"✅ CACHE HIT consulta LDAP {forma}")
+        return entradas
+
+    _registrar_consulta(forma, False)
+    entradas = _consultar_ad(conectar, search_filter, atributos, size_limit)
+    cache.set(cache_key, entradas, LDAP_QUERY_CACHE_TIMEOUT if entradas else LDAP_QUERY_CACHE_VACIO_TIMEOUT)
+    logger.debug(f"❌ CACHE MISS consulta LDAP {forma} -> {len(entradas)} entradas")
+    return entradas
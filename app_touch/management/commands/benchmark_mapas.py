@@ -0,0 +1,87 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Q
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from app_touch.models import Mapa, Ubicacion
+from app_touch.serializer import MapaSerializer, UbicacionSerializer
+from app_touch.views import MapaViewSet, UbicacionViewSet
+
+
+class MapaAnidadoSerializer(MapaSerializer):
+    """Representación anterior: cada ubicación con su departamento completo y todos sus trabajadores"""
+    ubicaciones = UbicacionSerializer(many=True, read_only=True)
+
+
+class Command(BaseCommand):
+    help = 'Compara consultas SQL, bytes y tiempo del payload de /api/mapas/ anidado y plano'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=5,
+            help='Veces que se construye cada payload; se informa el mejor tiempo (por defecto 5)',
+        )
+
+    def medir(self, construir, repeticiones):
+        """(consultas, bytes, mejor tiempo en ms) de serializar y renderizar el payload"""
+        mejor = None
+        for _ in range(repeticiones):
+            with CaptureQueriesContext(connection) as consultas:
+                inicio = time.perf_counter()
+                cuerpo = JSONRenderer().render(construir())
+                segundos = time.perf_counter() - inicio
+            mejor = segundos if mejor is None else min(mejor, segundos)
+        return len(consultas), len(cuerpo), mejor * 1000
+
+    def handle(self, *args, **options):
+        repeticiones = options['repeticiones']
+        if repeticiones < 1:
+            raise CommandError('--repeticiones debe ser mayor que 0')
+
+        mapas = Mapa.objects.count()
+        ubicaciones = Ubicacion.objects.count()
+        self.stdout.write(self.style.NOTICE(f'🗺️ {mapas} mapas, {ubicaciones} ubicaciones'))
+
+        resultados = {
+            'anidado (anterior)': self.medir(
+                lambda: MapaAnidadoSerializer(Mapa.objects.all(), many=True).data, repeticiones
+            ),
+            'plano': self.medir(
+                lambda: MapaSerializer(MapaViewSet.queryset.all(), many=True).data, repeticiones
+            ),
+        }
+
+        self.stdout.write('\n📊 GET /api/mapas/:')
+        for nombre, (consultas, tamano, ms) in resultados.items():
+            self.stdout.write(f'  {nombre}: {consultas} consultas, {tamano / 1024:.1f} KB, {ms:.1f}ms')
+
+        _, anterior, _ = resultados['anidado (anterior)']
+        _, plano, _ = resultados['plano']
+        if anterior:
+            self.stdout.write(self.style.SUCCESS(f'\n🎉 Payload {anterior / max(plano, 1):.1f}x más chico'))
+
+        # Carga diferida: el marcador con el departamento más grande
+        ubicacion = (
+            Ubicacion.objects.filter(departamento__isnull=False)
+            .annotate(total=Count('departamento__trabajadores', filter=Q(departamento__trabajadores__cuenta_activa=True)))
+            .order_by('-total')
+            .first()
+        )
+        if ubicacion is None:
+            return
+
+        vista = UbicacionViewSet.as_view({'get': 'trabajadores'})
+        request = APIRequestFactory().get(f'/api/ubicaciones/{ubicacion.id}/trabajadores/')
+        with CaptureQueriesContext(connection) as consultas:
+            response = vista(request, pk=ubicacion.id)
+            response.render()
+        self.stdout.write(
+            f"\n👆 GET /api/ubicaciones/{ubicacion.id}/trabajadores/ ({ubicacion.total} trabajadores): "
+            f"{len(consultas)} consultas, {len(response.content) / 1024:.1f} KB"
+        )
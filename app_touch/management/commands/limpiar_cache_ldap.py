@@ -54,7 +54,7 @@ class Command(BaseCommand):
     
     def limpiar_cache_ldap_compatible(self):
         """Método compatible con cualquier backend de cache"""
-        prefixes = ['ldap_', 'jefes_', 'arbol_', 'departamento_', 'trabajador_detail_']
+        prefixes = ['ldap_', 'jefes_', 'arbol_', 'departamento_', 'trabajador_detail_', 'cas_']
         deleted_count = 0
         
         self.stdout.write('🔄 Iniciando limpieza de cache LDAP...')
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from ldap3.core.exceptions import LDAPException
+
+from app_touch.directorio import iterar_directorio
+from app_touch.sincronizacion import TAMANO_LOTE_SINCRONIZACION, sincronizar_directorio
+
+
+class Command(BaseCommand):
+    help = 'Sincroniza Trabajador/Departamento desde el directorio activo con escrituras masivas en una transacción'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=TAMANO_LOTE_SINCRONIZACION,
+            help=f'Filas por sentencia de escritura (por defecto {TAMANO_LOTE_SINCRONIZACION})',
+        )
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Ejecuta la sincronización completa y revierte la transacción al final',
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('--lote debe ser mayor que 0')
+
+        modo = ' (simulación)' if options['simular'] else ''
+        self.stdout.write(self.style.NOTICE(f'🔄 Sincronizando desde el directorio activo{modo}...'))
+
+        try:
+            estadisticas = sincronizar_directorio(
+                iterar_directorio(), tamano_lote=options['lote'], simular=options['simular']
+            )
+        except LDAPException as e:
+            raise CommandError(f'❌ Error de conexión con el directorio activo: {e}')
+
+        self.stdout.write('\n📊 RESULTADOS:')
+        for clave in (
+            'personas_leidas', 'trabajadores_creados', 'trabajadores_actualizados', 'trabajadores_vinculados',
+            'trabajadores_dn_actualizado', 'trabajadores_sin_cambios', 'trabajadores_desactivados', 'departamentos_creados',
+            'departamentos_actualizados', 'jefaturas_completadas', 'supervisiones_creadas',
+            'supervisiones_eliminadas', 'cierre_creados', 'cierre_eliminados', 'cierre_actualizados',
+            'omitidos_sin_dn',
+        ):
+            self.stdout.write(f'  {clave}: {estadisticas.get(clave, 0)}')
+
+        self.stdout.write('\n⏱️ FASES:')
+        for fase, segundos in estadisticas['fases'].items():
+            self.stdout.write(f'  {fase}: {segundos:.3f}s')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n🎉 {estadisticas['personas_leidas']} personas en {estadisticas['segundos']:.2f}s "
+            f"({estadisticas['filas_por_segundo']} filas/s){modo}"
+        ))
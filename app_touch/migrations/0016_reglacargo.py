@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-19 10:15
+
+from django.db import migrations, models
+
+
+REGLAS_INICIALES = [
+    ('gerente general', 1),
+    ('gerente', 2),
+    ('subgerente', 3),
+    ('jefe', 4),
+    ('jefa', 4),
+    ('especialista', 4),
+    ('coordinador', 5),
+    ('coordinadora', 5),
+    ('encargado', 5),
+    ('encargada', 5),
+]
+
+
+def crear_reglas_iniciales(apps, schema_editor):
+    ReglaCargo = apps.get_model('app_touch', 'ReglaCargo')
+    ReglaCargo.objects.bulk_create([
+        ReglaCargo(patron=patron, prioridad=prioridad)
+        for patron, prioridad in REGLAS_INICIALES
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_touch', '0015_add_device_fingerprint_to_qrtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReglaCargo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patron', models.CharField(help_text='Palabra o frase completa del cargo (no distingue mayúsculas ni tildes)', max_length=100, unique=True)),
+                ('prioridad', models.PositiveSmallIntegerField(help_text='Menor número = mayor jerarquía (1 = gerente general)')),
+                ('activa', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name': 'regla de cargo',
+                'verbose_name_plural': 'reglas de cargo',
+                'ordering': ['prioridad', 'patron'],
+            },
+        ),
+        migrations.RunPython(crear_reglas_iniciales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:40
+
+from django.db import migrations
+
+
+TABLA_FTS = 'app_touch_trabajador_fts'
+
+
+def crear_tabla_fts(apps, schema_editor):
+    # FTS5 solo existe en SQLite; en otros motores la búsqueda usa el índice en memoria
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5("
+        "nombre, apellido, email, cargo, departamento, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+
+
+def eliminar_tabla_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {TABLA_FTS}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_touch', '0016_reglacargo'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_tabla_fts, eliminar_tabla_fts),
+    ]
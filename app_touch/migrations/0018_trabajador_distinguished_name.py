@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_touch', '0017_trabajador_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='departamento',
+            name='clave',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='trabajador',
+            name='distinguished_name',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+    ]
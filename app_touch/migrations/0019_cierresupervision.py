@@ -0,0 +1,57 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def poblar_cierre(apps, schema_editor):
+    """Cierre inicial a partir de las relaciones supervisa_a existentes"""
+    Trabajador = apps.get_model('app_touch', 'Trabajador')
+    CierreSupervision = apps.get_model('app_touch', 'CierreSupervision')
+
+    hijos = {}
+    for jefe, subordinado in Trabajador.supervisa_a.through.objects.values_list('from_trabajador_id', 'to_trabajador_id'):
+        hijos.setdefault(jefe, []).append(subordinado)
+
+    filas = []
+    for jefe in hijos:
+        visitados = {jefe}
+        frontera = hijos[jefe]
+        profundidad = 1
+        while frontera:
+            siguiente = []
+            for subordinado in frontera:
+                if subordinado in visitados:
+                    continue
+                visitados.add(subordinado)
+                filas.append(CierreSupervision(jefe_id=jefe, subordinado_id=subordinado, profundidad=profundidad))
+                siguiente.extend(hijos.get(subordinado, ()))
+            frontera = siguiente
+            profundidad += 1
+    CierreSupervision.objects.bulk_create(filas, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_touch', '0018_trabajador_distinguished_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CierreSupervision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profundidad', models.PositiveIntegerField(help_text='1 = supervisión directa')),
+                ('jefe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cierre_subordinados', to='app_touch.trabajador')),
+                ('subordinado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cierre_jefes', to='app_touch.trabajador')),
+            ],
+            options={
+                'verbose_name': 'cierre de supervisión',
+                'verbose_name_plural': 'cierres de supervisión',
+                'indexes': [models.Index(fields=['jefe', 'profundidad'], name='cierre_jefe_profundidad'), models.Index(fields=['subordinado', 'profundidad'], name='cierre_subordinado_profundidad')],
+                'constraints': [models.UniqueConstraint(fields=('jefe', 'subordinado'), name='cierre_supervision_unico')],
+            },
+        ),
+        migrations.RunPython(poblar_cierre, migrations.RunPython.noop),
+    ]
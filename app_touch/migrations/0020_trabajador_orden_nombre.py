@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_touch', '0019_cierresupervision'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trabajador',
+            index=models.Index(fields=['apellido', 'nombre', 'id'], name='trabajador_orden_nombre'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_touch', '0020_trabajador_orden_nombre'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionIndiceFts',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=32)),
+                ('total_filas', models.PositiveIntegerField(default=0)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'versión del índice FTS',
+                'verbose_name_plural': 'versiones del índice FTS',
+            },
+        ),
+    ]
@@ -61,6 +61,8 @@ class QRToken(models.Model):
 # ---------------------------
 class Departamento(models.Model):
     nombre = models.CharField(max_length=100)
+    # Nombre normalizado (sin tildes ni mayúsculas) con que sincronizar_ldap lo identifica
+    clave = models.CharField(max_length=100, unique=True, null=True, blank=True)
     descripcion = models.TextField(blank=True)
     jefe = models.ForeignKey(
         'Trabajador',
@@ -99,10 +101,18 @@ class Trabajador(models.Model):
     compañia = models.CharField(max_length=255, blank=True, null=True)
     cuenta_activa = models.BooleanField(default=True)
     jefatura_directa = models.CharField(max_length=255, blank=True, null=True)
+    # DN en el directorio activo; identifica al trabajador en sincronizar_ldap (si cambia, se reconoce por correo)
+    distinguished_name = models.CharField(max_length=255, unique=True, null=True, blank=True)
 
     # Relación con trabajadores supervisados
     supervisa_a = models.ManyToManyField('self', blank=True, symmetrical=False, related_name='supervisado_por')
 
+    class Meta:
+        indexes = [
+            # Orden de la paginación por clave de la API de lectura
+            models.Index(fields=['apellido', 'nombre', 'id'], name='trabajador_orden_nombre'),
+        ]
+
     def __str__(self):
         return f"{self.nombre} {self.apellido}"
 
@@ -194,3 +204,74 @@ class ProcedimientoEmergencia(models.Model):
 
     def __str__(self):
         return f"{self.titulo} ({self.tipo_emergencia})"
+
+
+# ---------------------------
+# Modelo ReglaCargo
+# ---------------------------
+class ReglaCargo(models.Model):
+    """Palabra o frase de cargo que identifica una jefatura y su prioridad"""
+    patron = models.CharField(
+        max_length=100,
+        unique=True,
+        help_text="Palabra o frase completa del cargo (no distingue mayúsculas ni tildes)"
+    )
+    prioridad = models.PositiveSmallIntegerField(
+        help_text="Menor número = mayor jerarquía (1 = gerente general)"
+    )
+    activa = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['prioridad', 'patron']
+        verbose_name = 'regla de cargo'
+        verbose_name_plural = 'reglas de cargo'
+
+    def __str__(self):
+        return f"{self.patron} ({self.prioridad})"
+
+
+
+# ---------------------------
+# Modelo CierreSupervision
+# ---------------------------
+class CierreSupervision(models.Model):
+    """Clausura transitiva de supervisa_a: un par (jefe, subordinado) por cada
+    camino de supervisión, directo o indirecto, con su distancia mínima"""
+    jefe = models.ForeignKey(Trabajador, on_delete=models.CASCADE, related_name='cierre_subordinados')
+    subordinado = models.ForeignKey(Trabajador, on_delete=models.CASCADE, related_name='cierre_jefes')
+    profundidad = models.PositiveIntegerField(help_text="1 = supervisión directa")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['jefe', 'subordinado'], name='cierre_supervision_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['jefe', 'profundidad'], name='cierre_jefe_profundidad'),
+            models.Index(fields=['subordinado', 'profundidad'], name='cierre_subordinado_profundidad'),
+        ]
+        verbose_name = 'cierre de supervisión'
+        verbose_name_plural = 'cierres de supervisión'
+
+    def __str__(self):
+        return f"{self.jefe_id} -> {self.subordinado_id} ({self.profundidad})"
+
+
+# ---------------------------
+# Modelo VersionIndiceFts
+# ---------------------------
+class VersionIndiceFts(models.Model):
+    """Versión del índice FTS5 de trabajadores (una sola fila, pk=1)
+
+    Se escribe en la misma transacción que reconstruye el índice, así los
+    cursores de búsqueda cambian exactamente cuando cambia su contenido.
+    """
+    version = models.CharField(max_length=32)
+    total_filas = models.PositiveIntegerField(default=0)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'versión del índice FTS'
+        verbose_name_plural = 'versiones del índice FTS'
+
+    def __str__(self):
+        return f"{self.version} ({self.total_filas} filas)"
@@ -68,11 +68,89 @@ class UbicacionSerializer(serializers.ModelSerializer):
         ]
 
 # ---------------------------
-# Serializer para Mapa
+# Serializers para Mapa
 # ---------------------------
+# El mapa solo muestra el nombre del departamento de cada marcador; los
+# trabajadores se piden al tocarlo (ubicaciones/<id>/trabajadores/).
+class DepartamentoReferenciaSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Departamento
+        fields = ['id', 'nombre']
+
+
+class UbicacionMapaSerializer(serializers.ModelSerializer):
+    departamento = DepartamentoReferenciaSerializer(read_only=True)
+
+    class Meta:
+        model = Ubicacion
+        fields = [
+            'id',
+            'nombre',
+            'descripcion',
+            'coordenada_x',
+            'coordenada_y',
+            'categoria',
+            'tipo_emergencia',
+            'departamento'
+        ]
+
+
 class MapaSerializer(serializers.ModelSerializer):
-    ubicaciones = UbicacionSerializer(many=True)
+    ubicaciones = UbicacionMapaSerializer(many=True, read_only=True)
 
     class Meta:
         model = Mapa
         fields = ['id', 'nombre', 'imagen', 'ubicaciones']
+
+
+# ---------------------------
+# Serializers planos de lectura (tablas locales)
+# ---------------------------
+# Sin anidar serializers con consultas propias: todo lo que leen viene del
+# select_related/Prefetch de la vista, así el número de consultas no
+# depende de cuántas filas se devuelven.
+
+class TrabajadorResumenSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Trabajador
+        fields = ['id', 'nombre', 'apellido', 'cargo']
+
+
+class TrabajadorListaSerializer(serializers.ModelSerializer):
+    departamento_nombre = serializers.CharField(source='departamento.nombre', default=None, read_only=True)
+
+    class Meta:
+        model = Trabajador
+        fields = [
+            'id', 'nombre', 'apellido', 'cargo', 'email', 'telefono',
+            'departamento_id', 'departamento_nombre', 'jefatura_directa', 'cuenta_activa'
+        ]
+
+
+class TrabajadorDetalleSerializer(TrabajadorListaSerializer):
+    supervisa_a = TrabajadorResumenSerializer(source='subordinados_directos', many=True, read_only=True)
+    supervisado_por = TrabajadorResumenSerializer(source='jefes_directos', many=True, read_only=True)
+
+    class Meta(TrabajadorListaSerializer.Meta):
+        fields = TrabajadorListaSerializer.Meta.fields + [
+            'compañia', 'ultima_conexion', 'supervisa_a', 'supervisado_por'
+        ]
+
+
+class DepartamentoListaSerializer(serializers.ModelSerializer):
+    jefe = TrabajadorResumenSerializer(read_only=True)
+    total_trabajadores = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Departamento
+        fields = [
+            'id', 'nombre', 'descripcion', 'contacto_email',
+            'contacto_telefono', 'jefe', 'total_trabajadores'
+        ]
+
+
+class DepartamentoDetalleSerializer(DepartamentoListaSerializer):
+    trabajadores = TrabajadorResumenSerializer(source='trabajadores_activos', many=True, read_only=True)
+
+    class Meta(DepartamentoListaSerializer.Meta):
+        fields = DepartamentoListaSerializer.Meta.fields + ['trabajadores']
@@ -0,0 +1,74 @@
+# signals.py
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from app_touch.busqueda_universal import actualizar_documento, documento_procedimiento, documento_ubicacion
+from app_touch.cargos import invalidar_reglas
+from app_touch.cierre_supervision import actualizar_cierre, descendientes
+from app_touch.models import ProcedimientoEmergencia, ReglaCargo, Trabajador, Ubicacion
+
+
+@receiver([post_save, post_delete], sender=ReglaCargo)
+def reglas_cargo_modificadas(sender, **kwargs):
+    """Recargar el clasificador de cargos cuando RR.HH. edita una regla"""
+    invalidar_reglas()
+
+
+@receiver(post_save, sender=Ubicacion)
+def ubicacion_guardada(sender, instance, **kwargs):
+    """Reindexar solo esta ubicación en la búsqueda universal"""
+    documento = documento_ubicacion(instance)
+    transaction.on_commit(lambda: actualizar_documento('ubicaciones', documento))
+
+
+@receiver(post_delete, sender=Ubicacion)
+def ubicacion_eliminada(sender, instance, **kwargs):
+    clave = instance.id
+    transaction.on_commit(lambda: actualizar_documento('ubicaciones', clave=clave))
+
+
+@receiver(post_save, sender=ProcedimientoEmergencia)
+def procedimiento_guardado(sender, instance, **kwargs):
+    """Reindexar solo este procedimiento en la búsqueda universal"""
+    documento = documento_procedimiento(instance)
+    transaction.on_commit(lambda: actualizar_documento('procedimientos', documento))
+
+
+@receiver(post_delete, sender=ProcedimientoEmergencia)
+def procedimiento_eliminado(sender, instance, **kwargs):
+    clave = instance.id
+    transaction.on_commit(lambda: actualizar_documento('procedimientos', clave=clave))
+
+
+@receiver(m2m_changed, sender=Trabajador.supervisa_a.through)
+def supervision_modificada(sender, instance, action, reverse, pk_set, **kwargs):
+    """Mantener el cierre de supervisión al agregar o quitar jefaturas"""
+    if action == 'pre_clear' and not reverse:
+        # Después del clear ya no se sabe a quiénes supervisaba
+        instance._subordinados_previos = set(instance.supervisa_a.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        afectados = {instance.pk}
+    elif action == 'post_clear':
+        afectados = getattr(instance, '_subordinados_previos', set())
+    else:
+        afectados = pk_set or set()
+    if afectados:
+        actualizar_cierre(afectados)
+
+
+@receiver(pre_delete, sender=Trabajador)
+def trabajador_por_eliminar(sender, instance, **kwargs):
+    instance._subordinados_previos = descendientes([instance.pk]) - {instance.pk}
+
+
+@receiver(post_delete, sender=Trabajador)
+def trabajador_eliminado(sender, instance, **kwargs):
+    """Sus filas del cierre se borran en cascada; sus subordinados pierden a los jefes de más arriba"""
+    afectados = getattr(instance, '_subordinados_previos', set())
+    if afectados:
+        actualizar_cierre(afectados)
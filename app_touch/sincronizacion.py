@@ -0,0 +1,328 @@
+# sincronizacion.py
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+
+from app_touch.busqueda_fts import reconstruir_indice_fts
+from app_touch.cierre_supervision import reconstruir_cierre
+from app_touch.directorio import normalizar_correo, normalizar_departamento
+from app_touch.ldap_helpers import procesar_last_logon
+from app_touch.models import Departamento, Trabajador
+
+logger = logging.getLogger(__name__)
+
+# Filas por sentencia en bulk_create/bulk_update
+TAMANO_LOTE_SINCRONIZACION = getattr(settings, 'TAMANO_LOTE_SINCRONIZACION', 500)
+
+# Campos de Trabajador que se copian del directorio
+CAMPOS_SINCRONIZADOS = (
+    'nombre', 'apellido', 'cargo', 'departamento_id', 'email', 'telefono',
+    'ultima_conexion', 'compañia', 'cuenta_activa', 'jefatura_directa',
+)
+
+
+def _texto(valor, largo):
+    return str(valor or '').strip()[:largo]
+
+
+def _ultima_conexion(persona):
+    valor = procesar_last_logon(persona)
+    return datetime.fromisoformat(valor) if valor else None
+
+
+def _trozos(valores, tamano):
+    valores = list(valores)
+    for i in range(0, len(valores), tamano):
+        yield valores[i:i + tamano]
+
+
+class SincronizacionDirectorio:
+    """Copia del directorio a Trabajador/Departamento con escrituras masivas
+
+    Las personas (cualquier iterable, por ejemplo las páginas de LDAP) se
+    leen completas antes de abrir la transacción: en SQLite la escritura
+    bloquea toda la base, incluido el cache (DatabaseCache), y no debe
+    quedar tomada mientras se espera a LDAP. Luego se escriben por lotes:
+    los trabajadores nuevos o modificados con bulk_create(update_conflicts=True)
+    sobre distinguished_name, y con bulk_update las filas que no coinciden
+    por DN con nadie del directorio pero sí por correo (registros antiguos
+    sin DN o personas cuyo DN cambió por una movida de OU o un cambio de
+    nombre), que se conservan con su id, foto, jefaturas y supervisiones.
+    Cada fila se compara con la existente y las que no cambiaron no se
+    escriben. La relación supervisa_a se aplica como diferencia sobre la
+    tabla intermedia y luego se recalcula su cierre (CierreSupervision).
+    """
+
+    def __init__(self, tamano_lote=TAMANO_LOTE_SINCRONIZACION):
+        self.tamano_lote = tamano_lote
+        self.fases = {}
+        self.estadisticas = Counter()
+
+    @contextmanager
+    def _fase(self, nombre):
+        inicio = time.time()
+        try:
+            yield
+        finally:
+            self.fases[nombre] = round(self.fases.get(nombre, 0.0) + time.time() - inicio, 3)
+
+    # ---------- Estado existente ----------
+
+    def _cargar_existentes(self, dns_leidos):
+        self.trabajadores = {}  # DN en minúsculas -> valores actuales
+        # correo -> valores actuales de las filas cuyo DN no está en el directorio
+        # leído (sin DN o con un DN que cambió); las activas tienen preferencia
+        self.trabajadores_por_correo = {}
+        self.activos_previos = set()
+        filas = Trabajador.objects.order_by('-cuenta_activa', 'id').values('id', 'distinguished_name', *CAMPOS_SINCRONIZADOS)
+        for fila in filas:
+            if fila['cuenta_activa']:
+                self.activos_previos.add(fila['id'])
+            dn = (fila['distinguished_name'] or '').lower()
+            if dn:
+                self.trabajadores[dn] = fila
+            if dn in dns_leidos:
+                continue
+            correo = normalizar_correo(fila['email'])
+            if correo:
+                self.trabajadores_por_correo.setdefault(correo, fila)
+
+        self.departamentos = {}  # clave -> (id, nombre actual)
+        self.departamentos_adoptados = set()
+        sin_clave = {}
+        for id_departamento, nombre, clave in Departamento.objects.order_by('id').values_list('id', 'nombre', 'clave'):
+            if clave:
+                self.departamentos[clave] = (id_departamento, nombre)
+            else:
+                sin_clave.setdefault(normalizar_departamento(nombre), (id_departamento, nombre))
+        for clave, departamento in sin_clave.items():
+            if clave and clave not in self.departamentos:
+                self.departamentos[clave] = departamento
+                self.departamentos_adoptados.add(clave)
+
+    # ---------- Fase 1: trabajadores por lotes ----------
+
+    def _crear_departamentos(self, claves):
+        nuevas = [clave for clave in claves if clave not in self.departamentos]
+        if not nuevas:
+            return
+        Departamento.objects.bulk_create(
+            [Departamento(clave=clave, nombre=_texto(self.variantes[clave].most_common(1)[0][0], 100)) for clave in nuevas],
+            ignore_conflicts=True,
+            batch_size=self.tamano_lote
+        )
+        for id_departamento, nombre, clave in Departamento.objects.filter(clave__in=nuevas).values_list('id', 'nombre', 'clave'):
+            self.departamentos[clave] = (id_departamento, nombre)
+        self.estadisticas['departamentos_creados'] += len(nuevas)
+
+    def _valores(self, persona):
+        clave = normalizar_departamento(persona.get('department'))
+        return {
+            'nombre': _texto(persona.get('givenName'), 100),
+            'apellido': _texto(persona.get('sn'), 100),
+            'cargo': _texto(persona.get('title'), 100),
+            'departamento_id': self.departamentos[clave][0] if clave else None,
+            'email': normalizar_correo(persona.get('mail'))[:254],
+            'telefono': _texto(persona.get('telephoneNumber'), 20),
+            'ultima_conexion': _ultima_conexion(persona),
+            'compañia': _texto(persona.get('company'), 255) or None,
+            'cuenta_activa': bool(persona.get('activo', True)),
+        }
+
+    def _jefatura_provisoria(self, dn, existente):
+        """Nombre del jefe si ya se leyó; si no, el guardado (se corrige en la fase de jerarquía)"""
+        manager = self.managers.get(dn)
+        if not manager:
+            return None
+        if manager in self.nombres:
+            return _texto(self.nombres[manager], 255) or None
+        if existente is not None:
+            return existente['jefatura_directa']
+        guardado = self.trabajadores.get(manager)
+        if guardado is not None:
+            return _texto(f"{guardado['nombre']} {guardado['apellido']}", 255) or None
+        return None
+
+    def _escribir_lote(self, lote):
+        claves = set()
+        for persona in lote:
+            clave = normalizar_departamento(persona.get('department'))
+            if clave:
+                self.variantes.setdefault(clave, Counter())[' '.join(str(persona['department']).split())] += 1
+                claves.add(clave)
+        self._crear_departamentos(claves)
+
+        upserts = []
+        adoptados = []
+        for persona in lote:
+            dn = str(persona.get('distinguishedName') or '').strip()
+            if not dn:
+                self.estadisticas['omitidos_sin_dn'] += 1
+                continue
+            if dn.lower() in self.vistos:
+                continue
+            self.vistos[dn.lower()] = dn
+            self.nombres[dn.lower()] = f"{persona.get('givenName') or ''} {persona.get('sn') or ''}".strip()
+            if persona.get('manager'):
+                self.managers[dn.lower()] = str(persona['manager']).lower()
+
+            existente = self.trabajadores.get(dn.lower())
+            valores = self._valores(persona)
+            valores['jefatura_directa'] = self._jefatura_provisoria(dn.lower(), existente)
+            if existente is not None:
+                # Se conserva el DN guardado para que el conflicto coincida aunque cambien mayúsculas
+                self.escritos[dn.lower()] = (existente['distinguished_name'], valores)
+                if all(existente[campo] == valor for campo, valor in valores.items()):
+                    self.estadisticas['trabajadores_sin_cambios'] += 1
+                    continue
+                upserts.append(Trabajador(distinguished_name=existente['distinguished_name'], **valores))
+                self.estadisticas['trabajadores_actualizados'] += 1
+                continue
+
+            self.escritos[dn.lower()] = (dn, valores)
+            existente = self.trabajadores_por_correo.pop(valores['email'], None) if valores['email'] else None
+            if existente is not None:
+                # La fila conserva su id: foto, jefaturas y supervisiones siguen apuntando a ella
+                adoptados.append(Trabajador(id=existente['id'], distinguished_name=dn, **valores))
+                if existente['distinguished_name']:
+                    self.estadisticas['trabajadores_dn_actualizado'] += 1
+                else:
+                    self.estadisticas['trabajadores_vinculados'] += 1
+            else:
+                upserts.append(Trabajador(distinguished_name=dn, **valores))
+                self.estadisticas['trabajadores_creados'] += 1
+
+        if upserts:
+            Trabajador.objects.bulk_create(
+                upserts,
+                update_conflicts=True,
+                unique_fields=['distinguished_name'],
+                update_fields=list(CAMPOS_SINCRONIZADOS),
+                batch_size=self.tamano_lote
+            )
+        if adoptados:
+            Trabajador.objects.bulk_update(
+                adoptados, ['distinguished_name', *CAMPOS_SINCRONIZADOS], batch_size=self.tamano_lote
+            )
+
+    # ---------- Fase 2: nombres canónicos y bajas ----------
+
+    def _completar_departamentos(self):
+        cambios = []
+        for clave, variantes in self.variantes.items():
+            id_departamento, nombre = self.departamentos[clave]
+            canonico = _texto(variantes.most_common(1)[0][0], 100)
+            if canonico != nombre or clave in self.departamentos_adoptados:
+                cambios.append(Departamento(id=id_departamento, nombre=canonico, clave=clave))
+        Departamento.objects.bulk_update(cambios, ['nombre', 'clave'], batch_size=self.tamano_lote)
+        self.estadisticas['departamentos_actualizados'] += len(cambios)
+
+    def _desactivar_retirados(self):
+        self.ids = dict(
+            (dn.lower(), id_trabajador) for dn, id_trabajador in
+            Trabajador.objects.filter(distinguished_name__isnull=False).values_list('distinguished_name', 'id')
+        )
+        vigentes = {self.ids[dn] for dn in self.vistos if dn in self.ids}
+        retirados = self.activos_previos - vigentes
+        for trozo in _trozos(retirados, self.tamano_lote):
+            self.estadisticas['trabajadores_desactivados'] += Trabajador.objects.filter(id__in=trozo).update(cuenta_activa=False)
+
+    # ---------- Fase 3: jefaturas ----------
+
+    def _sincronizar_jefaturas(self):
+        # Solo las filas cuyo jefe apareció después en el recorrido; otro upsert
+        # es mucho más barato que el CASE fila a fila de bulk_update
+        pendientes = []
+        for dn, (dn_guardado, valores) in self.escritos.items():
+            jefatura = _texto(self.nombres.get(self.managers.get(dn)), 255) or None
+            if jefatura != valores['jefatura_directa']:
+                pendientes.append(Trabajador(distinguished_name=dn_guardado, **{**valores, 'jefatura_directa': jefatura}))
+        if pendientes:
+            Trabajador.objects.bulk_create(
+                pendientes,
+                update_conflicts=True,
+                unique_fields=['distinguished_name'],
+                update_fields=['jefatura_directa'],
+                batch_size=self.tamano_lote
+            )
+
+        # supervisa_a como diferencia sobre la tabla intermedia
+        Supervision = Trabajador.supervisa_a.through
+        sincronizados = {self.ids[dn] for dn in self.vistos}
+        deseados = set()
+        for dn, manager in self.managers.items():
+            if manager in self.vistos and manager != dn:
+                deseados.add((self.ids[manager], self.ids[dn]))
+
+        existentes = {}
+        for id_fila, jefe, supervisado in Supervision.objects.values_list('id', 'from_trabajador_id', 'to_trabajador_id'):
+            existentes[(jefe, supervisado)] = id_fila
+        sobrantes = [id_fila for par, id_fila in existentes.items() if par[0] in sincronizados and par not in deseados]
+        faltantes = deseados - existentes.keys()
+
+        for trozo in _trozos(sobrantes, self.tamano_lote):
+            Supervision.objects.filter(id__in=trozo).delete()
+        Supervision.objects.bulk_create(
+            [Supervision(from_trabajador_id=jefe, to_trabajador_id=supervisado) for jefe, supervisado in faltantes],
+            batch_size=self.tamano_lote
+        )
+        self.estadisticas['jefaturas_completadas'] += len(pendientes)
+        self.estadisticas['supervisiones_creadas'] += len(faltantes)
+        self.estadisticas['supervisiones_eliminadas'] += len(sobrantes)
+
+    # ---------- Ejecución ----------
+
+    def ejecutar(self, personas, simular=False):
+        """Sincronizar y devolver estadísticas; con simular=True se revierte al final"""
+        inicio = time.time()
+        self.variantes = {}  # clave del departamento -> Counter de formas escritas
+        self.vistos = {}  # DN en minúsculas -> DN
+        self.nombres = {}
+        self.managers = {}
+        self.escritos = {}  # DN en minúsculas -> (DN guardado, valores escritos o vigentes)
+
+        with self._fase('lectura'):
+            personas = list(personas)
+        self.estadisticas['personas_leidas'] = len(personas)
+        dns_leidos = {str(p.get('distinguishedName') or '').strip().lower() for p in personas} - {''}
+
+        with transaction.atomic():
+            with self._fase('existentes'):
+                self._cargar_existentes(dns_leidos)
+
+            for lote in _trozos(personas, self.tamano_lote):
+                with self._fase('trabajadores'):
+                    self._escribir_lote(lote)
+
+            with self._fase('departamentos'):
+                self._completar_departamentos()
+                self._desactivar_retirados()
+            with self._fase('jerarquia'):
+                self._sincronizar_jefaturas()
+            with self._fase('cierre'):
+                # Las escrituras masivas en la tabla intermedia no emiten m2m_changed
+                self.estadisticas.update(reconstruir_cierre())
+            with self._fase('indice_fts'):
+                reconstruir_indice_fts()
+
+            if simular:
+                transaction.set_rollback(True)
+
+        segundos = time.time() - inicio
+        estadisticas = dict(self.estadisticas)
+        estadisticas['segundos'] = round(segundos, 2)
+        estadisticas['filas_por_segundo'] = round(self.estadisticas['personas_leidas'] / segundos) if segundos else 0
+        estadisticas['fases'] = dict(self.fases)
+        estadisticas['simulacion'] = simular
+        logger.info(f"🗄️ Directorio sincronizado en la base de datos: {estadisticas}")
+        return estadisticas
+
+
+def sincronizar_directorio(personas, tamano_lote=TAMANO_LOTE_SINCRONIZACION, simular=False):
+    """Copiar el directorio (cualquier iterable de personas) a Trabajador/Departamento"""
+    return SincronizacionDirectorio(tamano_lote).ejecutar(personas, simular=simular)
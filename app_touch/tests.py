@@ -0,0 +1,1600 @@
+import os
+import random
+import threading
+import time
+from collections import Counter
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import SimpleTestCase, TestCase, override_settings
+from ldap3.core.exceptions import LDAPException
+from rest_framework.test import APIRequestFactory
+
+from app_touch import busqueda_fts, busqueda_universal, cargos, directorio, ejecutor, ldap_helpers, views
+from app_touch.busqueda import MAX_SUGERENCIAS, IndiceBusqueda, IndiceSugerencias, calidad_coincidencia, palabras
+from app_touch.cache_helpers import MIN_BYTES_CAS, PREFIJO_PAYLOAD, cache_get_contenido, cache_set_contenido
+from app_touch.cargos import REGLAS_CARGO_POR_DEFECTO, ClasificadorCargos
+from app_touch.cierre_supervision import reconstruir_cierre
+from app_touch.jerarquia import IndiceAncestros, MotorJerarquia, construir_arbol_departamentos
+from app_touch.layout_arbol import LayoutArbol
+from app_touch.models import CierreSupervision, Departamento, Mapa, ProcedimientoEmergencia, Trabajador, Ubicacion
+from app_touch.sincronizacion import sincronizar_directorio
+
+CACHE_LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def payload_grande(valor=1):
+    return {'valor': valor, 'resultados': ['x' * 100] * (MIN_BYTES_CAS // 100)}
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class CacheContenidoTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_payload_chico_va_directo_bajo_su_clave(self):
+        self.assertIsNone(cache_set_contenido('a', {'x': 1}, 60))
+        self.assertEqual(cache.get('a'), {'x': 1})
+        self.assertEqual(cache_get_contenido('a'), {'x': 1})
+
+    def test_claves_con_el_mismo_contenido_comparten_payload(self):
+        payload = payload_grande()
+        digest = cache_set_contenido('a', payload, 60)
+        self.assertEqual(cache_set_contenido('b', payload, 60), digest)
+        self.assertEqual(cache_get_contenido('a'), payload)
+        self.assertEqual(cache_get_contenido('b'), payload)
+
+    def test_timeout_corto_no_acorta_el_payload_compartido(self):
+        cache_set_contenido('larga', payload_grande(), 3600)
+        digest = cache_set_contenido('corta', payload_grande(), 1)
+        _, expira, _ = cache.get(f"{PREFIJO_PAYLOAD}{digest}")
+        self.assertGreater(expira, time.time() + 3000)
+
+    def test_timeout_mas_largo_extiende_el_payload(self):
+        cache_set_contenido('corta', payload_grande(), 1)
+        digest = cache_set_contenido('larga', payload_grande(), 3600)
+        _, expira, _ = cache.get(f"{PREFIJO_PAYLOAD}{digest}")
+        self.assertGreater(expira, time.time() + 3000)
+
+    def test_referencia_huerfana_es_un_miss(self):
+        digest = cache_set_contenido('a', payload_grande(), 60)
+        cache.delete(f"{PREFIJO_PAYLOAD}{digest}")
+        self.assertIsNone(cache_get_contenido('a'))
+        self.assertIsNone(cache.get('a'))
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'OPTIONS': {'MAX_ENTRIES': 10},
+    }})
+    def test_respuestas_chicas_distintas_usan_una_fila_cada_una(self):
+        for i in range(10):
+            cache_set_contenido(f'q{i}', {'resultados': [i]}, 60)
+        self.assertEqual([cache_get_contenido(f'q{i}') for i in range(10)], [{'resultados': [i]} for i in range(10)])
+        self.assertEqual(len(cache._cache), 10)
+
+
+def persona(i, **extra):
+    datos = {
+        'givenName': f'Nombre{i}', 'sn': f'Apellido{i}', 'mail': f'p{i}@cmf.cl', 'title': 'Analista',
+        'department': 'TI', 'telephoneNumber': None, 'lastLogonTimestamp': None, 'company': directorio.COMPANIA,
+        'userAccountControl': 512, 'manager': None, 'distinguishedName': f'CN=P{i},OU=U,DC=cmf,DC=cl',
+        'DisplayName': None, 'activo': True,
+    }
+    datos.update(extra)
+    return datos
+
+
+class DirectorioEnMemoriaTests(SimpleTestCase):
+    def setUp(self):
+        self.estado = (directorio._snapshot, directorio._ultimo_error, directorio._reintentar_en,
+                       directorio._filtro_correos, directorio._filtro_reintentar_en)
+        directorio._snapshot = None
+        directorio._ultimo_error = None
+        directorio._reintentar_en = 0.0
+        directorio._filtro_correos = None
+        directorio._filtro_reintentar_en = 0.0
+
+    def tearDown(self):
+        (directorio._snapshot, directorio._ultimo_error, directorio._reintentar_en,
+         directorio._filtro_correos, directorio._filtro_reintentar_en) = self.estado
+
+    def vencido(self):
+        snapshot = directorio.DirectorioSnapshot([persona(1)])
+        snapshot.cargado_en = time.time() - directorio.DIRECTORIO_TTL - 1
+        directorio._snapshot = snapshot
+        return snapshot
+
+    def test_fallo_sin_snapshot_no_reintenta_ldap_hasta_el_plazo(self):
+        with mock.patch.object(directorio, 'cargar_directorio', side_effect=LDAPException('caído')) as cargar:
+            for _ in range(3):
+                with self.assertRaises(LDAPException):
+                    directorio.obtener_directorio()
+        self.assertEqual(cargar.call_count, 1)
+
+    def test_fallo_con_snapshot_vencido_lo_sigue_sirviendo(self):
+        vencido = self.vencido()
+        with mock.patch.object(directorio, 'cargar_directorio', side_effect=LDAPException('caído')) as cargar:
+            self.assertIs(directorio.obtener_directorio(), vencido)
+            self.assertIs(directorio.obtener_directorio(), vencido)
+        self.assertEqual(cargar.call_count, 1)
+
+    def test_recarga_en_curso_no_bloquea_a_los_demas(self):
+        vencido = self.vencido()
+        with directorio._snapshot_lock:
+            resultado = []
+            hilo = threading.Thread(target=lambda: resultado.append(directorio.obtener_directorio()))
+            hilo.start()
+            hilo.join(timeout=2)
+        self.assertFalse(hilo.is_alive())
+        self.assertIs(resultado[0], vencido)
+
+    def test_filtro_de_correos_solo_descarta_con_snapshot_reciente(self):
+        directorio._snapshot = directorio.DirectorioSnapshot([persona(1)])
+        self.assertTrue(directorio.correo_puede_existir('P1@cmf.cl'))
+        self.assertFalse(directorio.correo_puede_existir('nuevo@cmf.cl'))
+
+        directorio._snapshot.cargado_en = time.time() - directorio.DIRECTORIO_NEGATIVO_TTL - 1
+        with mock.patch.object(directorio, '_refrescar_filtro_en_segundo_plano') as refrescar:
+            self.assertTrue(directorio.correo_puede_existir('nuevo@cmf.cl'))
+        refrescar.assert_called_once()
+
+    def test_filtro_refrescado_mantiene_el_no_entre_recargas(self):
+        directorio._snapshot = directorio.DirectorioSnapshot([persona(1)])
+        directorio._snapshot.cargado_en = time.time() - directorio.DIRECTORIO_TTL / 2
+        with mock.patch.object(directorio, 'iterar_correos', return_value=iter(['p1@cmf.cl', 'nuevo@cmf.cl'])):
+            directorio.refrescar_filtro_correos()
+
+        with mock.patch.object(directorio, '_refrescar_filtro_en_segundo_plano') as refrescar:
+            self.assertTrue(directorio.correo_puede_existir('Nuevo@cmf.cl'))
+            self.assertFalse(directorio.correo_puede_existir('desconocido@cmf.cl'))
+            refrescar.assert_not_called()
+
+            # Vencido el filtro refrescado se vuelve a preguntar a LDAP y se pide otro
+            filtro, construido_en = directorio._filtro_correos
+            directorio._filtro_correos = (filtro, construido_en - directorio.DIRECTORIO_NEGATIVO_TTL - 1)
+            self.assertTrue(directorio.correo_puede_existir('desconocido@cmf.cl'))
+        refrescar.assert_called_once()
+
+    @override_settings(CACHES=CACHE_LOCAL)
+    def test_correo_desconocido_no_consulta_ldap_con_filtro_reciente(self):
+        cache.clear()
+        directorio._snapshot = directorio.DirectorioSnapshot([persona(1)])
+        directorio._snapshot.cargado_en = time.time() - directorio.DIRECTORIO_TTL / 2
+        with mock.patch.object(directorio, 'iterar_correos', return_value=iter(['p1@cmf.cl'])):
+            directorio.refrescar_filtro_correos()
+
+        with mock.patch.object(views.LDAPConnectionManager, 'get_connection') as conectar:
+            respuesta = views.trabajador_detail_ldap(
+                APIRequestFactory().get('/api/ldap/trabajador/', {'correo': 'desconocido@cmf.cl'}))
+        self.assertEqual(respuesta.status_code, 404)
+        conectar.assert_not_called()
+
+    def test_filtro_sin_snapshot_no_carga_ldap_en_la_request(self):
+        with mock.patch.object(directorio, '_recargar_en_segundo_plano') as recargar:
+            self.assertTrue(directorio.correo_puede_existir('nuevo@cmf.cl'))
+        recargar.assert_called_once()
+
+
+# ========== CACHE DE CONSULTAS LDAP ==========
+
+class ConexionFalsa:
+    """Conexión LDAP que responde según el atributo de cada filtro y registra las búsquedas"""
+
+    def __init__(self, entradas, busquedas):
+        self.entradas, self.busquedas, self.entries = entradas, busquedas, []
+
+    def search(self, search_base, search_filter, attributes, size_limit=0):
+        self.busquedas.append((search_filter, attributes))
+        clave = 'manager' if '(manager=' in search_filter else 'mail'
+        self.entries = [
+            mock.Mock(entry_attributes_as_dict=entrada) for entrada in self.entradas
+            if f"({clave}={entrada[clave][0].lower()})" in search_filter.lower()
+        ]
+
+    def unbind(self):
+        pass
+
+
+@override_settings(CACHES=CACHE_LOCAL, LDAP_CONFIG={'BASE_DN': 'DC=cmf,DC=cl'})
+class ConsultasLdapCompartidasTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        ldap_helpers._estadisticas_consultas.clear()
+        self.busquedas = []
+        entradas = [
+            {'givenName': ['Ana'], 'sn': ['Pérez'], 'mail': ['ana@cmf.cl'], 'title': ['Jefa de Turno'],
+             'distinguishedName': ['CN=Ana,OU=U,DC=cmf,DC=cl'], 'manager': ['CN=Otro,OU=U,DC=cmf,DC=cl'],
+             'userAccountControl': [512], 'company': ['Envases CMF S.A.']},
+            {'givenName': ['Juan'], 'sn': ['Soto'], 'mail': ['juan@cmf.cl'], 'title': ['Operario'],
+             'distinguishedName': ['CN=Juan,OU=U,DC=cmf,DC=cl'], 'manager': ['CN=Ana,OU=U,DC=cmf,DC=cl'],
+             'userAccountControl': [512], 'company': ['Envases CMF S.A.']},
+        ]
+        for nombre, valor in (('directorio_en_memoria', None), ('correo_puede_existir', True)):
+            patcher = mock.patch.object(views, nombre, return_value=valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(views.LDAPConnectionManager, 'get_connection',
+                                    side_effect=lambda: ConexionFalsa(entradas, self.busquedas))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def detalle(self, correo):
+        return views.trabajador_detail_ldap(APIRequestFactory().get('/api/ldap/trabajador/', {'correo': correo}))
+
+    def lote(self, correos):
+        return views.trabajadores_batch_ldap(APIRequestFactory().post('/api/ldap/trabajadores/lote/', {'correos': correos}, format='json'))
+
+    def test_detalle_y_lote_comparten_las_busquedas_en_ad(self):
+        detalle = self.detalle('ana@cmf.cl')
+        self.assertEqual(detalle.status_code, 200)
+        self.assertEqual([s['mail'] for s in detalle.data['supervisa_a']], ['juan@cmf.cl'])
+        # Una búsqueda por correo y otra por manager, ambas con el perfil completo de atributos
+        self.assertEqual(len(self.busquedas), 2)
+        self.assertTrue(all(atributos == ldap_helpers.PERFILES_ATRIBUTOS['persona'] for _, atributos in self.busquedas))
+
+        cache.delete('trabajador_detail_ana@cmf.cl')
+        lote = self.lote(['ana@cmf.cl'])
+        self.assertEqual(lote.data['resultados']['ana@cmf.cl'], detalle.data)
+        self.assertEqual(len(self.busquedas), 2)
+
+        estadisticas = ldap_helpers.estadisticas_consultas_ldap()
+        forma_correo = '(&(company=?)(mail=?)(objectclass=person))'
+        self.assertEqual(estadisticas[forma_correo], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_lote_resuelve_con_una_busqueda_or_escapada(self):
+        lote = self.lote([' Ana@cmf.cl', 'ana@cmf.cl', 'x*)(mail=*', 'nadie@cmf.cl'])
+
+        self.assertEqual(lote.status_code, 200)
+        self.assertEqual(list(lote.data['resultados']), ['ana@cmf.cl', 'x*)(mail=*', 'nadie@cmf.cl'])
+        ana = lote.data['resultados']['ana@cmf.cl']
+        self.assertEqual((ana['mail'], [s['mail'] for s in ana['supervisa_a']]), ('ana@cmf.cl', ['juan@cmf.cl']))
+        self.assertEqual(lote.data['resultados']['x*)(mail=*'], {'error': 'Trabajador no encontrado'})
+        self.assertEqual(lote.data['resultados']['nadie@cmf.cl'], {'error': 'Trabajador no encontrado'})
+
+        # Una búsqueda OR por correo (con los caracteres especiales escapados) y otra por manager
+        self.assertEqual(len(self.busquedas), 2)
+        filtro_correos = self.busquedas[0][0]
+        self.assertIn('(mail=x\\2a\\29\\28mail=\\2a)', filtro_correos)
+        self.assertEqual(filtro_correos.count('(mail='), 3)
+        self.assertIn('(manager=CN=Ana,OU=U,DC=cmf,DC=cl)', self.busquedas[1][0])
+
+        # Todo queda en cache bajo las claves del detalle individual
+        self.assertEqual(self.detalle('nadie@cmf.cl')['X-Cache'], 'HIT')
+        self.assertEqual(self.lote(['ana@cmf.cl', 'nadie@cmf.cl']).data['cache_hits'], 2)
+        self.assertEqual(len(self.busquedas), 2)
+
+    def test_lote_invalido(self):
+        self.assertEqual(self.lote('ana@cmf.cl').status_code, 400)
+        self.assertEqual(self.lote(['ana@cmf.cl', 1]).status_code, 400)
+        demasiados = [f'p{i}@cmf.cl' for i in range(views.MAX_CORREOS_LOTE + 1)]
+        self.assertEqual(self.lote(demasiados).status_code, 400)
+        self.assertEqual(self.busquedas, [])
+
+    def test_busqueda_de_respaldo_comparte_consultas_equivalentes(self):
+        views.buscar_personas_en_ad(APIRequestFactory().get('/api/ldap/search/', {'q': 'ana perez'}), 'ana perez')
+        views.buscar_personas_en_ad(APIRequestFactory().get('/api/ldap/search/', {'q': 'Perez  ANA'}), 'Perez  ANA')
+        self.assertEqual(len(self.busquedas), 1)
+
+    def test_filtros_equivalentes_tienen_la_misma_forma_normalizada(self):
+        self.assertEqual(
+            ldap_helpers.normalizar_filtro('(&(objectClass=person)(mail=Ana@CMF.cl)(company=Envases CMF S.A.))'),
+            ldap_helpers.normalizar_filtro('(&(company=envases  cmf s.a.)(|(mail=ana@cmf.cl))(objectClass=person))'),
+        )
+        self.assertNotEqual(ldap_helpers.normalizar_filtro('(|(mail=a)(mail=b))'),
+                            ldap_helpers.normalizar_filtro('(&(mail=a)(mail=b))'))
+
+    def test_filtro_sin_escapar_se_consulta_sin_cache(self):
+        conectar = lambda: ConexionFalsa([], self.busquedas)
+        with self.assertLogs(ldap_helpers.logger, 'WARNING'):
+            for _ in range(2):
+                self.assertEqual(ldap_helpers.buscar_entradas_cacheadas('(mail=a(b)', conectar=conectar), [])
+        self.assertEqual(len(self.busquedas), 2)
+        self.assertEqual(ldap_helpers.estadisticas_consultas_ldap()['invalido']['misses'], 2)
+
+
+# ========== JERARCAS: MOTOR VS. ALGORITMO ORIGINAL ==========
+
+TITULOS = [
+    'Gerente General', 'Gerente de Finanzas', 'Gerente Comercial', 'Subgerente TI', 'Subgerente de Planta',
+    'Jefe de Turno', 'Jefa de Calidad', 'Especialista SAP', 'Coordinadora', 'Encargado Bodega',
+    'Analista', 'Operario', 'Asistente', '', None,
+]
+DEPARTAMENTOS = ['Finanzas', 'TI', 'Producción', 'Bodega', 'Calidad', 'Ventas', 'Mantención', 'Logística']
+
+
+def dn(i):
+    return f'CN=P{i},OU=U,DC=cmf,DC=cl'
+
+
+def directorio_sintetico(total, semilla):
+    """Organización aleatoria con ciclos, managers fuera del directorio y empates de cargo"""
+    azar = random.Random(semilla)
+    personas = []
+    for i in range(total):
+        sorteo = azar.random()
+        if i == 0 or sorteo < 0.08:
+            manager = None
+        elif sorteo < 0.12:
+            manager = f'CN=Externo{i},OU=U,DC=cmf,DC=cl'  # huérfano: el manager no está en el directorio
+        elif sorteo < 0.2:
+            manager = dn(azar.randrange(i, total))  # hacia adelante: puede cerrar ciclos
+        else:
+            manager = dn(azar.randrange(0, i))
+        personas.append(persona(
+            i, title=azar.choice(TITULOS), department=azar.choice(DEPARTAMENTOS), manager=manager
+        ))
+
+    # Ciclos explícitos, dentro de un departamento y entre departamentos
+    for a, b in azar.sample([(x, x + 1) for x in range(1, total - 1, 7)], 4):
+        personas[a]['manager'], personas[b]['manager'] = dn(b), dn(a)
+        if azar.random() < 0.5:
+            personas[b]['department'] = personas[a]['department']
+    return personas
+
+
+def clasificador_original(titulo):
+    """es_cargo_jerarquico_valido / obtener_prioridad_jerarquia anteriores a las reglas compiladas"""
+    if not titulo:
+        return False, 999
+    titulo = titulo.lower()
+    cargos = ['gerente general', 'gerente', 'subgerente', 'jefe', 'jefa', 'especialista',
+              'encargado', 'encargada', 'coordinador', 'coordinadora']
+    prioridades = {'gerente general': 1, 'gerente': 2, 'subgerente': 3, 'jefe': 4, 'jefa': 4, 'especialista': 4,
+                   'coordinador': 5, 'coordinadora': 5, 'encargado': 5, 'encargada': 5}
+    es_valido = any(cargo in titulo for cargo in cargos)
+    prioridad = next((p for cargo, p in prioridades.items() if cargo in titulo), 999)
+    return es_valido, prioridad
+
+
+def jerarca_original(personas_departamento, todas_las_personas, clasificar):
+    """encontrar_jerarca_departamento tal como estaba antes de MotorJerarquia"""
+    if not personas_departamento:
+        return None
+
+    def prioridad(p):
+        return clasificar(p.get('title', ''))[1]
+
+    jefes_internos = [p for p in personas_departamento if p.get('title') and clasificar(p['title'])[0]]
+    if jefes_internos:
+        return sorted(jefes_internos, key=prioridad)[0]
+
+    managers_jerarquicos = {}
+    for p in personas_departamento:
+        if p.get('manager'):
+            for candidato in todas_las_personas:
+                if candidato['distinguishedName'] == p['manager']:
+                    if candidato.get('title') and clasificar(candidato['title'])[0]:
+                        managers_jerarquicos[p['manager']] = candidato
+                    break
+    if managers_jerarquicos:
+        return sorted(managers_jerarquicos.values(), key=prioridad)[0]
+
+    managers_genericos = {}
+    for p in personas_departamento:
+        if p.get('manager'):
+            for candidato in todas_las_personas:
+                if candidato['distinguishedName'] == p['manager']:
+                    managers_genericos[p['manager']] = candidato
+                    break
+    if managers_genericos:
+        return sorted(managers_genericos.values(), key=prioridad)[0]
+
+    sin_manager = [p for p in personas_departamento if not p.get('manager')]
+    if sin_manager:
+        return sin_manager[0]
+    return personas_departamento[0]
+
+
+class MotorConClasificador(MotorJerarquia):
+    """Motor con un clasificador fijo (sin leer ReglaCargo de la base de datos)"""
+
+    def __init__(self, personas, clasificar):
+        self._clasificar = clasificar
+        super().__init__(personas)
+
+    def clasificar(self, persona):
+        return self._clasificar(persona.get('title'))
+
+
+def clasificador_por_defecto():
+    clasificador = ClasificadorCargos(REGLAS_CARGO_POR_DEFECTO)
+    return lambda titulo: clasificador.clasificar(str(titulo or ''))
+
+
+class MotorJerarquiaTests(SimpleTestCase):
+    def comparar(self, personas, clasificar):
+        motor = MotorConClasificador(personas, clasificar)
+        jerarcas = motor.resolver_jerarcas()
+        por_departamento = {}
+        for p in personas:
+            por_departamento.setdefault(p['department'], []).append(p)
+
+        self.assertEqual(set(jerarcas), set(por_departamento))
+        for departamento, miembros in por_departamento.items():
+            esperado = jerarca_original(miembros, personas, clasificar)
+            self.assertIs(jerarcas[departamento], esperado, departamento)
+
+    def desordenado(self, personas, semilla):
+        """Las personas en un orden de lectura cualquiera (ni por DN ni por creación)"""
+        random.Random(semilla).shuffle(personas)
+        return personas
+
+    def test_mismo_jerarca_que_el_algoritmo_original(self):
+        for semilla in range(25):
+            with self.subTest(semilla=semilla):
+                self.comparar(self.desordenado(directorio_sintetico(300, semilla), semilla), clasificador_original)
+
+    def test_mismo_jerarca_con_las_reglas_por_defecto(self):
+        clasificar = clasificador_por_defecto()
+        for semilla in range(25):
+            with self.subTest(semilla=semilla):
+                self.comparar(self.desordenado(directorio_sintetico(300, semilla), semilla), clasificar)
+
+    def test_departamentos_pequenos_con_empates_y_huerfanos(self):
+        # Departamentos de 1 a 3 personas: más casos en que deciden los managers y el orden
+        for semilla in range(25):
+            personas = directorio_sintetico(60, semilla)
+            for i, p in enumerate(personas):
+                p['department'] = f'Área {i // 3}' if i % 5 else f'Área {i}'
+            with self.subTest(semilla=semilla):
+                self.comparar(self.desordenado(personas, semilla), clasificador_original)
+
+    def test_empates_por_orden_de_lectura_y_no_por_dn(self):
+        def jerarca(personas):
+            return MotorConClasificador(personas, clasificador_original).resolver_jerarcas()['TI']['givenName']
+
+        # 1. Dos jefes con la misma prioridad
+        jefes = [persona(2, title='Jefe de Turno'), persona(1, title='Jefa de Calidad')]
+        self.assertEqual(jerarca(jefes), 'Nombre2')
+        self.assertEqual(jerarca(jefes[::-1]), 'Nombre1')
+
+        # 3. Dos managers sin cargo jerárquico, fuera del departamento
+        reportes = [
+            persona(5, department='Bodega'), persona(4, department='Bodega'),
+            persona(3, manager=dn(5)), persona(6, manager=dn(4)),
+        ]
+        self.assertEqual(jerarca(reportes), 'Nombre5')
+        self.assertEqual(jerarca(reportes[:2] + reportes[:1:-1]), 'Nombre4')
+
+        # 4. Primera persona sin manager
+        sin_manager = [persona(9), persona(8), persona(7, manager='CN=Externo,OU=U,DC=cmf,DC=cl')]
+        self.assertEqual(jerarca(sin_manager), 'Nombre9')
+        self.assertEqual(jerarca(sin_manager[1::-1] + sin_manager[2:]), 'Nombre8')
+
+        # 5. Primera persona del departamento
+        externos = [persona(i, manager='CN=Externo,OU=U,DC=cmf,DC=cl') for i in (11, 10)]
+        self.assertEqual(jerarca(externos), 'Nombre11')
+        self.assertEqual(jerarca(externos[::-1]), 'Nombre10')
+
+    def test_dn_duplicado_usa_la_primera_aparicion(self):
+        personas = [
+            persona(1, title='Analista', department='TI', manager=dn(2)),
+            persona(2, title='Operario', department='Bodega'),
+            persona(3, title='Gerente General', department='Gerencia', distinguishedName=dn(2)),
+        ]
+        self.comparar(personas, clasificador_original)
+        self.assertEqual(MotorConClasificador(personas, clasificador_original).resolver_jerarcas()['TI']['givenName'],
+                         'Nombre2')
+
+
+# ========== CADENA DE MANDO Y JEFE COMÚN ==========
+
+class IndiceAncestrosTests(SimpleTestCase):
+    """Binary lifting contra recorrer los managers uno a uno"""
+
+    def cadena_ingenua(self, indice, persona_id):
+        cadena = []
+        actual = indice.padre[persona_id]
+        while actual != -1:
+            self.assertLessEqual(len(cadena), len(indice.personas), 'quedó un ciclo sin cortar')
+            cadena.append(actual)
+            actual = indice.padre[actual]
+        return cadena
+
+    def jefe_comun_ingenuo(self, indice, a, b):
+        de_b = set([b] + self.cadena_ingenua(indice, b))
+        return next((x for x in [a] + self.cadena_ingenua(indice, a) if x in de_b), -1)
+
+    def manager_original(self, indice, persona_id):
+        manager = indice.personas[persona_id].get('manager')
+        return indice.id_por_dn.get(manager, -1) if manager else -1
+
+    def ciclos_originales(self, indice):
+        """Ciclos (como conjuntos de ids) de la relación persona -> manager sin cortar"""
+        ciclos = set()
+        for inicio in range(len(indice.personas)):
+            camino = []
+            actual = inicio
+            while actual != -1 and actual not in camino:
+                camino.append(actual)
+                actual = self.manager_original(indice, actual)
+            if actual != -1:
+                ciclos.add(frozenset(camino[camino.index(actual):]))
+        return ciclos
+
+    def test_igual_que_recorrer_los_managers(self):
+        for semilla in range(10):
+            indice = IndiceAncestros(directorio_sintetico(250, semilla))
+            azar = random.Random(semilla)
+            total = len(indice.personas)
+            with self.subTest(semilla=semilla):
+                for i in range(total):
+                    cadena = self.cadena_ingenua(indice, i)
+                    self.assertEqual(indice.cadena_de_mando(i), cadena)
+                    self.assertEqual(indice.profundidad[i], len(cadena))
+                    for niveles in (0, 1, 2, 5, len(cadena), len(cadena) + 1):
+                        esperado = ([i] + cadena)[niveles] if niveles <= len(cadena) else -1
+                        self.assertEqual(indice.ancestro(i, niveles), esperado)
+
+                pares = [(azar.randrange(total), azar.randrange(total)) for _ in range(2000)]
+                pares += [(i, indice.padre[i]) for i in range(total) if indice.padre[i] != -1][:50]
+                for a, b in pares:
+                    self.assertEqual(indice.jefe_comun(a, b), self.jefe_comun_ingenuo(indice, a, b), (a, b))
+
+    def test_un_corte_por_ciclo_y_ningun_otro_cambio(self):
+        for semilla in range(10):
+            indice = IndiceAncestros(directorio_sintetico(250, semilla))
+            ciclos = self.ciclos_originales(indice)
+            with self.subTest(semilla=semilla):
+                self.assertTrue(ciclos)
+                self.assertEqual(len(indice.ciclos_cortados), len(ciclos))
+                for ciclo in ciclos:
+                    self.assertEqual(len(ciclo & set(indice.ciclos_cortados)), 1)
+                for i in range(len(indice.personas)):
+                    if i not in indice.ciclos_cortados:
+                        self.assertEqual(indice.padre[i], self.manager_original(indice, i))
+
+    def test_ciclo_y_arboles_distintos(self):
+        # 1 -> 2 -> 3 -> 1 con 4 bajo 3; 5 -> 6 es otra cadena; 7 tiene un manager fuera del directorio
+        indice = IndiceAncestros([
+            persona(1, manager=dn(2)), persona(2, manager=dn(3)), persona(3, manager=dn(1)),
+            persona(4, manager=dn(3)), persona(5, manager=dn(6)), persona(6),
+            persona(7, manager='CN=Externo,OU=U,DC=cmf,DC=cl'),
+        ])
+        uno, _, tres, cuatro, cinco, seis, siete = (indice.buscar(f'p{i}@cmf.cl') for i in range(1, 8))
+        self.assertEqual(indice.ciclos_cortados, [uno])
+        self.assertEqual(indice.cadena_de_mando(cuatro), [tres, uno])
+        self.assertEqual(indice.jefe_comun(cuatro, uno), uno)
+        self.assertEqual(indice.jefe_comun(cinco, seis), seis)
+        self.assertEqual(indice.jefe_comun(cuatro, cinco), -1)
+        self.assertEqual(indice.jefe_comun(siete, siete), siete)
+        self.assertEqual(indice.jefe_comun(siete, uno), -1)
+
+    def test_endpoint_sin_jefe_comun(self):
+        snapshot = directorio.DirectorioSnapshot([
+            persona(1, title='Jefe de Turno'), persona(2, manager=dn(1)), persona(3), persona(4, manager=dn(3)),
+        ])
+        with mock.patch.object(views, 'obtener_directorio', return_value=snapshot):
+            distintos = views.get_jefe_comun(APIRequestFactory().get(
+                '/api/ldap/jefe-comun/', {'correo_a': 'p2@cmf.cl', 'correo_b': 'P4@cmf.cl'}))
+            mismo = views.get_jefe_comun(APIRequestFactory().get(
+                '/api/ldap/jefe-comun/', {'correo_a': 'p2@cmf.cl', 'correo_b': 'p1@cmf.cl'}))
+            cadena = views.get_cadena_mando(APIRequestFactory().get('/api/ldap/cadena-mando/', {'correo': 'p2@cmf.cl'}))
+
+        self.assertIsNone(distintos.data['jefe_comun'])
+        self.assertIsNone(distintos.data['distancia_a'])
+        self.assertEqual(mismo.data['jefe_comun']['mail'], 'p1@cmf.cl')
+        self.assertEqual((mismo.data['distancia_a'], mismo.data['distancia_b']), (1, 0))
+        self.assertEqual([j['mail'] for j in cadena.data['cadena']], ['p1@cmf.cl'])
+
+
+# ========== ENDPOINTS SOBRE EL SNAPSHOT ==========
+
+@mock.patch.object(ejecutor, 'EJECUTOR_PROCESOS', 0)
+class EstadisticasJefeTests(SimpleTestCase):
+    def test_indice_y_grafo_salen_del_mismo_snapshot(self):
+        # Jefe con 3 reportes; el snapshot siguiente solo tiene al jefe
+        equipo = [persona(0, title='Jefe de Turno')] + [persona(i, manager=dn(0)) for i in range(1, 4)]
+        antes = directorio.DirectorioSnapshot(equipo)
+        despues = directorio.DirectorioSnapshot([persona(0, title='Jefe de Turno')])
+
+        request = APIRequestFactory().get('/api/ldap/estadisticas-jefe/', {'correo': 'p0@cmf.cl'})
+        with mock.patch.object(views, 'obtener_directorio', side_effect=[antes, despues]):
+            response = views.get_estadisticas_jefe(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['reportes_directos'], 3)
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ReportesDirectosTests(SimpleTestCase):
+    def test_indice_igual_a_recorrer_el_directorio(self):
+        for semilla in range(5):
+            personas = directorio_sintetico(300, semilla)
+            for p in random.Random(semilla).sample(personas, 30):
+                p['userAccountControl'] = 514  # deshabilitada
+            snapshot = directorio.DirectorioSnapshot(personas)
+
+            for jefe in personas[:60]:
+                dn_jefe = jefe['distinguishedName']
+                esperados = [p for p in personas if p['manager'] and p['manager'].lower() == dn_jefe.lower()]
+                with self.subTest(semilla=semilla, jefe=dn_jefe):
+                    self.assertEqual(directorio.reportes_directos(snapshot, dn_jefe.upper()), esperados)
+                    self.assertEqual(views.supervisados_en_memoria(snapshot, jefe),
+                                     [s for s in map(views.datos_supervisado, esperados) if s])
+
+        self.assertEqual(directorio.reportes_directos(snapshot, None), [])
+        self.assertEqual(directorio.reportes_directos(snapshot, 'CN=Nadie,OU=U,DC=cmf,DC=cl'), [])
+
+    def test_detalle_con_directorio_no_consulta_ldap(self):
+        cache.clear()
+        snapshot = directorio.DirectorioSnapshot([
+            persona(0, title='Jefe de Turno'),
+            persona(1, manager=dn(0).lower()),
+            persona(2, manager=dn(0), userAccountControl=514),
+            persona(3, manager=dn(0), givenName=None),
+            persona(4, manager=dn(1)),
+        ])
+        request = APIRequestFactory().get('/api/ldap/trabajador/', {'correo': 'P0@cmf.cl'})
+        with mock.patch.object(views, 'directorio_en_memoria', return_value=snapshot), \
+                mock.patch.object(views, 'correo_puede_existir', return_value=True), \
+                mock.patch.object(views.LDAPConnectionManager, 'get_connection') as conectar:
+            respuesta = views.trabajador_detail_ldap(request)
+
+        conectar.assert_not_called()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual([s['mail'] for s in respuesta.data['supervisa_a']], ['p1@cmf.cl'])
+
+# ========== ÁRBOL DE DEPARTAMENTOS ==========
+
+def forma_arbol(nodos):
+    return {n['nombre']: forma_arbol(n['subordinados']) for n in nodos}
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+@mock.patch.object(ejecutor, 'EJECUTOR_PROCESOS', 0)
+@mock.patch.object(cargos, '_cargar_reglas', lambda: list(REGLAS_CARGO_POR_DEFECTO))
+class ArbolDepartamentosTests(SimpleTestCase):
+    def setUp(self):
+        cargos._clasificador = None
+
+    def organizacion(self):
+        """A y B se supervisan mutuamente; C reporta fuera del directorio y D cuelga de C"""
+        return [
+            persona(0, title='Jefe A', department='A', manager=dn(1)),
+            persona(1, title='Jefe B', department='B', manager=dn(0)),
+            persona(2, title='Jefe C', department='C', manager='CN=Externo,OU=U,DC=cmf,DC=cl'),
+            persona(3, title='Jefe D', department='D', manager=dn(2)),
+            persona(4, title='Operario', department='D', manager=dn(3)),
+        ]
+
+    def test_diagnostico_de_ciclos_y_huerfanos(self):
+        datos = views.construir_datos_arbol(directorio.DirectorioSnapshot(self.organizacion()))
+
+        self.assertEqual(forma_arbol(datos['estructura']), {'A': {'B': {}}, 'C': {'D': {}}})
+        diagnostico = datos['diagnostico']
+        self.assertEqual(diagnostico['ciclos'], [{'departamentos': ['A', 'B'], 'raiz_asignada': 'A'}])
+        self.assertEqual([h['departamento'] for h in diagnostico['huerfanos']], ['C'])
+        self.assertEqual(diagnostico['huerfanos'][0]['manager_dn'], 'CN=Externo,OU=U,DC=cmf,DC=cl')
+        self.assertEqual((diagnostico['total_ciclos'], diagnostico['total_huerfanos']), (1, 1))
+
+    def test_ciclo_toma_como_raiz_al_primero_de_la_entrada(self):
+        departamentos = [{'nombre': nombre} for nombre in ('Z', 'X', 'Y', 'W')]
+        arbol, ciclos = construir_arbol_departamentos(departamentos, {'X': 'Y', 'Y': 'Z', 'Z': 'X', 'W': 'Y'})
+
+        self.assertEqual(ciclos, [{'departamentos': ['Z', 'X', 'Y'], 'raiz_asignada': 'Z'}])
+        self.assertEqual(forma_arbol(arbol), {'Z': {'Y': {'X': {}, 'W': {}}}})
+
+    def test_cadena_profunda_sin_recursion(self):
+        total = 5000
+        departamentos = [{'nombre': f'D{i}'} for i in range(total)]
+        arbol, ciclos = construir_arbol_departamentos(departamentos, {f'D{i}': f'D{i - 1}' for i in range(1, total)})
+
+        self.assertEqual(ciclos, [])
+        nodo, profundidad = arbol[0], 1
+        while nodo['subordinados']:
+            nodo, profundidad = nodo['subordinados'][0], profundidad + 1
+        self.assertEqual((len(arbol), profundidad, nodo['nombre']), (1, total, f'D{total - 1}'))
+
+
+    def subarbol(self, snapshot, encabezados=None, **parametros):
+        request = APIRequestFactory().get('/api/ldap/arbol-jerarquico/subarbol/', parametros, **(encabezados or {}))
+        with mock.patch.object(views, 'obtener_directorio', return_value=snapshot):
+            return views.get_subarbol_jerarquico(request)
+
+    def test_subarbol_por_niveles_con_conteos(self):
+        snapshot = directorio.DirectorioSnapshot(self.organizacion())
+
+        raices = self.subarbol(snapshot)
+        self.assertEqual(raices.status_code, 200)
+        self.assertEqual(forma_arbol(raices.data['nodos']), {'A': {}, 'C': {}})
+        self.assertEqual([(n['total_subordinados'], n['total_descendientes'], n['tiene_subordinados'])
+                          for n in raices.data['nodos']], [(1, 1, True), (1, 1, True)])
+        self.assertNotIn('estadisticas', raices.data['nodos'][0])
+
+        rama = self.subarbol(snapshot, raiz='  c ', profundidad=2, estadisticas=1)
+        self.assertEqual(rama.data['raiz'], 'C')
+        self.assertEqual(forma_arbol(rama.data['nodos']), {'C': {'D': {}}})
+        hoja = rama.data['nodos'][0]['subordinados'][0]
+        self.assertEqual((hoja['tiene_subordinados'], hoja['estadisticas']['total_personal']), (False, 2))
+
+        sin_conteos = self.subarbol(snapshot, profundidad=99, conteos=0)
+        self.assertEqual(sin_conteos.data['profundidad'], views.MAX_PROFUNDIDAD_SUBARBOL)
+        self.assertEqual(forma_arbol(sin_conteos.data['nodos']), {'A': {'B': {}}, 'C': {'D': {}}})
+        self.assertNotIn('total_descendientes', sin_conteos.data['nodos'][0])
+
+    def test_subarbol_errores_y_etag(self):
+        snapshot = directorio.DirectorioSnapshot(self.organizacion())
+
+        self.assertEqual(self.subarbol(snapshot, raiz='Inexistente').status_code, 404)
+        self.assertEqual(self.subarbol(snapshot, profundidad='dos').status_code, 400)
+
+        etag = self.subarbol(snapshot)['ETag']
+        self.assertIn(snapshot.version, etag)
+        self.assertEqual(self.subarbol(snapshot, encabezados={'HTTP_IF_NONE_MATCH': etag}).status_code, 304)
+
+        otro = directorio.DirectorioSnapshot(self.organizacion() + [persona(5, department='E')])
+        self.assertEqual(self.subarbol(otro, encabezados={'HTTP_IF_NONE_MATCH': etag}).status_code, 200)
+
+    def test_layout_endpoint_por_ventana(self):
+        snapshot = directorio.DirectorioSnapshot(self.organizacion())
+        factory = APIRequestFactory()
+        with mock.patch.object(views, 'obtener_directorio', return_value=snapshot):
+            completo = views.get_layout_arbol(factory.get('/api/ldap/arbol-jerarquico/layout/'))
+            ventana = views.get_layout_arbol(factory.get('/api/ldap/arbol-jerarquico/layout/', {'y_min': 1}))
+            invalido = views.get_layout_arbol(factory.get('/api/ldap/arbol-jerarquico/layout/', {'x_max': 'ancho'}))
+            no_modificado = views.get_layout_arbol(factory.get(
+                '/api/ldap/arbol-jerarquico/layout/', HTTP_IF_NONE_MATCH=completo['ETag']))
+
+        self.assertEqual({n['nombre']: (n['x'], n['y']) for n in completo.data['nodos']},
+                         {'A': (0.0, 0.0), 'B': (0.0, 1.0), 'C': (1.0, 0.0), 'D': (1.0, 1.0)})
+        self.assertEqual((completo.data['total_nodos'], completo.data['ancho'], completo.data['alto']), (4, 1.0, 1.0))
+        self.assertEqual(completo.data['nodos'][2]['jefe'], 'Nombre2 Apellido2')
+        self.assertEqual([n['nombre'] for n in ventana.data['nodos']], ['B', 'D'])
+        self.assertEqual(invalido.status_code, 400)
+        self.assertEqual(no_modificado.status_code, 304)
+
+
+def arbol_aleatorio(total, azar):
+    """(raices, hijos) de un bosque al azar con nombres N0..N{total-1}"""
+    raices, hijos, nombres = [], {}, []
+    for i in range(total):
+        nombre = f'N{i}'
+        if not nombres or azar.random() < 0.05:
+            raices.append(nombre)
+        else:
+            hijos.setdefault(azar.choice(nombres[-30:]), []).append(nombre)
+        nombres.append(nombre)
+    return raices, hijos
+
+
+class LayoutArbolTests(SimpleTestCase):
+    def recorrer(self, raices, hijos):
+        """(nombre, padre, nivel) en preorden de izquierda a derecha"""
+        orden, pendientes = [], [(nombre, None, 0) for nombre in reversed(raices)]
+        while pendientes:
+            nombre, padre, nivel = pendientes.pop()
+            orden.append((nombre, padre, nivel))
+            pendientes.extend((hijo, nombre, nivel + 1) for hijo in reversed(hijos.get(nombre, ())))
+        return orden
+
+    def test_invariantes_del_layout(self):
+        for semilla in range(10):
+            azar = random.Random(semilla)
+            raices, hijos = arbol_aleatorio(400, azar)
+            layout = LayoutArbol(raices, hijos)
+            orden = self.recorrer(raices, hijos)
+            nodos = layout.nodos
+
+            with self.subTest(semilla=semilla):
+                self.assertEqual(len(nodos), 400)
+                self.assertEqual(min(n['x'] for n in nodos.values()), 0.0)
+                por_nivel = {}
+                for nombre, padre, nivel in orden:
+                    self.assertEqual((nodos[nombre]['y'], nodos[nombre]['padre']), (nivel, padre))
+                    por_nivel.setdefault(nivel, []).append(nodos[nombre]['x'])
+                    if hijos.get(nombre):
+                        # Padre centrado sobre su primer y último hijo
+                        centro = (nodos[hijos[nombre][0]]['x'] + nodos[hijos[nombre][-1]]['x']) / 2
+                        self.assertAlmostEqual(nodos[nombre]['x'], centro, places=3)
+                for xs in por_nivel.values():
+                    # Mismo nivel: de izquierda a derecha y separados al menos una unidad
+                    self.assertTrue(all(b - a >= 1 - 1e-3 for a, b in zip(xs, xs[1:])))
+
+                # recortar() coincide con filtrar todos los nodos por la ventana
+                ventana = {'x_min': azar.uniform(0, layout.ancho), 'y_min': 1, 'y_max': azar.randint(1, int(layout.alto) + 1)}
+                ventana['x_max'] = ventana['x_min'] + azar.uniform(1, 20)
+                esperados = [
+                    nombre for nombre, _, _ in orden
+                    if ventana['x_min'] <= nodos[nombre]['x'] <= ventana['x_max']
+                    and ventana['y_min'] <= nodos[nombre]['y'] <= ventana['y_max']
+                ]
+                self.assertEqual([n['nombre'] for n in layout.recortar(**ventana)], esperados)
+
+    def test_subarboles_iguales_se_dibujan_iguales(self):
+        hijos = {'R': ['A', 'B'], 'A': ['A1', 'A2', 'A3'], 'B': ['B1', 'B2', 'B3'], 'A2': ['A21'], 'B2': ['B21']}
+        nodos = LayoutArbol(['R'], hijos).nodos
+        for sufijo in ('1', '2', '3', '21'):
+            self.assertEqual(nodos['A' + sufijo]['x'] - nodos['A']['x'], nodos['B' + sufijo]['x'] - nodos['B']['x'])
+        self.assertEqual(nodos['R']['x'], (nodos['A']['x'] + nodos['B']['x']) / 2)
+
+    def test_cadena_profunda_sin_recursion(self):
+        total = 5000
+        layout = LayoutArbol(['N0'], {f'N{i}': [f'N{i + 1}'] for i in range(total - 1)})
+        self.assertEqual((layout.ancho, layout.alto), (0.0, total - 1))
+        self.assertEqual(layout.nodos['N0']['extension']['y_max'], total - 1)
+
+# ========== ÁRBOL INCREMENTAL VS. RECONSTRUCCIÓN ==========
+
+def mutar_directorio(personas, azar, siguiente_id, reordenar=0.02):
+    """Siguiente lectura del directorio: altas, bajas, traslados, cambios de manager y de cargo
+
+    Las altas quedan en posiciones al azar y una fracción `reordenar` de
+    las personas cambia de lugar en la lectura.
+    """
+    dns = [p['distinguishedName'] for p in personas]
+    nuevas = []
+    for p in personas:
+        sorteo = azar.random()
+        if sorteo < 0.02:
+            continue  # baja
+        p = dict(p)
+        if sorteo < 0.04:
+            p['department'] = azar.choice(DEPARTAMENTOS)
+        elif sorteo < 0.06:
+            p['manager'] = azar.choice(dns + [None, 'CN=Externo,OU=U,DC=cmf,DC=cl'])
+        elif sorteo < 0.08:
+            p['title'] = azar.choice(TITULOS)
+        elif sorteo < 0.09:
+            p['activo'] = not p['activo']
+        nuevas.append(p)
+
+    for i in range(siguiente_id, siguiente_id + max(1, len(personas) // 50)):
+        nuevas.insert(azar.randrange(len(nuevas) + 1), persona(
+            i, title=azar.choice(TITULOS), department=azar.choice(DEPARTAMENTOS), manager=azar.choice(dns)
+        ))
+    for _ in range(int(len(nuevas) * reordenar)):
+        nuevas.insert(azar.randrange(len(nuevas)), nuevas.pop(azar.randrange(len(nuevas))))
+    return nuevas
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+@mock.patch.object(ejecutor, 'EJECUTOR_PROCESOS', 0)
+@mock.patch.object(cargos, '_cargar_reglas', lambda: list(REGLAS_CARGO_POR_DEFECTO))
+class ArbolIncrementalTests(SimpleTestCase):
+    def setUp(self):
+        cargos._clasificador = None
+
+    def jerarcas(self, datos):
+        return {d: j['distinguishedName'] if j else None for d, j in datos['motor'].jerarcas.items()}
+
+    def test_incremental_igual_a_reconstruir(self):
+        for semilla in range(15):
+            azar = random.Random(semilla)
+            personas = directorio_sintetico(300, semilla)
+            azar.shuffle(personas)
+            anterior = directorio.DirectorioSnapshot(personas)
+            views.derivado_con_reglas(anterior, 'arbol_jerarquico', views.construir_datos_arbol)
+
+            for paso in range(4):
+                # El último paso devuelve a todos en otro orden: cambian los empates
+                personas = mutar_directorio(personas, azar, 1000 * (paso + 1), reordenar=1.0 if paso == 3 else 0.02)
+                snapshot = directorio.DirectorioSnapshot(personas)
+                snapshot.anterior = anterior
+                with mock.patch.object(views, 'construir_jerarquia_real_con_logica_existente') as completo:
+                    incremental = views.derivado_con_reglas(snapshot, 'arbol_jerarquico', views.construir_datos_arbol)
+                completo.assert_not_called()
+
+                desde_cero = views.construir_datos_arbol(directorio.DirectorioSnapshot(personas))
+                with self.subTest(semilla=semilla, paso=paso):
+                    self.assertEqual(incremental['estructura'], desde_cero['estructura'])
+                    self.assertEqual(incremental['diagnostico'], desde_cero['diagnostico'])
+                    self.assertEqual(self.jerarcas(incremental), self.jerarcas(desde_cero))
+                anterior = snapshot
+
+    def test_no_modifica_el_arbol_del_snapshot_anterior(self):
+        personas = directorio_sintetico(200, 1)
+        anterior = directorio.DirectorioSnapshot(personas)
+        previos = views.derivado_con_reglas(anterior, 'arbol_jerarquico', views.construir_datos_arbol)
+        jerarcas = self.jerarcas(previos)
+        nodos = dict(previos['nodos'])
+
+        snapshot = directorio.DirectorioSnapshot(mutar_directorio(personas, random.Random(1), 1000))
+        snapshot.anterior = anterior
+        views.derivado_con_reglas(snapshot, 'arbol_jerarquico', views.construir_datos_arbol)
+
+        self.assertIsNotNone(previos.get('motor'))
+        self.assertEqual(self.jerarcas(previos), jerarcas)
+        self.assertEqual(previos['nodos'], nodos)
+        self.assertEqual(previos['motor'].total_personas, len(previos['personas']))
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+@mock.patch.object(ejecutor, 'EJECUTOR_PROCESOS', 0)
+class ReglasCargoTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        cargos._clasificador = None
+        self.reglas = [('jefe', 1), ('coordinador', 2)]
+        patcher = mock.patch.object(cargos, '_cargar_reglas', lambda: list(self.reglas))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.snapshot = directorio.DirectorioSnapshot([
+            persona(1, title='Jefe de Soporte'),
+            persona(2, title='Coordinador TI', manager=dn(1)),
+            persona(3, manager=dn(2)),
+        ])
+        patcher = mock.patch.object(views, 'obtener_directorio', return_value=self.snapshot)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cambiar_reglas(self, reglas):
+        self.reglas = reglas
+        cargos.invalidar_reglas()
+
+    def jefe_departamento(self):
+        request = APIRequestFactory().get('/api/departamentos/TI/', {'include': 'jefe'})
+        response = views.get_departamento(request, departamento='TI')
+        self.assertEqual(response.status_code, 200)
+        return response.data['jefe']['mail'], response['ETag']
+
+    def jerarca_arbol(self):
+        return views.obtener_datos_arbol()['motor'].resolver_miembros(self.snapshot.personas_activas)
+
+    def test_cambio_de_reglas_llega_al_departamento_sin_nuevo_snapshot(self):
+        jefe, etag = self.jefe_departamento()
+        self.assertEqual(jefe, 'p1@cmf.cl')
+
+        self.cambiar_reglas([('jefe', 3), ('coordinador', 1)])
+        jefe_nuevo, etag_nuevo = self.jefe_departamento()
+        self.assertEqual(jefe_nuevo, 'p2@cmf.cl')
+        self.assertNotEqual(etag, etag_nuevo)
+
+    def test_cambio_de_reglas_llega_al_arbol_sin_nuevo_snapshot(self):
+        self.assertEqual(self.jerarca_arbol()['mail'], 'p1@cmf.cl')
+        etag = views.get_subarbol_jerarquico(APIRequestFactory().get('/api/arbol/subarbol/'))['ETag']
+
+        self.cambiar_reglas([('jefe', 3), ('coordinador', 1)])
+        self.assertEqual(self.jerarca_arbol()['mail'], 'p2@cmf.cl')
+        self.assertNotEqual(views.get_subarbol_jerarquico(APIRequestFactory().get('/api/arbol/subarbol/'))['ETag'], etag)
+
+    def test_calculo_en_el_pool_usa_las_reglas_del_proceso_que_lo_pide(self):
+        reglas = cargos.obtener_clasificador().reglas
+        cargos.fijar_reglas([('coordinador', 1)])
+        _, _, motor, _ = views.construir_jerarquia_real_con_logica_existente(self.snapshot.personas_activas, reglas)
+        self.assertEqual(motor.resolver_miembros(self.snapshot.personas_activas)['mail'], 'p1@cmf.cl')
+
+
+class RegistroDepartamentosTests(SimpleTestCase):
+    def ids(self, nombres):
+        personas = [persona(i, department=nombre) for i, nombre in enumerate(nombres)]
+        return {d.clave: d.id for d in directorio.RegistroDepartamentos(personas).departamentos}
+
+    def test_id_no_depende_de_los_demas_departamentos_ni_del_orden(self):
+        solo = self.ids(['I+D'])
+        todos = self.ids(['I.D', 'Producción', 'I D', 'I+D'])
+        self.assertEqual(todos['i+d'], solo['i+d'])
+        self.assertEqual(todos, self.ids(['I+D', 'I D', 'Producción', 'I.D']))
+        self.assertEqual(len(set(todos.values())), len(todos))
+        self.assertEqual(todos['produccion'], 'produccion')
+        self.assertEqual(todos['i d'], 'i-d')
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+@mock.patch.object(ejecutor, 'EJECUTOR_PROCESOS', 0)
+@mock.patch.object(cargos, '_cargar_reglas', lambda: list(REGLAS_CARGO_POR_DEFECTO))
+class RecursoDepartamentoTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        cargos._clasificador = None
+        self.snapshot = directorio.DirectorioSnapshot([
+            persona(1, title='Jefe de Producción', department='Producción'),
+            persona(2, department='PRODUCCION ', manager=dn(1)),
+        ])
+
+    def test_proceso_sin_directorio_responde_desde_cache_sin_cargar_ldap(self):
+        with mock.patch.object(views, 'snapshot_sin_bloquear', return_value=self.snapshot), \
+                mock.patch.object(views, 'obtener_directorio', return_value=self.snapshot):
+            recurso, cache_hit = views.obtener_recurso_departamento('Producción')
+        self.assertFalse(cache_hit)
+
+        with mock.patch.object(views, 'snapshot_sin_bloquear', return_value=None), \
+                mock.patch.object(views, 'obtener_directorio', side_effect=AssertionError('carga LDAP')):
+            for nombre in ('produccion', recurso['id'], 'PRODUCCION'):
+                self.assertEqual(views.obtener_recurso_departamento(nombre), (recurso, True))
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+@mock.patch.object(ejecutor, 'EJECUTOR_PROCESOS', 0)
+@mock.patch.object(cargos, '_cargar_reglas', lambda: list(REGLAS_CARGO_POR_DEFECTO))
+class AdaptadoresDepartamentoTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        cargos._clasificador = None
+        snapshot = directorio.DirectorioSnapshot([
+            persona(1, title='Jefe de Producción', department='Producción'),
+            persona(2, department='Producción', manager=dn(1)),
+            persona(3, department='Bodega', activo=False),
+        ])
+        for nombre in ('obtener_directorio', 'snapshot_sin_bloquear'):
+            patcher = mock.patch.object(views, nombre, return_value=snapshot)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def detalle(self, nombre):
+        return views.get_departamento_detalle(APIRequestFactory().get(f'/api/departamento/{nombre}/'), nombre_departamento=nombre)
+
+    def completo(self, nombre):
+        return views.departamento_completo(APIRequestFactory().get('/api/departamento-completo/', {'nombre': nombre}))
+
+    def test_jefe_con_la_forma_de_cada_endpoint(self):
+        jerarca = self.detalle('Producción').data['jerarca']
+        self.assertEqual(set(jerarca), {'givenName', 'sn', 'mail', 'title', 'telephoneNumber', 'manager', 'userAccountControl_enabled'})
+
+        jefe = self.completo('Producción').data['jefe']
+        self.assertEqual(set(jefe), {
+            'givenName', 'sn', 'mail', 'title', 'department', 'telephoneNumber', 'manager',
+            'distinguishedName', 'userAccountControl_enabled'
+        })
+        self.assertEqual(jefe['mail'], 'p1@cmf.cl')
+
+    def test_departamento_sin_activos_responde_vacio(self):
+        for response in (self.detalle('Bodega'), self.completo('Bodega')):
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['total_trabajadores'], 0)
+            self.assertEqual(response.data['trabajadores'], [])
+        self.assertIsNone(self.completo('Bodega').data['jefe'])
+        self.assertEqual(self.detalle('Finanzas').status_code, 404)
+
+    def test_error_inesperado_responde_con_el_mensaje_del_endpoint(self):
+        with mock.patch.object(views, 'construir_recurso_departamento', side_effect=KeyError('x')), \
+                self.assertLogs(views.logger, 'ERROR'):
+            detalle = self.detalle('Producción')
+            completo = self.completo('Producción')
+        self.assertEqual((detalle.status_code, detalle.data), (500, {'error': 'Error obteniendo departamento'}))
+        self.assertEqual((completo.status_code, completo.data), (500, {'error': 'Error obteniendo datos del departamento'}))
+
+
+class ContactosTests(SimpleTestCase):
+    def test_anexo_explicito(self):
+        self.assertEqual(directorio.anexo_telefono('+56 2 2345 6789 x123'), '123')
+        self.assertEqual(directorio.anexo_telefono('+56 2 2345 6789x123'), '123')
+        self.assertEqual(directorio.anexo_telefono('22 345 6789 anexo 45'), '45')
+        # "x" pegada a letras no es marca de anexo: se usan los últimos dígitos
+        self.assertEqual(directorio.anexo_telefono('Fax 22345678'), '5678')
+
+    def test_persona_sin_marca_de_activo_se_indexa(self):
+        sin_marca = persona(1, telephoneNumber='22345678')
+        del sin_marca['activo']
+        self.assertEqual(directorio.IndiceContactos([sin_marca]).buscar('telefono', '22345678')[0], 1)
+
+    def test_total_cuenta_personas_distintas(self):
+        snapshot = directorio.DirectorioSnapshot([
+            persona(1, telephoneNumber='5678'),
+            persona(2, telephoneNumber='22345678'),
+        ])
+        with mock.patch.object(views, 'obtener_directorio', return_value=snapshot):
+            response = views.buscar_contacto(APIRequestFactory().get('/api/contacto/', {'q': '5678'}))
+        # p1 coincide por anexo y por teléfono, p2 solo por anexo
+        self.assertEqual(response.data['total'], 2)
+        self.assertEqual(len(response.data['resultados']), 2)
+
+
+# ========== BÚSQUEDA EN MEMORIA ==========
+
+NOMBRES = ['José', 'María', 'Ana', 'Juan', 'Ángela', 'Cristóbal', 'Iñaki', 'Sofía', 'Martín', 'Ignacio']
+APELLIDOS = ['Pérez', 'González', 'Muñoz', 'Rojas', 'Díaz', 'Soto', 'Contreras', 'Silva', 'Martínez', 'Sepúlveda']
+
+
+def buscar_ingenuo(personas, consulta):
+    """Referencia: comparar cada término con cada palabra de cada persona activa"""
+    terminos = list(dict.fromkeys(palabras(consulta)))
+    maximo = len(terminos) * 3.0
+    resultados = []
+    for persona in personas:
+        if not persona.get('activo', True):
+            continue
+        total = 0.0
+        for termino in terminos:
+            mejor = max((calidad_coincidencia(termino, palabra) * peso
+                         for campo, peso in (('givenName', 3.0), ('sn', 3.0), ('mail', 2.0), ('title', 1.0), ('department', 1.0))
+                         for palabra in palabras(persona.get(campo))), default=0.0)
+            if not mejor:
+                break
+            total += mejor
+        else:
+            nombre = directorio.plegar_texto(f"{persona.get('givenName') or ''} {persona.get('sn') or ''}")
+            resultados.append((-total, nombre, persona['mail'], total / maximo))
+    resultados.sort(key=lambda r: r[:2])
+    return [(correo, puntaje) for _, _, correo, puntaje in resultados]
+
+
+def con_error_de_tipeo(palabra, azar):
+    i = azar.randrange(len(palabra) - 1)
+    operacion = azar.choice(('cambiar', 'quitar', 'transponer'))
+    if operacion == 'cambiar':
+        return palabra[:i] + azar.choice('aeiou') + palabra[i + 1:]
+    if operacion == 'quitar':
+        return palabra[:i] + palabra[i + 1:]
+    return palabra[:i] + palabra[i + 1] + palabra[i] + palabra[i + 2:]
+
+
+class IndiceBusquedaTests(SimpleTestCase):
+    def personas(self, total, semilla):
+        azar = random.Random(semilla)
+        return [persona(
+            i, givenName=azar.choice(NOMBRES), sn=azar.choice(APELLIDOS), title=azar.choice(TITULOS),
+            department=azar.choice(DEPARTAMENTOS), activo=azar.random() > 0.1,
+        ) for i in range(total)]
+
+    def test_igual_a_comparar_todas_las_palabras(self):
+        for semilla in range(4):
+            azar = random.Random(semilla)
+            personas = self.personas(200, semilla)
+            indice = IndiceBusqueda(personas)
+            for _ in range(40):
+                elegida = azar.choice(personas)
+                terminos = []
+                for campo in azar.sample(['givenName', 'sn', 'title', 'department'], azar.randint(1, 2)):
+                    palabra = azar.choice(palabras(elegida.get(campo)) or ['x'])
+                    if len(palabra) > 4 and azar.random() < 0.5:
+                        palabra = con_error_de_tipeo(palabra, azar)
+                    elif azar.random() < 0.5:
+                        palabra = palabra[:azar.randint(1, len(palabra))]
+                    terminos.append(palabra.upper() if azar.random() < 0.3 else palabra)
+                consulta = ' '.join(terminos)
+
+                obtenidos = [(p['mail'], puntaje) for p, puntaje in indice.buscar_con_puntaje(consulta)]
+                with self.subTest(semilla=semilla, consulta=consulta):
+                    self.assertEqual(obtenidos, buscar_ingenuo(personas, consulta))
+
+    def test_tildes_y_errores_de_tipeo(self):
+        indice = IndiceBusqueda([
+            persona(1, givenName='José', sn='González', title='Jefe de Turno', department='Producción'),
+            persona(2, givenName='Juan', sn='Pérez', title='Operario', department='Producción'),
+            persona(3, givenName='Ana', sn='Muñoz', title='Analista', department='TI', activo=False),
+        ])
+
+        def correos(consulta):
+            return [p['mail'] for p in indice.buscar(consulta)]
+
+        self.assertEqual(correos('JOSE gonzalez'), ['p1@cmf.cl'])
+        self.assertEqual(correos('gonzales'), ['p1@cmf.cl'])        # una letra cambiada
+        self.assertEqual(correos('jaun perez'), ['p2@cmf.cl'])      # transposición
+        self.assertEqual(correos('produccion'), ['p1@cmf.cl', 'p2@cmf.cl'])
+        self.assertEqual(correos('munoz'), [])                      # cuenta deshabilitada
+        self.assertEqual(correos('jxe'), [])                        # términos cortos sin tolerancia
+
+    def test_ranking_por_calidad_y_campo(self):
+        indice = IndiceBusqueda([
+            persona(1, givenName='Pedro', sn='Soto', title='Analista', department='Mantención'),
+            persona(2, givenName='Marta', sn='Silva', title='Jefa de Mantención', department='TI'),
+            persona(3, givenName='Mantención', sn='Rojas', title='Operario', department='TI'),
+            persona(4, givenName='Luis', sn='Díaz', title='Operario', department='Mantenciones'),
+        ])
+        resultados = indice.buscar_con_puntaje('mantencion')
+        # Exacta en el nombre > exacta en cargo o departamento (desempate por nombre) > prefijo
+        self.assertEqual([p['mail'] for p, _ in resultados], ['p3@cmf.cl', 'p2@cmf.cl', 'p1@cmf.cl', 'p4@cmf.cl'])
+        self.assertEqual([round(puntaje, 4) for _, puntaje in resultados], [1.0, 0.3333, 0.3333, 0.2667])
+
+
+def sugerir_ingenuo(personas, departamentos, prefijo, k):
+    """Referencia: (-peso, texto) de las k mejores entradas con alguna clave que empiece con el prefijo"""
+    activas = [p for p in personas if p.get('activo', True)]
+    reportes = Counter(p['manager'].lower() for p in activas if p.get('manager'))
+    entradas = {}
+    for p in activas:
+        completo = f"{p['givenName']} {p['sn']}"
+        entradas[('persona', p['mail'])] = (completo, 1 + reportes[p['distinguishedName'].lower()],
+                                            [completo, f"{p['sn']} {p['givenName']}"])
+        for tipo, texto in (('nombre', p['givenName']), ('apellido', p['sn'])):
+            _, peso, claves = entradas.get((tipo, texto), (texto, 0, [texto]))
+            entradas[(tipo, texto)] = (texto, peso + 1, claves)
+    for nombre, total in departamentos:
+        partes = nombre.split()
+        entradas[('departamento', nombre)] = (nombre, total, [' '.join(partes[i:]) for i in range(len(partes))])
+
+    prefijo = directorio.plegar_texto(prefijo)
+    coincidencias = [
+        (-peso, texto) for texto, peso, claves in entradas.values()
+        if prefijo and any(directorio.plegar_texto(clave).startswith(prefijo) for clave in claves)
+    ]
+    return sorted(coincidencias)[:min(k, MAX_SUGERENCIAS)]
+
+
+class IndiceSugerenciasTests(SimpleTestCase):
+    def directorio(self, semilla):
+        azar = random.Random(semilla)
+        personas = [persona(
+            i, givenName=azar.choice(NOMBRES), sn=azar.choice(APELLIDOS), department=azar.choice(DEPARTAMENTOS),
+            manager=dn(azar.randrange(i)) if i and azar.random() < 0.8 else None, activo=azar.random() > 0.1,
+        ) for i in range(300)]
+        departamentos = sorted(Counter(p['department'] for p in personas if p['activo']).items())
+        return personas, departamentos + [('Control de Gestión', 0)]
+
+    def test_igual_a_recorrer_todas_las_claves(self):
+        for semilla in range(3):
+            azar = random.Random(semilla)
+            personas, departamentos = self.directorio(semilla)
+            indice = IndiceSugerencias(personas, departamentos)
+            textos = [p['givenName'] + ' ' + p['sn'] for p in personas] + [d for d, _ in departamentos]
+            for _ in range(60):
+                texto = azar.choice(textos)
+                inicio = azar.choice([0] + [i + 1 for i, c in enumerate(texto) if c == ' '])
+                prefijo = texto[inicio:inicio + azar.randint(1, 8)]
+                prefijo = prefijo.upper() if azar.random() < 0.3 else prefijo
+                k = azar.choice([1, 5, 8, 50])
+
+                obtenidas = [(-s['peso'], s['texto']) for s in indice.sugerir(prefijo, k)]
+                with self.subTest(semilla=semilla, prefijo=prefijo, k=k):
+                    self.assertEqual(obtenidas, sugerir_ingenuo(personas, departamentos, prefijo, k))
+
+    def test_tildes_limites_y_correo(self):
+        indice = IndiceSugerencias([
+            persona(1, givenName='Ángela', sn='Muñoz'),
+            persona(2, givenName='Angel', sn='Soto', manager=dn(1)),
+            persona(3, givenName='Ana', sn='Angulo', activo=False),
+        ], [('Control de Gestión', 4)])
+
+        self.assertEqual([(s['texto'], s['tipo']) for s in indice.sugerir('ANGE', 8)], [
+            ('Ángela Muñoz', 'persona'), ('Angel', 'nombre'), ('Angel Soto', 'persona'), ('Ángela', 'nombre'),
+        ])
+        self.assertEqual(indice.sugerir('munoz a', 8)[0], {'texto': 'Ángela Muñoz', 'tipo': 'persona',
+                                                          'peso': 2, 'correo': 'p1@cmf.cl'})
+        self.assertEqual([s['texto'] for s in indice.sugerir('gestion', 8)], ['Control de Gestión'])
+        self.assertEqual(indice.sugerir('angu', 8), [])
+        self.assertEqual(indice.sugerir('  ', 8), [])
+        self.assertEqual(len(indice.sugerir('a', 1)), 1)
+
+    def test_endpoint_sugerencias(self):
+        snapshot = directorio.DirectorioSnapshot([persona(i, givenName=f'Nombre{i:02d}') for i in range(30)])
+        factory = APIRequestFactory()
+        with mock.patch.object(views, 'obtener_directorio', return_value=snapshot):
+            respuesta = views.get_sugerencias(factory.get('/api/ldap/sugerencias/', {'q': 'nom', 'k': 99}))
+            invalido = views.get_sugerencias(factory.get('/api/ldap/sugerencias/', {'q': 'nom', 'k': 'tres'}))
+            no_modificado = views.get_sugerencias(factory.get(
+                '/api/ldap/sugerencias/', {'q': 'nom'}, HTTP_IF_NONE_MATCH=respuesta['ETag']))
+
+        self.assertEqual(len(respuesta.data['sugerencias']), MAX_SUGERENCIAS)
+        self.assertEqual(respuesta.data['sugerencias'][0]['texto'], 'Nombre00')
+        self.assertEqual(invalido.status_code, 400)
+        self.assertEqual(no_modificado.status_code, 304)
+
+
+# ========== BÚSQUEDA UNIVERSAL ==========
+
+@override_settings(CACHES=CACHE_LOCAL)
+@mock.patch.object(cargos, '_cargar_reglas', lambda: list(REGLAS_CARGO_POR_DEFECTO))
+class BusquedaUniversalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        cargos._clasificador = None
+        busqueda_universal._lugares = None
+        self.addCleanup(setattr, busqueda_universal, '_lugares', None)
+        self.snapshot = directorio.DirectorioSnapshot([
+            persona(1, department='Bodega'),
+            persona(2, department='Finanzas'),
+        ])
+        Ubicacion.objects.create(nombre='Bodega Central', coordenada_x=1, coordenada_y=2)
+        Ubicacion.objects.create(nombre='Casino', coordenada_x=3, coordenada_y=4)
+        ProcedimientoEmergencia.objects.create(titulo='Evacuación', descripcion='Salir por la bodega', tipo_emergencia='sismo')
+
+    def buscar(self, q):
+        response = views.busqueda_universal(APIRequestFactory().get('/api/buscar/', {'q': q}))
+        response.render()
+        return response
+
+    def test_consulta_corta_no_busca_y_se_serializa(self):
+        with mock.patch.object(views, 'directorio_cargado', return_value=self.snapshot), \
+                mock.patch.object(views, 'obtener_directorio', side_effect=AssertionError('carga LDAP')):
+            response = self.buscar('b')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'q': 'b', 'grupos': [], 'directorio_disponible': True})
+
+        with mock.patch.object(views, 'directorio_cargado', return_value=None):
+            self.assertFalse(self.buscar('b').data['directorio_disponible'])
+
+    def test_grupos_por_tipo_ordenados_por_mejor_puntaje(self):
+        with mock.patch.object(views, 'obtener_directorio', return_value=self.snapshot):
+            response = self.buscar('bodega')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['directorio_disponible'])
+
+        grupos = {g['tipo']: g for g in response.data['grupos']}
+        # Nombre exacto (peso mayor) antes que coincidencias en campos secundarios; empate en orden fijo
+        self.assertEqual([g['tipo'] for g in response.data['grupos']],
+                         ['departamentos', 'ubicaciones', 'personas', 'procedimientos'])
+        self.assertEqual(grupos['departamentos']['resultados'][0]['nombre'], 'Bodega')
+        self.assertEqual(grupos['departamentos']['resultados'][0]['total_personas'], 1)
+        self.assertEqual([u['nombre'] for u in grupos['ubicaciones']['resultados']], ['Bodega Central'])
+        self.assertEqual([p['mail'] for p in grupos['personas']['resultados']], ['p1@cmf.cl'])
+        self.assertEqual(grupos['procedimientos']['total'], 1)
+        puntajes = [g['mejor_puntaje'] for g in response.data['grupos']]
+        self.assertEqual(puntajes, sorted(puntajes, reverse=True))
+
+    def test_sin_directorio_solo_lugares(self):
+        with mock.patch.object(views, 'obtener_directorio', side_effect=LDAPException('caído')), \
+                self.assertLogs(views.logger, 'WARNING'):
+            response = self.buscar('bodega')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['directorio_disponible'])
+        self.assertEqual([g['tipo'] for g in response.data['grupos']], ['ubicaciones', 'procedimientos'])
+
+
+# ========== BÚSQUEDA FTS ==========
+
+@override_settings(CACHES=CACHE_LOCAL)
+@mock.patch.object(views, 'BUSQUEDA_MODO', 'fts')
+class BusquedaFtsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Trabajador.objects.bulk_create([
+            Trabajador(nombre=f'Juan{i}', apellido='Pérez', cargo='Analista', email=f'j{i}@cmf.cl') for i in range(5)
+        ])
+
+    def buscar(self, **parametros):
+        return views.search_ldap(APIRequestFactory().get('/api/ldap/search/', {'q': 'juan', 'limite': 2, **parametros}))
+
+    def test_sin_sincronizar_usa_el_indice_en_memoria(self):
+        self.assertIsNone(busqueda_fts.version_fts())
+
+    def test_una_consulta_de_estado_por_busqueda(self):
+        busqueda_fts.reconstruir_indice_fts()
+        # versión del índice + total + página
+        with self.assertNumQueries(3):
+            response = self.buscar()
+        self.assertEqual(response['X-Total-Count'], '5')
+
+    def test_cursor_sobrevive_al_cache_y_vence_con_la_sincronizacion(self):
+        busqueda_fts.reconstruir_indice_fts()
+        cursor = self.buscar()['X-Next-Cursor']
+
+        cache.clear()
+        self.assertEqual(self.buscar(cursor=cursor).status_code, 200)
+
+        busqueda_fts.reconstruir_indice_fts()
+        self.assertEqual(self.buscar(cursor=cursor).status_code, 400)
+
+
+# ========== SINCRONIZACIÓN ==========
+
+class SincronizacionTests(TestCase):
+    def test_cambio_de_dn_conserva_la_fila(self):
+        sincronizar_directorio([persona(1, title='Jefe TI'), persona(2, manager=dn(1))])
+        jefe = Trabajador.objects.get(distinguished_name=dn(1))
+        jefe.foto = 'trabajadores/jefe.jpg'
+        jefe.save()
+        Departamento.objects.filter(clave='ti').update(jefe=jefe)
+
+        movido = persona(1, title='Jefe TI', distinguishedName='CN=P1,OU=Nueva,DC=cmf,DC=cl')
+        estadisticas = sincronizar_directorio([movido, persona(2, manager=movido['distinguishedName'])])
+
+        self.assertEqual(estadisticas['trabajadores_dn_actualizado'], 1)
+        self.assertEqual(estadisticas.get('trabajadores_creados', 0), 0)
+        jefe.refresh_from_db()
+        self.assertEqual(jefe.distinguished_name, movido['distinguishedName'])
+        self.assertTrue(jefe.cuenta_activa)
+        self.assertEqual(jefe.foto.name, 'trabajadores/jefe.jpg')
+        self.assertEqual(Departamento.objects.get(clave='ti').jefe_id, jefe.id)
+        self.assertEqual(list(jefe.supervisa_a.values_list('email', flat=True)), ['p2@cmf.cl'])
+        self.assertEqual(Trabajador.objects.count(), 2)
+
+    def test_lee_todo_el_directorio_antes_de_abrir_la_transaccion(self):
+        profundidad = len(connection.atomic_blocks)
+        durante_lectura = []
+
+        def paginas():
+            for i in range(5):
+                durante_lectura.append(len(connection.atomic_blocks))
+                yield persona(i)
+
+        sincronizar_directorio(paginas(), tamano_lote=2)
+        self.assertEqual(durante_lectura, [profundidad] * 5)
+        self.assertEqual(Trabajador.objects.count(), 5)
+
+
+# ========== CIERRE DE SUPERVISIÓN ==========
+
+class CierreSupervisionTests(TestCase):
+    """Tras cada cambio de supervisa_a, el cierre mantenido por las señales es el de una reconstrucción"""
+
+    def setUp(self):
+        self.t = [Trabajador.objects.create(nombre=f'N{i}', apellido=f'A{i}', cargo='Analista') for i in range(12)]
+        # 0 -> 1 -> 2 -> 3 y 0 -> 4 -> 5, 1 -> 6 -> 7
+        for jefe, subordinado in ((0, 1), (1, 2), (2, 3), (0, 4), (4, 5), (1, 6), (6, 7)):
+            self.t[jefe].supervisa_a.add(self.t[subordinado])
+
+    def filas(self):
+        return set(CierreSupervision.objects.values_list('jefe_id', 'subordinado_id', 'profundidad'))
+
+    def assertIgualAReconstruir(self):
+        antes = self.filas()
+        estadisticas = reconstruir_cierre()
+        self.assertEqual(
+            (estadisticas['cierre_creados'], estadisticas['cierre_eliminados'], estadisticas['cierre_actualizados']),
+            (0, 0, 0), estadisticas
+        )
+        self.assertEqual(self.filas(), antes)
+
+    def test_agregar_enlaces_extiende_el_subarbol(self):
+        self.assertIgualAReconstruir()
+        self.assertIn((self.t[0].id, self.t[7].id, 3), self.filas())
+
+        # Un atajo acorta la distancia; un jefe nuevo arriba de todo alcanza a todo el árbol
+        self.t[0].supervisa_a.add(self.t[6])
+        self.assertIgualAReconstruir()
+        self.assertIn((self.t[0].id, self.t[7].id, 2), self.filas())
+
+        self.t[8].supervisa_a.add(self.t[0], self.t[9])
+        self.assertIgualAReconstruir()
+        self.assertIn((self.t[8].id, self.t[3].id, 4), self.filas())
+
+    def test_quitar_enlaces_y_desde_el_lado_del_subordinado(self):
+        self.t[1].supervisa_a.remove(self.t[2])
+        self.assertIgualAReconstruir()
+        self.assertFalse(CierreSupervision.objects.filter(jefe=self.t[0], subordinado=self.t[3]).exists())
+
+        self.t[5].supervisado_por.remove(self.t[4])
+        self.assertIgualAReconstruir()
+        self.t[9].supervisado_por.add(self.t[7], self.t[3])
+        self.assertIgualAReconstruir()
+        self.t[9].supervisado_por.set([self.t[5]])
+        self.assertIgualAReconstruir()
+
+    def test_clear_en_ambos_sentidos(self):
+        self.t[1].supervisa_a.clear()
+        self.assertIgualAReconstruir()
+        self.assertEqual(CierreSupervision.objects.filter(jefe=self.t[0]).count(), 3)
+
+        self.t[4].supervisado_por.clear()
+        self.assertIgualAReconstruir()
+        self.assertEqual(CierreSupervision.objects.filter(jefe=self.t[0]).count(), 1)
+
+    def test_eliminar_un_trabajador_intermedio(self):
+        self.t[1].delete()
+        self.assertIgualAReconstruir()
+        self.assertFalse(CierreSupervision.objects.filter(jefe=self.t[0], subordinado=self.t[7]).exists())
+        self.assertTrue(CierreSupervision.objects.filter(jefe=self.t[6], subordinado=self.t[7]).exists())
+
+    def test_ciclos_y_cambios_al_azar(self):
+        # Un ciclo: 3 -> 0 cierra 0 -> 1 -> 2 -> 3
+        self.t[3].supervisa_a.add(self.t[0])
+        self.assertIgualAReconstruir()
+        self.assertFalse(CierreSupervision.objects.filter(jefe=self.t[0], subordinado=self.t[0]).exists())
+
+        azar = random.Random(7)
+        for _ in range(40):
+            jefe, subordinado = azar.sample(self.t, 2)
+            operacion = azar.choice(['agregar', 'quitar', 'inverso', 'clear'])
+            if operacion == 'agregar':
+                jefe.supervisa_a.add(subordinado)
+            elif operacion == 'quitar':
+                jefe.supervisa_a.remove(*jefe.supervisa_a.all()[:1])
+            elif operacion == 'inverso':
+                subordinado.supervisado_por.add(jefe)
+            else:
+                jefe.supervisa_a.clear()
+            with self.subTest(operacion=operacion):
+                self.assertIgualAReconstruir()
+
+
+# ========== LECTURA DE TABLAS LOCALES ==========
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ConsultasLecturaLocalTests(TestCase):
+    """Presupuesto de consultas por acción: no depende del tamaño de la página ni de su profundidad"""
+
+    @classmethod
+    def setUpTestData(cls):
+        departamentos = [Departamento.objects.create(nombre=nombre) for nombre in ('TI', 'Finanzas', 'Bodega')]
+        # Pocos apellidos y nombres: grupos grandes de empates en (apellido, nombre)
+        Trabajador.objects.bulk_create([
+            Trabajador(
+                nombre=('Ana', 'Juan', 'José', 'María')[i % 4], apellido=('Pérez', 'González', 'Muñoz')[i % 3],
+                cargo='Analista', departamento=departamentos[i % 3], cuenta_activa=i % 10 != 0,
+            )
+            for i in range(240)
+        ])
+        cls.jefe = Trabajador.objects.filter(cuenta_activa=True).first()
+        cls.jefe.supervisa_a.set(Trabajador.objects.filter(departamento=cls.jefe.departamento)[:20])
+        Departamento.objects.filter(id=departamentos[0].id).update(jefe=cls.jefe)
+        cls.departamento = departamentos[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def pedir(self, viewset, acciones, url, **kwargs):
+        request = APIRequestFactory().get(url)
+        response = viewset.as_view(acciones)(request, **kwargs)
+        response.render()
+        return response
+
+    def recorrer(self, url, campo):
+        """Páginas siguiendo `campo` (next o previous), verificando una consulta y sin OFFSET en cada una"""
+        paginas = []
+        while url:
+            with CaptureQueriesContext(connection) as consultas:
+                response = self.pedir(views.TrabajadorLocalViewSet, {'get': 'list'}, url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(consultas), 1, url)
+            self.assertNotIn('OFFSET', consultas[0]['sql'])
+            paginas.append([t['id'] for t in response.data['results']])
+            url = response.data[campo]
+        return paginas
+
+    def test_lista_de_trabajadores_una_consulta_por_pagina(self):
+        esperados = list(
+            Trabajador.objects.filter(cuenta_activa=True).order_by('apellido', 'nombre', 'id').values_list('id', flat=True)
+        )
+        for limite in (7, 50, 200):
+            with self.subTest(limite=limite):
+                paginas = self.recorrer(f'/api/local/trabajadores/?limite={limite}', 'next')
+                self.assertEqual([i for pagina in paginas for i in pagina], esperados)
+                self.assertEqual(len(paginas), -(-len(esperados) // limite))
+
+                # De vuelta desde la última página se obtienen las mismas páginas
+                url, ultima = f'/api/local/trabajadores/?limite={limite}', None
+                while url:
+                    ultima, url = url, self.pedir(views.TrabajadorLocalViewSet, {'get': 'list'}, url).data['next']
+                self.assertEqual(self.recorrer(ultima, 'previous')[::-1], paginas)
+
+    def test_cursor_invalido_es_404(self):
+        response = self.pedir(views.TrabajadorLocalViewSet, {'get': 'list'}, '/api/local/trabajadores/?cursor=basura')
+        self.assertEqual(response.status_code, 404)
+
+    def test_detalle_de_trabajador_tres_consultas(self):
+        with self.assertNumQueries(3):
+            response = self.pedir(
+                views.TrabajadorLocalViewSet, {'get': 'retrieve'}, f'/api/local/trabajadores/{self.jefe.id}/', pk=self.jefe.id
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_departamentos_lista_una_consulta_y_detalle_dos(self):
+        for limite in (1, 2, 50):
+            url = f'/api/local/departamentos/?limite={limite}'
+            vistos = 0
+            while url:
+                with self.assertNumQueries(1):
+                    response = self.pedir(views.DepartamentoLocalViewSet, {'get': 'list'}, url)
+                vistos += len(response.data['results'])
+                url = response.data['next']
+            self.assertEqual(vistos, 3)
+
+        with self.assertNumQueries(2):
+            response = self.pedir(
+                views.DepartamentoLocalViewSet, {'get': 'retrieve'},
+                f'/api/local/departamentos/{self.departamento.id}/', pk=self.departamento.id
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_mapas_y_trabajadores_por_marcador(self):
+        ubicaciones = [
+            Ubicacion.objects.create(nombre=f'U{i}', coordenada_x=i, coordenada_y=i, departamento=self.departamento)
+            for i in range(5)
+        ]
+        for i in range(3):
+            Mapa.objects.create(nombre=f'M{i}', imagen='mapas/m.png').ubicaciones.set(ubicaciones)
+
+        with self.assertNumQueries(3):
+            self.pedir(views.MapaViewSet, {'get': 'list'}, '/api/mapas/')
+        with self.assertNumQueries(2):
+            self.pedir(
+                views.UbicacionViewSet, {'get': 'trabajadores'},
+                f'/api/ubicaciones/{ubicaciones[0].id}/trabajadores/', pk=ubicaciones[0].id
+            )
+
+
+# ========== POOL DE CÁLCULO ==========
+
+def calculo_lento(segundos):
+    time.sleep(segundos)
+    return os.getpid()
+
+
+@mock.patch.object(ejecutor, 'EJECUTOR_PROCESOS', 1)
+class EjecutorTests(SimpleTestCase):
+    def tearDown(self):
+        if ejecutor._pool is not None:
+            ejecutor._descartar_pool(ejecutor._pool)
+        ejecutor._estadisticas.pop('prueba_lenta', None)
+
+    def test_timeout_espera_el_mismo_calculo_sin_repetirlo_en_linea(self):
+        pid = ejecutor.ejecutar_calculo('prueba_lenta', calculo_lento, 0.5, timeout=0.05)
+        self.assertNotEqual(pid, os.getpid())
+
+        stats = ejecutor.estadisticas_ejecutor()['calculos']['prueba_lenta']
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['pool'], 1)
+        self.assertEqual(stats['inline'], 0)
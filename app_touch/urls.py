@@ -6,6 +6,8 @@ from . import views
 router = DefaultRouter()
 router.register(r'mapas', views.MapaViewSet)
 router.register(r'ubicaciones', views.UbicacionViewSet)
+router.register(r'local/trabajadores', views.TrabajadorLocalViewSet, basename='trabajador-local')
+router.register(r'local/departamentos', views.DepartamentoLocalViewSet, basename='departamento-local')
 
 urlpatterns = [
     # Vista principal del tótem (genera token y redirige)
@@ -18,7 +20,12 @@ urlpatterns = [
     path('api/auth/check/', views.check_auth, name='check_auth'),
     
     path('api/ldap/search/', views.search_ldap, name='search_ldap'),
+    path('api/ldap/sugerencias/', views.get_sugerencias, name='get_sugerencias'),
+    path('api/buscar/', views.busqueda_universal, name='busqueda_universal'),
+    path('api/ldap/contacto/', views.buscar_contacto, name='buscar_contacto'),
+    path('api/ldap/sincronizar-busqueda/', views.sincronizar_busqueda, name='sincronizar_busqueda'),
     path('api/ldap/trabajador/', views.trabajador_detail_ldap, name='trabajador_detail_ldap'),
+    path('api/ldap/trabajadores/batch/', views.trabajadores_batch_ldap, name='trabajadores_batch_ldap'),
     path('api/ldap/departamento/', views.departamento_detail_ldap, name='departamento_detail_ldap'),
     # =========================================================================
     # SERVICIOS & UTILIDADES
@@ -28,11 +35,20 @@ urlpatterns = [
      # ✅ NUEVAS URLS PARA DEPARTAMENTOS
     # ✅ NUEVAS URLs JERARQUÍA
     path('api/arbol-jerarquico/', views.get_arbol_jerarquico, name='arbol_jerarquico'),
+    path('api/arbol-jerarquico/subarbol/', views.get_subarbol_jerarquico, name='subarbol_jerarquico'),
+    path('api/arbol-jerarquico/layout/', views.get_layout_arbol, name='layout_arbol'),
+    path('api/ldap/cadena-mando/', views.get_cadena_mando, name='cadena_mando'),
+    path('api/ldap/jefe-comun/', views.get_jefe_comun, name='jefe_comun'),
+    path('api/ldap/estadisticas-jefe/', views.get_estadisticas_jefe, name='estadisticas_jefe'),
+    path('api/trabajadores/<int:trabajador_id>/subordinados/', views.trabajador_subordinados, name='trabajador_subordinados'),
+    path('api/trabajadores/<int:trabajador_id>/cadena-mando/', views.trabajador_cadena_mando, name='trabajador_cadena_mando'),
+    path('api/trabajadores/<int:trabajador_id>/total-subordinados/', views.trabajador_total_subordinados, name='trabajador_total_subordinados'),
     path('api/lista-departamentos/', views.get_lista_departamentos, name='lista_departamentos'),
     path('api/departamento/<str:nombre_departamento>/', views.get_departamento_detalle, name='departamento_detalle'),
     path('api/resumen-organizacion/', views.get_resumen_organizacion, name='resumen_organizacion'),
         # NUEVA VISTA - Agregar esta línea
     path('api/departamento-completo/', views.departamento_completo, name='departamento_completo'),
+    path('api/departamentos/<str:departamento>/', views.get_departamento, name='departamento'),
     
     
     # ========== NUEVAS URLs ==========
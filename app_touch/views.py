@@ -1,6 +1,8 @@
 # Standard library imports
+import base64
 import json
 import logging
+import re
 import smtplib
 import time
 import threading
@@ -9,7 +11,7 @@ from datetime import datetime, timedelta
 from django.utils import timezone
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from functools import wraps
+from functools import lru_cache, wraps
 from typing import Dict, List, Any, Optional
 
 # Django imports
@@ -20,22 +22,49 @@ from django.core.cache import cache
 from django.http import JsonResponse
 from django.middleware.csrf import get_token
 from django.utils.timezone import make_aware
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import Count, Prefetch, Q
 
 # Django REST Framework imports
 from rest_framework import viewsets, status
 from rest_framework.authentication import SessionAuthentication
-from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import Cursor, CursorPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
 # LDAP imports
 from ldap3 import Server, Connection, ALL, SIMPLE
 from ldap3.core.exceptions import LDAPException
+from ldap3.utils.conv import escape_filter_chars
 
 # Local imports
-from app_touch.models import Mapa, Ubicacion, QRToken
-from app_touch.serializer import MapaSerializer, UbicacionSerializer
+from app_touch.busqueda import MAX_SUGERENCIAS, IndiceBusqueda, IndiceSugerencias
+from app_touch.busqueda_fts import buscar_fts, version_fts
+from app_touch.busqueda_universal import buscar_lugares, construir_indice_departamentos
+from app_touch.cache_helpers import construir_clave_cache, cache_get_contenido, cache_set_contenido, hash_payload
+from app_touch.cargos import es_cargo_jerarquico_valido, fijar_reglas, info_clasificador, obtener_clasificador, version_reglas
+from app_touch.cierre_supervision import cadena_mando, conteo_subordinados, subordinados
+from app_touch.directorio import (
+    CAMPOS_CONTACTO, construir_indice_contactos, construir_registro_departamentos, correo_puede_existir,
+    directorio_cargado, info_directorio, normalizar_departamento, obtener_directorio, persona_por_correo,
+    reportes_directos, snapshot_sin_bloquear
+)
+from app_touch.ejecutor import ejecutar_calculo, estadisticas_ejecutor
+from app_touch.grafo_organizacion import GrafoOrganizacion
+from app_touch.layout_arbol import LayoutArbol
+from app_touch.jerarquia import (
+    IndiceAncestros, IndiceArbol, MotorJerarquia, construir_arbol_departamentos,
+    diferencias_directorio
+)
+from app_touch.ldap_helpers import buscar_entradas_cacheadas, estadisticas_consultas_ldap
+from app_touch.models import Departamento, Mapa, Ubicacion, QRToken, Trabajador
+from app_touch.serializer import (
+    DepartamentoDetalleSerializer, DepartamentoListaSerializer, DepartamentoReferenciaSerializer, MapaSerializer,
+    TrabajadorDetalleSerializer, TrabajadorListaSerializer, UbicacionSerializer
+)
+from app_touch.sincronizacion import sincronizar_directorio
 
 # Configurar logger
 logger = logging.getLogger(__name__)
@@ -44,6 +73,80 @@ logger = logging.getLogger(__name__)
 CACHE_TIMEOUT = 60 * 60 * 24 * 14  # 2 semanas en segundos
 LDAP_CACHE_TIMEOUT =  60 * 60 * 24 # 1 día para datos LDAP
 
+# Atributos que expone departamento_detail_ldap por cada trabajador
+ATRIBUTOS_DETALLE_DEPARTAMENTO = [
+    'givenName', 'sn', 'mail', 'title', 'department',
+    'telephoneNumber', 'lastLogonTimestamp'
+]
+
+# Límites del endpoint de subárboles del árbol jerárquico
+MAX_PROFUNDIDAD_SUBARBOL = 10
+SUBARBOL_MAX_AGE = 60 * 10  # 10 minutos de cache en el cliente
+
+# Sobre esta proporción de personas con cambios se reconstruye el árbol completo
+MAX_PROPORCION_CAMBIOS_INCREMENTAL = 0.2
+
+# Atributos que expone departamento_completo para el jefe
+ATRIBUTOS_JEFE_COMPLETO = [
+    'givenName', 'sn', 'mail', 'title', 'department',
+    'telephoneNumber', 'manager', 'distinguishedName'
+]
+
+# Atributos de cada trabajador en el recurso de departamento (superconjunto de los endpoints antiguos)
+ATRIBUTOS_TRABAJADOR_DEPARTAMENTO = [
+    'givenName', 'sn', 'mail', 'title', 'department', 'telephoneNumber',
+    'manager', 'distinguishedName', 'lastLogonTimestamp'
+]
+
+# Expansiones que acepta el recurso de departamento en ?include=
+INCLUDES_DEPARTAMENTO = ('members', 'jefe', 'jefe_completo', 'stats', 'subareas')
+
+# Atributos del detalle de un trabajador (en AD se lee el perfil 'persona' del cache de consultas, que los incluye)
+ATRIBUTOS_TRABAJADOR = [
+    'givenName', 'sn', 'mail', 'title', 'department',
+    'lastLogonTimestamp', 'telephoneNumber', 'company',
+    'userAccountControl', 'manager', 'distinguishedName', 'DisplayName'
+]
+
+# Tiempo de vida del detalle de trabajador en cache, según el resultado (segundos)
+TRABAJADOR_CACHE_TIMEOUT = 3600
+TRABAJADOR_NO_ENCONTRADO_TIMEOUT = 300
+TRABAJADOR_DESHABILITADO_TIMEOUT = 3600
+
+# Máximo de correos por request en el endpoint de lote
+MAX_CORREOS_LOTE = getattr(settings, 'MAX_CORREOS_LOTE', 100)
+
+# Atributos de cada persona en los resultados de búsqueda
+ATRIBUTOS_BUSQUEDA = [
+    'givenName', 'sn', 'mail', 'title', 'department',
+    'lastLogonTimestamp', 'telephoneNumber', 'company',
+    'distinguishedName', 'DisplayName'
+]
+
+# Tamaño de página de la búsqueda (el filtro de AD usaba size_limit=50)
+BUSQUEDA_LIMITE = 50
+MAX_BUSQUEDA_LIMITE = 100
+
+# Motor de búsqueda de personas: 'memoria' (índice de trigramas por proceso)
+# o 'fts' (tabla FTS5 en SQLite, compartida y persistente; requiere sincronizar)
+BUSQUEDA_MODO = getattr(settings, 'BUSQUEDA_MODO', 'memoria')
+
+# Sugerencias del teclado en pantalla (cada letra es una consulta)
+SUGERENCIAS_LIMITE = 8
+SUGERENCIAS_MAX_AGE = 60 * 5
+
+# Resultados por grupo de la búsqueda universal
+BUSQUEDA_UNIVERSAL_LIMITE = 5
+MAX_BUSQUEDA_UNIVERSAL_LIMITE = 20
+
+# Filas por respuesta del subárbol de supervisión (tablas locales)
+SUBORDINADOS_LIMITE = 200
+MAX_SUBORDINADOS_LIMITE = 1000
+
+# Resultados de la búsqueda por teléfono, anexo o correo
+CONTACTO_LIMITE = 20
+MAX_CONTACTO_LIMITE = 100
+
 # ========== SISTEMA DE BLOQUEO PARA EVITAR DUPLICADOS ==========
 
 class RequestLockManager:
@@ -139,16 +242,20 @@ def handle_ldap_errors(func):
                           status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     return wrapper
 
+def clave_cache_vista(request, key_prefix, nombre_funcion, kwargs):
+    """Clave de cache de una vista (querystring + argumentos de ruta)"""
+    return construir_clave_cache(key_prefix, nombre_funcion, request.GET.urlencode(), kwargs)
+
 def cache_response(timeout: int, key_prefix: str = ""):
     """Decorador para cachear respuestas CON HEADERS MEJORADOS Y LOGGING DETALLADO"""
     def decorator(func):
         @wraps(func)
         def wrapper(request, *args, **kwargs):
-            # Generar clave de cache única basada en parámetros
-            cache_key = f"{key_prefix}_{func.__name__}_{request.GET.urlencode()}"
+            # Generar clave de cache canónica basada en parámetros
+            cache_key = clave_cache_vista(request, key_prefix, func.__name__, kwargs)
             
             # Verificar cache
-            cached_response = cache.get(cache_key)
+            cached_response = cache_get_contenido(cache_key)
             if cached_response is not None:
                 # Obtener información de TTL para logging
                 ttl_info = ""
@@ -180,7 +287,7 @@ def cache_response(timeout: int, key_prefix: str = ""):
             execution_time = time.time() - start_time
             
             if response.status_code == status.HTTP_200_OK:
-                cache.set(cache_key, response.data, timeout)
+                cache_set_contenido(cache_key, response.data, timeout)
                 
                 # Logging detallado del cache miss
                 email = "desconocido"
@@ -267,63 +374,339 @@ def procesar_last_logon(raw_logon: Any) -> Optional[str]:
 
 # ========== VISTAS PRINCIPALES ACTUALIZADAS ==========
 
+def construir_indice_busqueda(snapshot):
+    return IndiceBusqueda(snapshot.personas_activas)
+
+def datos_resultado_busqueda(persona: Dict) -> Dict:
+    resultado = {attr: persona.get(attr) for attr in ATRIBUTOS_BUSQUEDA}
+    resultado['lastLogonTimestamp'] = procesar_last_logon(resultado.get('lastLogonTimestamp'))
+    resultado['userAccountControl_enabled'] = True
+    return resultado
+
+def codificar_cursor(version: str, posicion: int) -> str:
+    return base64.urlsafe_b64encode(f"{version}:{posicion}".encode()).decode()
+
+def decodificar_cursor(cursor: str, version: str) -> int:
+    """Posición guardada en el cursor; ValueError si es inválido o de otra versión del directorio"""
+    try:
+        version_cursor, posicion = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        posicion = int(posicion)
+    except Exception:
+        raise ValueError('cursor inválido')
+    if version_cursor != version or posicion < 0:
+        raise ValueError('cursor de otra versión del directorio')
+    return posicion
+
 @api_view(['GET'])
 @handle_ldap_errors
-@cache_response(timeout=LDAP_CACHE_TIMEOUT, key_prefix="ldap_search")
 def search_ldap(request):
-    """Búsqueda optimizada en LDAP con cache - MEJORADA"""
+    """Búsqueda de personas en el índice en memoria del directorio
+    
+    Sin tildes ni mayúsculas, con tolerancia a errores de tipeo y resultados
+    ordenados por relevancia. Parámetros: q, limite (1-100, por defecto 50)
+    y cursor (valor de X-Next-Cursor de la página anterior). La respuesta es
+    la lista de personas; X-Next-Cursor y X-Total-Count van en los headers.
+    Con BUSQUEDA_MODO = 'fts' se responde desde la tabla FTS5 sincronizada.
+    Si el directorio no está disponible se busca en AD como antes.
+    """
     query = request.GET.get('q', '').strip()
     if not query or len(query) < 2:
         logger.info(f"🔍 Búsqueda muy corta o vacía: '{query}'")
         return Response([])
+    
+    try:
+        limite = min(max(int(request.GET.get('limite', BUSQUEDA_LIMITE)), 1), MAX_BUSQUEDA_LIMITE)
+    except ValueError:
+        return Response({'error': 'limite debe ser un número entero'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    cursor = request.GET.get('cursor', '').strip()
+    version_indice = version_fts() if BUSQUEDA_MODO == 'fts' else None
+    if version_indice is not None:
+        return buscar_personas_fts(query, limite, cursor, version_indice)
+    
+    try:
+        snapshot = obtener_directorio()
+    except Exception as e:
+        logger.warning(f"⚠️ Directorio no disponible, búsqueda en AD: {e}")
+        return buscar_personas_en_ad(request, query)
+    
+    inicio_pagina = 0
+    if cursor:
+        try:
+            inicio_pagina = decodificar_cursor(cursor, snapshot.version)
+        except ValueError as e:
+            return Response({'error': f'{e}, repita la búsqueda'}, 
+                           status=status.HTTP_400_BAD_REQUEST)
+    
+    inicio = time.time()
+    encontrados = snapshot.derivado('indice_busqueda', construir_indice_busqueda).buscar(query)
+    pagina = encontrados[inicio_pagina:inicio_pagina + limite]
+    results = [datos_resultado_busqueda(persona) for persona in pagina]
+    
+    emoji = "✅" if results else "🔍"
+    logger.info(f"{emoji} Búsqueda en índice: '{query}' -> {len(encontrados)} resultados en {(time.time() - inicio) * 1000:.1f}ms")
+    
+    response = Response(results)
+    response['X-Total-Count'] = str(len(encontrados))
+    siguiente = inicio_pagina + limite
+    if siguiente < len(encontrados):
+        response['X-Next-Cursor'] = codificar_cursor(snapshot.version, siguiente)
+    return response
+
+def construir_indice_sugerencias(snapshot):
+    registro = snapshot.derivado('registro_departamentos', construir_registro_departamentos)
+    departamentos = [(entrada.nombre, len(entrada.miembros_activos)) for entrada in registro.departamentos]
+    return IndiceSugerencias(snapshot.personas_activas, departamentos)
 
+@api_view(['GET'])
+def get_sugerencias(request):
+    """Autocompletado por prefijo para el teclado del tótem
+    
+    Devuelve las k sugerencias más populares (personas, nombres, apellidos
+    y departamentos) que comienzan con q. El índice se construye una vez
+    por versión del directorio, así que una recarga lo reemplaza entero.
+    """
+    prefijo = request.GET.get('q', '').strip()
+    try:
+        k = min(max(int(request.GET.get('k', SUGERENCIAS_LIMITE)), 1), MAX_SUGERENCIAS)
+    except ValueError:
+        return Response({'error': 'k debe ser un número entero'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        snapshot = obtener_directorio()
+    except LDAPException as e:
+        logger.error(f"❌ No se pudo obtener el directorio desde LDAP: {e}")
+        return Response({'error': 'Error de conexión con el directorio activo'}, 
+                       status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
+    etag = f'"{snapshot.version}"'
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=status.HTTP_304_NOT_MODIFIED)
+    
+    sugerencias = snapshot.derivado('indice_sugerencias', construir_indice_sugerencias).sugerir(prefijo, k)
+    
+    response = Response({
+        'q': prefijo,
+        'sugerencias': sugerencias,
+        'version_directorio': snapshot.version
+    })
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={SUGERENCIAS_MAX_AGE}'
+    return response
+
+def construir_indice_departamentos_busqueda(snapshot):
+    registro = snapshot.derivado('registro_departamentos', construir_registro_departamentos)
+    return construir_indice_departamentos(registro)
+
+def grupo_busqueda(tipo, encontrados, limite, datos=lambda documento: dict(documento)):
+    return {
+        'tipo': tipo,
+        'total': len(encontrados),
+        'mejor_puntaje': round(encontrados[0][1], 4) if encontrados else 0.0,
+        'resultados': [
+            {**datos(documento), 'puntaje': round(puntaje, 4)}
+            for documento, puntaje in encontrados[:limite]
+        ],
+    }
+
+@api_view(['GET'])
+def busqueda_universal(request):
+    """Una sola búsqueda sobre personas, departamentos, ubicaciones y procedimientos
+    
+    Devuelve los resultados agrupados por tipo; cada grupo viene ordenado
+    por relevancia y los grupos por su mejor puntaje (normalizado entre 0
+    y 1). Personas y departamentos salen del directorio en memoria; si no
+    está disponible esos grupos se omiten y se informa en la respuesta.
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        limite = min(max(int(request.GET.get('limite', BUSQUEDA_UNIVERSAL_LIMITE)), 1), MAX_BUSQUEDA_UNIVERSAL_LIMITE)
+    except ValueError:
+        return Response({'error': 'limite debe ser un número entero'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    if len(query) < 2:
+        return Response({'q': query, 'grupos': [], 'directorio_disponible': directorio_cargado() is not None})
+    
+    inicio = time.time()
+    grupos = []
+    directorio_disponible = True
+    try:
+        snapshot = obtener_directorio()
+    except Exception as e:
+        logger.warning(f"⚠️ Directorio no disponible, búsqueda universal sin personas: {e}")
+        directorio_disponible = False
+    
+    if directorio_disponible:
+        personas = snapshot.derivado('indice_busqueda', construir_indice_busqueda).buscar_con_puntaje(query)
+        departamentos = snapshot.derivado('indice_departamentos_busqueda', construir_indice_departamentos_busqueda).buscar_con_puntaje(query)
+        grupos.append(grupo_busqueda('personas', personas, limite, datos_resultado_busqueda))
+        grupos.append(grupo_busqueda('departamentos', departamentos, limite,
+                                     lambda d: {'id': d['id'], 'nombre': d['nombre'], 'total_personas': d['total_personas']}))
+    
+    ubicaciones, procedimientos = buscar_lugares(query)
+    grupos.append(grupo_busqueda('ubicaciones', ubicaciones, limite))
+    grupos.append(grupo_busqueda('procedimientos', procedimientos, limite))
+    
+    # Orden estable: a igual mejor puntaje se mantiene personas, departamentos, ubicaciones, procedimientos
+    grupos = [g for g in grupos if g['total']]
+    grupos.sort(key=lambda g: -g['mejor_puntaje'])
+    
+    logger.info(f"🔎 Búsqueda universal: '{query}' -> {sum(g['total'] for g in grupos)} resultados en {(time.time() - inicio) * 1000:.1f}ms")
+    return Response({
+        'q': query,
+        'grupos': grupos,
+        'directorio_disponible': directorio_disponible
+    })
+
+def campos_contacto(valor: str):
+    """Campos donde buscar según lo escrito: con @ o letras el correo, solo dígitos teléfono y anexo"""
+    if '@' in valor or re.search(r'[^\d\s()+.-]', valor):
+        return ['correo']
+    return ['anexo', 'telefono']
+
+@api_view(['GET'])
+def buscar_contacto(request):
+    """Búsqueda inversa por anexo, teléfono o parte local del correo (recepción)
+    
+    Parámetros: q, campo (telefono, anexo o correo; si se omite se deduce
+    de q), prefijo=1 para buscar por comienzo en vez de coincidencia exacta
+    y limite. Responde desde índices ordenados del directorio en memoria,
+    sin búsquedas con comodines en LDAP.
+    """
+    valor = request.GET.get('q', '').strip()
+    campo = request.GET.get('campo', '').strip().lower()
+    prefijo = request.GET.get('prefijo', '').lower() in ('1', 'true', 'si', 'sí')
+    if campo and campo not in CAMPOS_CONTACTO:
+        return Response({'error': f'campo debe ser uno de: {", ".join(CAMPOS_CONTACTO)}'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limite = min(max(int(request.GET.get('limite', CONTACTO_LIMITE)), 1), MAX_CONTACTO_LIMITE)
+    except ValueError:
+        return Response({'error': 'limite debe ser un número entero'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    if not valor:
+        return Response({'error': 'Falta el parámetro q'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        snapshot = obtener_directorio()
+    except LDAPException as e:
+        logger.error(f"❌ No se pudo obtener el directorio desde LDAP: {e}")
+        return Response({'error': 'Error de conexión con el directorio activo'}, 
+                       status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
+    inicio = time.time()
+    indice = snapshot.derivado('indice_contactos', construir_indice_contactos)
+    campos = [campo] if campo else campos_contacto(valor)
+    # Una persona puede coincidir por anexo y por teléfono: se cuenta una vez
+    total = indice.contar(campos, valor, prefijo)
+    resultados = []
+    vistos = set()
+    for nombre_campo in campos:
+        _, pares = indice.buscar(nombre_campo, valor, prefijo, limite)
+        for persona, clave in pares:
+            if id(persona) in vistos or len(resultados) >= limite:
+                continue
+            vistos.add(id(persona))
+            resultados.append({**datos_resultado_busqueda(persona), 'coincidencia': {'campo': nombre_campo, 'valor': clave}})
+    
+    emoji = "✅" if resultados else "🔍"
+    logger.info(f"{emoji} Búsqueda de contacto: '{valor}' -> {len(resultados)} resultados en {(time.time() - inicio) * 1000:.2f}ms")
+    return Response({
+        'q': valor,
+        'prefijo': prefijo,
+        'total': total,
+        'resultados': resultados,
+        'version_directorio': snapshot.version
+    })
+
+def buscar_personas_fts(query, limite, cursor, version):
+    """Búsqueda en la tabla FTS5 (BM25, prefijos y fragmento resaltado en 'coincidencia')"""
+    inicio_pagina = 0
+    if cursor:
+        try:
+            inicio_pagina = decodificar_cursor(cursor, version)
+        except ValueError as e:
+            return Response({'error': f'{e}, repita la búsqueda'}, 
+                           status=status.HTTP_400_BAD_REQUEST)
+    
+    inicio = time.time()
+    total, results = buscar_fts(query, limite, inicio_pagina)
+    
+    emoji = "✅" if results else "🔍"
+    logger.info(f"{emoji} Búsqueda FTS: '{query}' -> {total} resultados en {(time.time() - inicio) * 1000:.1f}ms")
+    
+    response = Response(results)
+    response['X-Total-Count'] = str(total)
+    siguiente = inicio_pagina + limite
+    if siguiente < total:
+        response['X-Next-Cursor'] = codificar_cursor(version, siguiente)
+    return response
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def sincronizar_busqueda(request):
+    """Copiar el directorio a las tablas locales y reconstruir el índice FTS (solo staff)"""
+    if not request.user.is_staff:
+        return Response({'error': 'Solo disponible para staff'}, 
+                       status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        snapshot = obtener_directorio(forzar=request.data.get('recargar') is True)
+        estadisticas = sincronizar_directorio(snapshot.personas)
+    except LDAPException as e:
+        logger.error(f"❌ No se pudo obtener el directorio desde LDAP: {e}")
+        return Response({'error': 'Error de conexión con el directorio activo'}, 
+                       status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        logger.error(f"🚨 Error sincronizando el directorio: {e}", exc_info=True)
+        return Response({'error': 'Error sincronizando el directorio'}, 
+                       status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    logger.info(f"🗄️ Sincronización solicitada por {request.user.username}")
+    return Response({
+        'mensaje': 'Directorio sincronizado',
+        'version_directorio': snapshot.version,
+        'estadisticas': estadisticas,
+        'usuario': request.user.username
+    })
+
+def buscar_personas_en_ad(request, query):
+    """Búsqueda por subcadena directamente en AD (respaldo sin directorio en memoria)"""
+    cache_key = clave_cache_vista(request, "ldap_search", "search_ldap", {})
+    cached_response = cache_get_contenido(cache_key)
+    if cached_response is not None:
+        logger.info(f"✅ CACHE HIT ldap_search: {query}")
+        return add_cache_header(Response(cached_response), True, cache_key)
+    
     try:
-        conn = LDAPConnectionManager.get_connection()
-        
         # Construir filtro optimizado
-        query_parts = query.split()
+        query_parts = [escape_filter_chars(part) for part in query.split()]
         subfilters = [f"(|(givenName=*{part}*)(sn=*{part}*)(mail=*{part}*))" for part in query_parts]
         search_filter = f"(&(objectClass=person)(company=Envases CMF S.A.){''.join(subfilters)})"
 
-        # Atributos necesarios
-        attributes = [
-            'givenName', 'sn', 'mail', 'title', 'department',
-            'lastLogonTimestamp', 'telephoneNumber', 'company', 
-            'userAccountControl', 'distinguishedName','DisplayName'
-        ]
-
-        # Ejecutar búsqueda
-        conn.search(
-            search_base=settings.LDAP_CONFIG['BASE_DN'],
-            search_filter=search_filter,
-            attributes=attributes,
-            size_limit=50
-        )
+        # Ejecutar búsqueda (resultado compartido en el cache de consultas LDAP)
+        entradas = buscar_entradas_cacheadas(search_filter, size_limit=50, conectar=LDAPConnectionManager.get_connection)
 
         results = []
-        for entry in conn.entries:
-            attrs = procesar_atributos_ldap(entry.entry_attributes_as_dict)
+        for entrada in entradas:
+            attrs = procesar_atributos_ldap(entrada)
             
             # Verificar compañía y cuenta habilitada
             if (attrs.get('company') != 'Envases CMF S.A.' or 
                 not is_account_enabled(attrs.get('userAccountControl'))):
                 continue
-
-            # Procesar datos
-            attrs['lastLogonTimestamp'] = procesar_last_logon(attrs.get('lastLogonTimestamp'))
-            attrs['userAccountControl_enabled'] = True
             
-            # Limpiar datos innecesarios
-            attrs.pop('userAccountControl', None)
-            
-            results.append(attrs)
-
-        conn.unbind()
+            results.append(datos_resultado_busqueda(attrs))
         
         # ✅ LOG MEJORADO con emoji según resultados
         emoji = "✅" if results else "🔍"
         logger.info(f"{emoji} Búsqueda LDAP: '{query}' -> {len(results)} resultados")
-        return Response(results)
+        cache_set_contenido(cache_key, results, LDAP_CACHE_TIMEOUT)
+        return add_cache_header(Response(results), False, cache_key)
 
     except Exception as e:
         logger.error(f"🚨 Error en búsqueda LDAP '{query}': {e}")
@@ -350,6 +733,11 @@ def trabajador_detail_ldap(request):
         response['X-Cache'] = 'HIT'
         return response
     
+    # Descartar sin consultar AD los correos que no existen en el directorio
+    if not correo_puede_existir(correo):
+        logger.info(f"🚫 Correo fuera del directorio: {correo}")
+        return Response({'error': 'Trabajador no encontrado'}, status=404)
+    
     # 2. VERIFICAR SI YA HAY UNA REQUEST EN PROCESO PARA ESTE CORREO
     if RequestLockManager.is_locked(lock_key):
         logger.info(f"⏳ Request duplicada detectada para: {correo}, esperando...")
@@ -369,52 +757,43 @@ def trabajador_detail_ldap(request):
         return Response({'error': 'Demasiadas solicitudes simultáneas'}, status=429)
     
     try:
-        logger.info(f"🔍 CACHE MISS trabajador: {correo} - Buscando en LDAP")
+        # Si la persona está en el directorio en memoria no se consulta AD
+        snapshot = directorio_en_memoria()
+        en_memoria = persona_por_correo(snapshot, correo) if snapshot else None
         
-        # BUSCAR EN LDAP
-        conn = LDAPConnectionManager.get_connection()
-        
-        search_filter = f"(&(objectClass=person)(mail={correo})(company=Envases CMF S.A.))"
-        conn.search(
-            search_base=settings.LDAP_CONFIG['BASE_DN'],
-            search_filter=search_filter,
-            attributes=[
-                'givenName', 'sn', 'mail', 'title', 'department',
-                'lastLogonTimestamp', 'telephoneNumber', 'company',
-                'userAccountControl', 'manager', 'distinguishedName','DisplayName'
-            ]
-        )
+        if en_memoria is not None:
+            logger.info(f"🔍 CACHE MISS trabajador: {correo} - Resuelto desde el directorio en memoria")
+            persona = {attr: en_memoria.get(attr) for attr in ATRIBUTOS_TRABAJADOR}
+        else:
+            logger.info(f"🔍 CACHE MISS trabajador: {correo} - Buscando en LDAP")
+            
+            # BUSCAR EN LDAP (resultado compartido con el endpoint de lote)
+            search_filter = f"(&(objectClass=person)(mail={escape_filter_chars(correo)})(company=Envases CMF S.A.))"
+            entradas = buscar_entradas_cacheadas(search_filter, conectar=LDAPConnectionManager.get_connection)
 
-        if not conn.entries:
-            # Cachear también los "no encontrados" por 5 minutos
-            cache.set(cache_key, {'error': 'Trabajador no encontrado'}, 300)
-            logger.warning(f"❌ Trabajador no encontrado: {correo}")
-            return Response({'error': 'Trabajador no encontrado'}, status=404)
+            if not entradas:
+                # Cachear también los "no encontrados" por 5 minutos
+                cache.set(cache_key, {'error': 'Trabajador no encontrado'}, TRABAJADOR_NO_ENCONTRADO_TIMEOUT)
+                logger.warning(f"❌ Trabajador no encontrado: {correo}")
+                return Response({'error': 'Trabajador no encontrado'}, status=404)
 
-        entry = conn.entries[0]
-        persona = procesar_atributos_ldap(entry.entry_attributes_as_dict)
+            persona = procesar_atributos_ldap(entradas[0])
         
         if not is_account_enabled(persona.get('userAccountControl')):
             # Cachear cuentas deshabilitadas por 1 hora
-            cache.set(cache_key, {'error': 'Cuenta deshabilitada'}, 3600)
+            cache.set(cache_key, {'error': 'Cuenta deshabilitada'}, TRABAJADOR_DESHABILITADO_TIMEOUT)
             logger.warning(f"🚫 Cuenta deshabilitada: {correo}")
             return Response({'error': 'Cuenta deshabilitada'}, status=404)
 
-        # Procesar datos
-        persona['lastLogonTimestamp'] = procesar_last_logon(persona.get('lastLogonTimestamp'))
-        persona['userAccountControl_enabled'] = True
-        persona['supervisa_a'] = obtener_supervisados_optimizado(conn, persona)
-        
-        # Asegurar que DisplayName esté presente
-        if 'DisplayName' not in persona or not persona['DisplayName']:
-            persona['DisplayName'] = f"{persona.get('givenName', '')} {persona.get('sn', '')}".strip()
-        
-        persona.pop('userAccountControl', None)
-        
-        conn.unbind()
+        # Procesar datos (supervisados desde el índice de reportes si hay directorio)
+        if snapshot:
+            supervisados = supervisados_en_memoria(snapshot, persona)
+        else:
+            supervisados = obtener_supervisados_optimizado(persona)
+        persona = datos_detalle_trabajador(persona, supervisados)
         
-        # 4. GUARDAR EN CACHE (24 horas para detalles de trabajador)
-        cache.set(cache_key, persona, 3600)
+        # 4. GUARDAR EN CACHE (1 hora para detalles de trabajador)
+        cache.set(cache_key, persona, TRABAJADOR_CACHE_TIMEOUT)
         logger.info(f"💾 CACHE SET trabajador: {correo} -> {len(persona.get('supervisa_a', []))} supervisados")
         
         response = Response(persona)
@@ -431,7 +810,53 @@ def trabajador_detail_ldap(request):
         # SIEMPRE liberar el lock
         RequestLockManager.release_lock(lock_key)
 
-def obtener_supervisados_optimizado(conn: Connection, persona: Dict) -> List[Dict]:
+def datos_detalle_trabajador(persona: Dict, supervisados: List[Dict]) -> Dict:
+    """Detalle de trabajador listo para cachear a partir de sus atributos LDAP"""
+    persona['lastLogonTimestamp'] = procesar_last_logon(persona.get('lastLogonTimestamp'))
+    persona['userAccountControl_enabled'] = True
+    persona['supervisa_a'] = supervisados
+    
+    # Asegurar que DisplayName esté presente
+    if 'DisplayName' not in persona or not persona['DisplayName']:
+        persona['DisplayName'] = f"{persona.get('givenName', '')} {persona.get('sn', '')}".strip()
+    
+    persona.pop('userAccountControl', None)
+    return persona
+
+def datos_supervisado(attrs: Dict) -> Optional[Dict]:
+    """Resumen de un supervisado habilitado y con nombre (None si no corresponde)"""
+    if not is_account_enabled(attrs.get('userAccountControl')):
+        return None
+    
+    supervisado = {
+        'givenName': attrs.get('givenName', ''),
+        'sn': attrs.get('sn', ''),
+        'mail': attrs.get('mail', ''),
+        'title': attrs.get('title', ''),
+        'department': attrs.get('department', ''),
+        'userAccountControl_enabled': True
+    }
+    if not (supervisado['givenName'] and supervisado['sn']):
+        return None
+    return supervisado
+
+def directorio_en_memoria():
+    """Snapshot vigente ya cargado, sin forzar una lectura de LDAP (o None)"""
+    snapshot = directorio_cargado()
+    if snapshot is None or not snapshot.esta_vigente():
+        return None
+    return snapshot
+
+def supervisados_en_memoria(snapshot, persona: Dict) -> List[Dict]:
+    """Supervisados desde el índice de reportes directos del snapshot"""
+    supervisados = []
+    for reporte in reportes_directos(snapshot, persona.get('distinguishedName')):
+        supervisado = datos_supervisado(reporte)
+        if supervisado:
+            supervisados.append(supervisado)
+    return supervisados
+
+def obtener_supervisados_optimizado(persona: Dict) -> List[Dict]:
     """Obtener supervisados de forma optimizada - MEJORADA"""
     supervisados = []
     dn_actual = persona.get('distinguishedName')
@@ -441,32 +866,12 @@ def obtener_supervisados_optimizado(conn: Connection, persona: Dict) -> List[Dic
 
     try:
         # Escapar DN para búsqueda segura
-        dn_escaped = dn_actual.replace('(', '\\28').replace(')', '\\29')
-        search_filter = f"(&(objectClass=person)(manager={dn_escaped})(company=Envases CMF S.A.))"
+        search_filter = f"(&(objectClass=person)(manager={escape_filter_chars(dn_actual)})(company=Envases CMF S.A.))"
+        entradas = buscar_entradas_cacheadas(search_filter, conectar=LDAPConnectionManager.get_connection)
         
-        conn.search(
-            search_base=settings.LDAP_CONFIG['BASE_DN'],
-            search_filter=search_filter,
-            attributes=['givenName', 'sn', 'mail', 'title', 'department', 'userAccountControl','DisplayName']
-        )
-        
-        for entry in conn.entries:
-            attrs = procesar_atributos_ldap(entry.entry_attributes_as_dict)
-            
-            # Solo incluir cuentas habilitadas
-            if not is_account_enabled(attrs.get('userAccountControl')):
-                continue
-            
-            supervisado = {
-                'givenName': attrs.get('givenName', ''),
-                'sn': attrs.get('sn', ''),
-                'mail': attrs.get('mail', ''),
-                'title': attrs.get('title', ''),
-                'department': attrs.get('department', ''),
-                'userAccountControl_enabled': True
-            }
-            
-            if supervisado['givenName'] and supervisado['sn']:
+        for entrada in entradas:
+            supervisado = datos_supervisado(procesar_atributos_ldap(entrada))
+            if supervisado:
                 supervisados.append(supervisado)
                 
     except Exception as e:
@@ -474,6 +879,141 @@ def obtener_supervisados_optimizado(conn: Connection, persona: Dict) -> List[Dic
     
     return supervisados
 
+def buscar_trabajadores_por_correo(correos: List[str]) -> Dict[str, Dict]:
+    """correo -> atributos LDAP, resolviendo todos los correos con una sola búsqueda OR"""
+    condiciones = ''.join(f"(mail={escape_filter_chars(correo)})" for correo in correos)
+    entradas = buscar_entradas_cacheadas(
+        f"(&(objectClass=person)(|{condiciones})(company=Envases CMF S.A.))",
+        conectar=LDAPConnectionManager.get_connection
+    )
+    
+    encontrados = {}
+    for entrada in entradas:
+        attrs = procesar_atributos_ldap(entrada)
+        correo = str(attrs.get('mail') or '').strip().lower()
+        # Igual que la búsqueda individual: se usa la primera entrada por correo
+        if correo and correo not in encontrados:
+            encontrados[correo] = attrs
+    return encontrados
+
+def buscar_supervisados_por_manager(dns: List[str]) -> Dict[str, List[Dict]]:
+    """DN del manager (en minúsculas) -> supervisados, con una sola búsqueda OR"""
+    supervisados = {}
+    if not dns:
+        return supervisados
+    
+    condiciones = ''.join(f"(manager={escape_filter_chars(dn)})" for dn in dns)
+    entradas = buscar_entradas_cacheadas(
+        f"(&(objectClass=person)(|{condiciones})(company=Envases CMF S.A.))",
+        conectar=LDAPConnectionManager.get_connection
+    )
+    
+    for entrada in entradas:
+        attrs = procesar_atributos_ldap(entrada)
+        supervisado = datos_supervisado(attrs)
+        if supervisado and attrs.get('manager'):
+            supervisados.setdefault(str(attrs['manager']).lower(), []).append(supervisado)
+    return supervisados
+
+@api_view(['POST'])
+@handle_ldap_errors
+def trabajadores_batch_ldap(request):
+    """Detalle de varios trabajadores en una sola request
+    
+    Body: {"correos": ["a@cmf.cl", ...]} (máximo MAX_CORREOS_LOTE). Los
+    detalles en cache se leen con un solo get_many; los faltantes salen del
+    directorio en memoria o, si no están, de una búsqueda OR por correo (y
+    otra por manager si no hay directorio cargado) que pasa por el cache de
+    consultas LDAP compartido con el detalle individual, y se guardan con
+    set_many bajo las mismas claves que el endpoint individual.
+    La respuesta va indexada por correo; los no encontrados llevan 'error'.
+    """
+    correos = request.data.get('correos') if isinstance(request.data, dict) else None
+    if not isinstance(correos, list) or not all(isinstance(c, str) for c in correos):
+        return Response({'error': 'Se requiere "correos": lista de correos'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    # Normalizar y quitar duplicados conservando el orden
+    correos = list(dict.fromkeys(c.strip().lower() for c in correos if c.strip()))
+    if len(correos) > MAX_CORREOS_LOTE:
+        return Response({'error': f'Máximo {MAX_CORREOS_LOTE} correos por solicitud'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    # 1. Cache: una sola lectura para todo el lote
+    claves = {correo: f"trabajador_detail_{correo}" for correo in correos}
+    en_cache = cache.get_many(list(claves.values()))
+    resultados = {correo: en_cache[clave] for correo, clave in claves.items() if clave in en_cache}
+    cache_hits = len(resultados)
+    
+    faltantes = []
+    for correo in correos:
+        if correo in resultados:
+            continue
+        if not correo_puede_existir(correo):
+            resultados[correo] = {'error': 'Trabajador no encontrado'}
+        else:
+            faltantes.append(correo)
+    
+    # 2. Directorio en memoria y, para lo que no esté, una búsqueda por correo y una por manager en AD
+    if faltantes:
+        snapshot = directorio_en_memoria()
+        encontrados = {}
+        if snapshot:
+            for correo in faltantes:
+                persona = persona_por_correo(snapshot, correo)
+                if persona is not None:
+                    encontrados[correo] = {attr: persona.get(attr) for attr in ATRIBUTOS_TRABAJADOR}
+        
+        por_buscar = [correo for correo in faltantes if correo not in encontrados]
+        supervisados = {}
+        if por_buscar:
+            encontrados.update(buscar_trabajadores_por_correo(por_buscar))
+        if not snapshot:
+            dns = [
+                attrs['distinguishedName'] for attrs in encontrados.values()
+                if attrs.get('distinguishedName') and is_account_enabled(attrs.get('userAccountControl'))
+            ]
+            supervisados = buscar_supervisados_por_manager(dns)
+        
+        habilitados = {
+            correo: attrs for correo, attrs in encontrados.items()
+            if is_account_enabled(attrs.get('userAccountControl'))
+        }
+        if snapshot:
+            supervisados = {
+                str(attrs.get('distinguishedName') or '').lower(): supervisados_en_memoria(snapshot, attrs)
+                for attrs in habilitados.values()
+            }
+        
+        # 3. Guardar en cache con set_many, agrupado por tiempo de vida
+        por_timeout = {}
+        for correo in faltantes:
+            attrs = encontrados.get(correo)
+            if attrs is None:
+                detalle, timeout = {'error': 'Trabajador no encontrado'}, TRABAJADOR_NO_ENCONTRADO_TIMEOUT
+            elif correo not in habilitados:
+                detalle, timeout = {'error': 'Cuenta deshabilitada'}, TRABAJADOR_DESHABILITADO_TIMEOUT
+            else:
+                dn = str(attrs.get('distinguishedName') or '').lower()
+                detalle = datos_detalle_trabajador(attrs, supervisados.get(dn, []) if dn else [])
+                timeout = TRABAJADOR_CACHE_TIMEOUT
+            resultados[correo] = detalle
+            por_timeout.setdefault(timeout, {})[claves[correo]] = detalle
+        
+        for timeout, valores in por_timeout.items():
+            cache.set_many(valores, timeout)
+    
+    logger.info(f"📦 Lote de trabajadores: {len(correos)} correos, {cache_hits} en cache, {len(faltantes)} resueltos fuera de cache")
+    
+    response = Response({
+        'resultados': {correo: resultados[correo] for correo in correos},
+        'total': len(correos),
+        'cache_hits': cache_hits,
+        'consultados': len(faltantes)
+    })
+    response['X-Cache'] = 'HIT' if not faltantes else 'MISS'
+    return response
+
 
 # ========== VISTAS DE AUTENTICACIÓN MEJORADAS ==========
 
@@ -624,34 +1164,6 @@ def check_auth(request):
         })
     return Response({'autenticado': False})
 
-def obtener_prioridad_jerarquia(titulo: str) -> int:
-    """Obtener prioridad numérica para ordenar cargos jerárquicos
-    
-    Args:
-        titulo (str): El título del cargo
-        
-    Returns:
-        int: Prioridad numérica (menor número = mayor jerarquía)
-    """
-    if not titulo:
-        return 999
-        
-    titulo = titulo.lower()
-    
-    # Prioridades de más alta a más baja
-    if 'gerente general' in titulo:
-        return 1
-    elif 'gerente' in titulo and 'subgerente' not in titulo:
-        return 2
-    elif 'subgerente' in titulo:
-        return 3
-    elif 'jefe' in titulo or 'jefa' in titulo:
-        return 4
-    elif any(palabra in titulo for palabra in ['coordinador', 'coordinadora', 'encargado', 'encargada']):
-        return 5
-    else:
-        return 6
-
 def autenticar_smtp(server, username, password):
     """Maneja la autenticación SMTP con manejo de errores detallado"""
     try:
@@ -947,6 +1459,40 @@ def enviar_correo(request):
 
 # ========== VIEWSETS OPTIMIZADOS ==========
 
+def presupuesto_consultas(maximo: int):
+    """Presupuesto de consultas SQL de una acción (los tests lo verifican con assertNumQueries)
+    
+    Solo con DEBUG se cuentan las consultas: la respuesta lleva los headers
+    X-Query-Count y X-Query-Budget y, si una acción pasa de `maximo` (por
+    ejemplo un serializer que vuelve a consultar por fila), se registra una
+    advertencia. En producción la acción se ejecuta sin envoltura.
+    """
+    def decorador(accion):
+        @wraps(accion)
+        def envoltura(self, request, *args, **kwargs):
+            if not settings.DEBUG:
+                return accion(self, request, *args, **kwargs)
+            
+            consultas = []
+            
+            def contar(execute, sql, params, many, context):
+                consultas.append(sql)
+                return execute(sql, params, many, context)
+            
+            with connection.execute_wrapper(contar):
+                response = accion(self, request, *args, **kwargs)
+            
+            response['X-Query-Count'] = str(len(consultas))
+            response['X-Query-Budget'] = str(maximo)
+            if len(consultas) > maximo:
+                logger.warning(
+                    f"⚠️ {type(self).__name__}.{accion.__name__} usó {len(consultas)} consultas "
+                    f"(presupuesto {maximo}): {request.get_full_path()}"
+                )
+            return response
+        return envoltura
+    return decorador
+
 class UbicacionViewSet(viewsets.ModelViewSet):
     queryset = Ubicacion.objects.all()
     serializer_class = UbicacionSerializer
@@ -963,14 +1509,47 @@ class UbicacionViewSet(viewsets.ModelViewSet):
         response = super().list(request, *args, **kwargs)
         cache.set(cache_key, response.data, CACHE_TIMEOUT)
         return add_cache_header(response, False)
+    
+    def get_queryset(self):
+        if self.action == 'trabajadores':
+            return Ubicacion.objects.select_related('departamento')
+        return super().get_queryset()
+    
+    @action(detail=True, methods=['get'])
+    @presupuesto_consultas(2)
+    def trabajadores(self, request, pk=None):
+        """Trabajadores activos del departamento de la ubicación (al tocar un marcador del mapa)"""
+        ubicacion = self.get_object()
+        departamento = ubicacion.departamento
+        if departamento is None:
+            return Response({'ubicacion_id': ubicacion.id, 'departamento': None, 'trabajadores': []})
+        
+        trabajadores = (
+            Trabajador.objects
+            .filter(departamento=departamento, cuenta_activa=True)
+            .select_related('departamento')
+            .order_by('apellido', 'nombre', 'id')
+        )
+        return Response({
+            'ubicacion_id': ubicacion.id,
+            'departamento': DepartamentoReferenciaSerializer(departamento).data,
+            'trabajadores': TrabajadorListaSerializer(trabajadores, many=True).data,
+        })
 
 class MapaViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Mapa.objects.all()
+    """Mapas con sus ubicaciones y solo id/nombre del departamento de cada una
+    
+    3 consultas (mapas, ubicaciones, departamentos) sin importar cuántos
+    marcadores haya; los trabajadores se cargan por marcador con
+    ubicaciones/<id>/trabajadores/.
+    """
+    queryset = Mapa.objects.prefetch_related('ubicaciones__departamento')
     serializer_class = MapaSerializer
     
+    @presupuesto_consultas(3)
     def list(self, request, *args, **kwargs):
         """Lista optimizada con cache"""
-        cache_key = 'mapas_list'
+        cache_key = 'mapas_list_plano'
         cached_data = cache.get(cache_key)
         
         if cached_data is not None:
@@ -980,60 +1559,483 @@ class MapaViewSet(viewsets.ReadOnlyModelViewSet):
         response = super().list(request, *args, **kwargs)
         cache.set(cache_key, response.data, CACHE_TIMEOUT)
         return add_cache_header(response, False)
+    
+    @presupuesto_consultas(3)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+# ========== LECTURA DE TABLAS LOCALES (TRABAJADOR / DEPARTAMENTO) ==========
+
+def parametro_entero(request, nombre: str) -> Optional[int]:
+    valor = request.GET.get(nombre)
+    if not valor:
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        raise ValidationError({nombre: 'debe ser un número entero'})
+
+class PaginacionPorClave(CursorPagination):
+    """Paginación por la clave completa de `ordering` (campos ascendentes, el último único)
+    
+    CursorPagination de DRF guarda en el cursor solo el primer campo del
+    orden más un desplazamiento: con muchos apellidos repetidos cada página
+    hace OFFSET sobre todo el grupo. Aquí el cursor guarda la clave de la
+    fila del borde y cada página es un solo SELECT con
+    (a, b, id) > (valores del cursor) y LIMIT sobre el índice compuesto,
+    sin COUNT ni OFFSET: una página profunda cuesta lo mismo que la primera.
+    """
+    page_size = 50
+    page_size_query_param = 'limite'
+    max_page_size = 200
+    
+    def clave_fila(self, fila):
+        return json.dumps([getattr(fila, campo) for campo in self.ordering], ensure_ascii=False)
+    
+    def filtro_desde(self, posicion, reverso):
+        """Filas después (o antes, si reverso) de la clave del cursor"""
+        try:
+            valores = json.loads(posicion)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(valores, list) or len(valores) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        
+        comparacion = 'lt' if reverso else 'gt'
+        filtro = Q()
+        for i, campo in enumerate(self.ordering):
+            iguales = {anterior: valores[j] for j, anterior in enumerate(self.ordering[:i])}
+            filtro |= Q(**iguales, **{f'{campo}__{comparacion}': valores[i]})
+        return filtro
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverso = self.cursor is not None and self.cursor.reverse
+        if self.cursor is not None and self.cursor.position is not None:
+            queryset = queryset.filter(self.filtro_desde(self.cursor.position, reverso))
+        
+        orden = [f'-{campo}' for campo in self.ordering] if reverso else list(self.ordering)
+        filas = list(queryset.order_by(*orden)[:self.page_size + 1])
+        hay_mas = len(filas) > self.page_size
+        self.page = filas[:self.page_size]
+        if reverso:
+            self.page.reverse()
+        
+        # Yendo hacia atrás siempre hay filas después; hacia adelante, antes si vino con cursor
+        self.has_next = bool(self.page) and (reverso or hay_mas)
+        self.has_previous = bool(self.page) and (hay_mas if reverso else self.cursor is not None)
+        return self.page
+    
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.clave_fila(self.page[-1])))
+    
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.clave_fila(self.page[0])))
+
+class PaginacionTrabajadores(PaginacionPorClave):
+    ordering = ('apellido', 'nombre', 'id')
+
+class PaginacionDepartamentos(PaginacionPorClave):
+    ordering = ('nombre', 'id')
+
+class TrabajadorLocalViewSet(viewsets.ReadOnlyModelViewSet):
+    """Trabajadores de las tablas locales (copiadas con sincronizar_ldap)
+    
+    Lista plana con el departamento por select_related: 1 consulta por
+    página. Filtros: departamento (id) y activos=0 para incluir cuentas
+    deshabilitadas. El detalle trae jefes y supervisados directos con
+    Prefetch: 3 consultas.
+    """
+    pagination_class = PaginacionTrabajadores
+    
+    def get_queryset(self):
+        queryset = Trabajador.objects.select_related('departamento')
+        if self.action == 'retrieve':
+            resumen = Trabajador.objects.only('id', 'nombre', 'apellido', 'cargo').order_by('apellido', 'nombre', 'id')
+            return queryset.prefetch_related(
+                Prefetch('supervisa_a', queryset=resumen, to_attr='subordinados_directos'),
+                Prefetch('supervisado_por', queryset=resumen, to_attr='jefes_directos'),
+            )
+        
+        if self.request.GET.get('activos', '1') != '0':
+            queryset = queryset.filter(cuenta_activa=True)
+        departamento = parametro_entero(self.request, 'departamento')
+        if departamento is not None:
+            queryset = queryset.filter(departamento_id=departamento)
+        return queryset
+    
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return TrabajadorDetalleSerializer
+        return TrabajadorListaSerializer
+    
+    @presupuesto_consultas(1)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @presupuesto_consultas(3)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+class DepartamentoLocalViewSet(viewsets.ReadOnlyModelViewSet):
+    """Departamentos de las tablas locales con su jefe y el total de trabajadores activos
+    
+    Lista: 1 consulta por página (jefe por select_related y total como
+    COUNT agregado). Detalle: 2 consultas, con los trabajadores activos
+    por Prefetch.
+    """
+    pagination_class = PaginacionDepartamentos
+    
+    def get_queryset(self):
+        queryset = Departamento.objects.select_related('jefe').annotate(
+            total_trabajadores=Count('trabajadores', filter=Q(trabajadores__cuenta_activa=True))
+        )
+        if self.action == 'retrieve':
+            activos = (
+                Trabajador.objects.filter(cuenta_activa=True)
+                .only('id', 'nombre', 'apellido', 'cargo', 'departamento')
+                .order_by('apellido', 'nombre', 'id')
+            )
+            queryset = queryset.prefetch_related(Prefetch('trabajadores', queryset=activos, to_attr='trabajadores_activos'))
+        return queryset
+    
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return DepartamentoDetalleSerializer
+        return DepartamentoListaSerializer
+    
+    @presupuesto_consultas(1)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @presupuesto_consultas(2)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+# ========== JERARQUÍA LOCAL (CIERRE DE SUPERVISIÓN) ==========
+
+def datos_trabajador_local(trabajador) -> Dict:
+    return {
+        'id': trabajador.id,
+        'nombre': trabajador.nombre,
+        'apellido': trabajador.apellido,
+        'cargo': trabajador.cargo,
+        'email': trabajador.email,
+        'departamento': trabajador.departamento.nombre if trabajador.departamento else None,
+        'cuenta_activa': trabajador.cuenta_activa,
+    }
+
+def trabajador_no_encontrado(trabajador_id):
+    """404 si el trabajador no existe (solo se consulta cuando la respuesta vino vacía)"""
+    if Trabajador.objects.filter(id=trabajador_id).exists():
+        return None
+    return Response({'error': 'Trabajador no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+
+@api_view(['GET'])
+def trabajador_subordinados(request, trabajador_id):
+    """Todas las personas bajo un trabajador (directas e indirectas), por nivel
+    
+    Un solo SELECT sobre el cierre de supervisión. Parámetros:
+    profundidad_max (1 = solo directos) y limite.
+    """
+    try:
+        profundidad_max = int(request.GET['profundidad_max']) if request.GET.get('profundidad_max') else None
+        limite = min(max(int(request.GET.get('limite', SUBORDINADOS_LIMITE)), 1), MAX_SUBORDINADOS_LIMITE)
+    except ValueError:
+        return Response({'error': 'profundidad_max y limite deben ser números enteros'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    filas = list(subordinados(trabajador_id, profundidad_max)[:limite + 1])
+    if not filas:
+        no_encontrado = trabajador_no_encontrado(trabajador_id)
+        if no_encontrado:
+            return no_encontrado
+    
+    return Response({
+        'trabajador_id': trabajador_id,
+        'subordinados': [
+            {**datos_trabajador_local(fila.subordinado), 'profundidad': fila.profundidad}
+            for fila in filas[:limite]
+        ],
+        'hay_mas': len(filas) > limite
+    })
+
+@api_view(['GET'])
+def trabajador_cadena_mando(request, trabajador_id):
+    """Jefes de un trabajador desde el directo hacia arriba (un solo SELECT)"""
+    filas = list(cadena_mando(trabajador_id))
+    if not filas:
+        no_encontrado = trabajador_no_encontrado(trabajador_id)
+        if no_encontrado:
+            return no_encontrado
+    
+    return Response({
+        'trabajador_id': trabajador_id,
+        'cadena': [
+            {**datos_trabajador_local(fila.jefe), 'profundidad': fila.profundidad}
+            for fila in filas
+        ]
+    })
+
+@api_view(['GET'])
+def trabajador_total_subordinados(request, trabajador_id):
+    """Cantidad de personas bajo un trabajador, total y por nivel (un solo SELECT agrupado)"""
+    por_profundidad = conteo_subordinados(trabajador_id)
+    if not por_profundidad:
+        no_encontrado = trabajador_no_encontrado(trabajador_id)
+        if no_encontrado:
+            return no_encontrado
+    
+    return Response({
+        'trabajador_id': trabajador_id,
+        'total': sum(por_profundidad.values()),
+        'directos': por_profundidad.get(1, 0),
+        'por_profundidad': por_profundidad
+    })
+
+# ========== RECURSO DE DEPARTAMENTO ==========
+
+def derivado_con_reglas(snapshot, nombre, constructor):
+    """Derivado que depende de las reglas de cargo, guardado por versión de reglas
+
+    Si RR.HH. cambia una regla, árboles y jerarcas se recalculan sin esperar
+    una nueva versión del directorio.
+    """
+    return snapshot.derivado(f'{nombre}@{version_reglas()}', constructor)
+
+def construir_motor_directorio(snapshot):
+    """Motor de jerarquía sobre todas las personas activas (para resolver jefes)"""
+    return MotorJerarquia(snapshot.personas_activas)
+
+def construir_subareas_departamentos(snapshot):
+    """id de departamento -> ids de los departamentos que le reportan
+    
+    B es subárea de A si alguna persona de B tiene como manager a alguien de A.
+    """
+    registro = snapshot.derivado('registro_departamentos', construir_registro_departamentos)
+    departamento_por_dn = {}
+    for persona in snapshot.personas_activas:
+        departamento = registro.resolver(persona.get('department'))
+        if departamento is not None and persona.get('distinguishedName'):
+            departamento_por_dn.setdefault(persona['distinguishedName'], departamento)
+    
+    subareas = {}
+    for persona in snapshot.personas_activas:
+        hijo = departamento_por_dn.get(persona.get('distinguishedName'))
+        padre = departamento_por_dn.get(persona.get('manager'))
+        if hijo is not None and padre is not None and padre is not hijo:
+            subareas.setdefault(padre.id, set()).add(hijo.id)
+    return subareas
+
+def datos_trabajador_departamento(persona):
+    datos = {attr: persona.get(attr) for attr in ATRIBUTOS_TRABAJADOR_DEPARTAMENTO}
+    datos['lastLogonTimestamp'] = procesar_last_logon(datos['lastLogonTimestamp'])
+    datos['userAccountControl_enabled'] = True
+    return datos
+
+def construir_recurso_departamento(snapshot, departamento):
+    """Todas las expansiones de un departamento, calculadas desde el snapshot"""
+    registro = snapshot.derivado('registro_departamentos', construir_registro_departamentos)
+    motor = derivado_con_reglas(snapshot, 'motor_directorio', construir_motor_directorio)
+    miembros = departamento.miembros_activos
+    trabajadores = [datos_trabajador_departamento(p) for p in miembros]
+    
+    jerarca = motor.resolver_miembros(miembros)
+    jefe = jefe_completo = None
+    jerarca_es_interno = False
+    if jerarca:
+        jefe = datos_trabajador_departamento(jerarca)
+        jefe_completo = {attr: jerarca.get(attr) for attr in ATRIBUTOS_JEFE_COMPLETO}
+        jefe_completo['userAccountControl_enabled'] = True
+        jerarca_es_interno = any(p is jerarca for p in miembros)
+    
+    subareas = []
+    for id_subarea in snapshot.derivado('subareas_departamentos', construir_subareas_departamentos).get(departamento.id, ()):
+        subarea = registro.resolver(id_subarea)
+        subareas.append({
+            'id': subarea.id,
+            'nombre': subarea.nombre,
+            'total_trabajadores': len(subarea.miembros_activos)
+        })
+    subareas.sort(key=lambda d: d['nombre'].lower())
+    
+    recurso = {
+        'id': departamento.id,
+        'departamento': departamento.nombre,
+        'variantes': departamento.variantes,
+        'total_trabajadores': len(trabajadores),
+        'trabajadores': trabajadores,
+        'jefe': jefe,
+        'jefe_completo': jefe_completo,
+        'estadisticas': {
+            'con_email': len([t for t in trabajadores if t.get('mail')]),
+            'con_telefono': len([t for t in trabajadores if t.get('telephoneNumber')]),
+            'con_cargo': len([t for t in trabajadores if t.get('title')]),
+            'cargos_jerarquicos': len([p for p in miembros if es_cargo_jerarquico_valido(p)]),
+            'sin_manager': len([t for t in trabajadores if not t.get('manager')])
+        },
+        'subareas': subareas,
+        'metadatos': {
+            'jerarca_encontrado': jerarca is not None,
+            'jerarca_es_interno': jerarca_es_interno
+        }
+    }
+    # Versión del departamento: cambia solo si cambian sus propios datos
+    recurso['version'] = hash_payload(recurso)[:16]
+    return recurso
+
+def clave_alias_departamento(nombre):
+    """Clave que apunta a la última entrada del recurso armada para ese nombre, variante o id"""
+    return construir_clave_cache('departamento_alias', 'departamento', '', {
+        'nombre': normalizar_departamento(nombre), 'reglas': version_reglas()
+    })
+
+def obtener_recurso_departamento(nombre):
+    """(recurso, cache_hit) del departamento pedido por nombre, variante o id; (None, False) si no existe
+    
+    El recurso completo se guarda en una sola entrada de cache por
+    departamento, versión del directorio y de las reglas de cargo; los endpoints solo proyectan
+    las partes que necesitan. Un proceso que aún no tiene el directorio en
+    memoria responde desde cache (vía el alias del nombre) mientras lo carga
+    en segundo plano, en vez de leer todo LDAP dentro de la request.
+    """
+    if snapshot_sin_bloquear() is None:
+        cache_key = cache.get(clave_alias_departamento(nombre))
+        recurso = cache_get_contenido(cache_key) if cache_key else None
+        if recurso is not None:
+            return recurso, True
+    
+    snapshot = obtener_directorio()
+    departamento = snapshot.derivado('registro_departamentos', construir_registro_departamentos).resolver(nombre)
+    if departamento is None:
+        return None, False
+    
+    cache_key = construir_clave_cache('departamento_recurso', 'departamento', '', {
+        'id': departamento.id, 'version': snapshot.version, 'reglas': version_reglas()
+    })
+    recurso = cache_get_contenido(cache_key)
+    if recurso is not None:
+        return recurso, True
+    
+    inicio = time.time()
+    recurso = construir_recurso_departamento(snapshot, departamento)
+    cache_set_contenido(cache_key, recurso, LDAP_CACHE_TIMEOUT)
+    cache.set_many({
+        clave_alias_departamento(alias): cache_key for alias in [departamento.id, *departamento.variantes]
+    }, LDAP_CACHE_TIMEOUT)
+    logger.info(f"🏢 Recurso de departamento '{departamento.nombre}': {recurso['total_trabajadores']} trabajadores en {time.time() - inicio:.3f}s")
+    return recurso, False
+
+def respuesta_recurso_departamento(nombre, proyectar):
+    """Respuesta de un endpoint de departamento a partir del recurso unificado
+    
+    Los errores los maneja cada endpoint, que conserva su propio mensaje.
+    """
+    recurso, cache_hit = obtener_recurso_departamento(nombre)
+    if recurso is None:
+        return Response({'error': 'Departamento no encontrado'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    return add_cache_header(Response(proyectar(recurso)), cache_hit)
+
+def proyectar_persona_departamento(persona, campos):
+    """Atributos pedidos de un trabajador o jefe del recurso (None si no hay persona)"""
+    if persona is None:
+        return None
+    datos = {attr: persona[attr] for attr in campos}
+    datos['userAccountControl_enabled'] = True
+    return datos
+
+@api_view(['GET'])
+def get_departamento(request, departamento):
+    """Recurso unificado de departamento (por nombre, variante o id)
+    
+    Siempre incluye id, nombre canónico y total de trabajadores. Con
+    ?include= se agregan partes separadas por coma: members, jefe,
+    jefe_completo, stats y subareas.
+    """
+    includes = [parte.strip() for parte in request.GET.get('include', '').split(',') if parte.strip()]
+    invalidos = [parte for parte in includes if parte not in INCLUDES_DEPARTAMENTO]
+    if invalidos:
+        return Response({'error': f"include no válido: {', '.join(invalidos)}",
+                         'permitidos': list(INCLUDES_DEPARTAMENTO)},
+                        status=status.HTTP_400_BAD_REQUEST)
+    
+    def proyectar(recurso):
+        datos = {
+            'id': recurso['id'],
+            'departamento': recurso['departamento'],
+            'variantes': recurso['variantes'],
+            'total_trabajadores': recurso['total_trabajadores'],
+            'version': recurso['version']
+        }
+        if 'members' in includes:
+            datos['trabajadores'] = recurso['trabajadores']
+        if 'jefe' in includes:
+            datos['jefe'] = recurso['jefe']
+            datos['metadatos'] = recurso['metadatos']
+        if 'jefe_completo' in includes:
+            datos['jefe_completo'] = recurso['jefe_completo']
+        if 'stats' in includes:
+            datos['estadisticas'] = recurso['estadisticas']
+        if 'subareas' in includes:
+            datos['subareas'] = recurso['subareas']
+        return datos
+    
+    try:
+        response = respuesta_recurso_departamento(departamento, proyectar)
+    except LDAPException as e:
+        logger.error(f"❌ No se pudo obtener el directorio desde LDAP: {e}")
+        return Response({'error': 'Error de conexión con el directorio activo'}, 
+                       status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        logger.error(f"🚨 Error en recurso de departamento {departamento}: {e}", exc_info=True)
+        return Response({'error': 'Error obteniendo departamento'}, 
+                       status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    if response.status_code == status.HTTP_200_OK:
+        etag = f'"{response.data["version"]}-{"-".join(sorted(set(includes)))}"'
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        response['ETag'] = etag
+    return response
 
 # ========== VISTAS ADICIONALES MEJORADAS ==========
 
 @api_view(['GET'])
-@cache_response(timeout=LDAP_CACHE_TIMEOUT, key_prefix="departamento_detail")
 def departamento_detail_ldap(request):
-    """Detalle de departamento optimizado - MEJORADA"""
+    """Detalle de departamento (adaptador del recurso unificado)"""
     nombre_departamento = request.GET.get('nombre', '').strip()
     if not nombre_departamento:
         return Response({'error': 'Nombre de departamento requerido'}, 
                        status=status.HTTP_400_BAD_REQUEST)
-
-    try:
-        conn = LDAPConnectionManager.get_connection()
-        
-        search_filter = f"(&(objectClass=person)(department={nombre_departamento})(company=Envases CMF S.A.))"
-        
-        conn.search(
-            search_base=settings.LDAP_CONFIG['BASE_DN'],
-            search_filter=search_filter,
-            attributes=['givenName', 'sn', 'mail', 'title', 'department', 
-                       'telephoneNumber', 'lastLogonTimestamp', 'userAccountControl']
-        )
-
-        trabajadores = []
-        for entry in conn.entries:
-            attrs = procesar_atributos_ldap(entry.entry_attributes_as_dict)
-            
-            # Solo cuentas habilitadas
-            if not is_account_enabled(attrs.get('userAccountControl')):
-                continue
-            
-            # Procesar datos
-            attrs['lastLogonTimestamp'] = procesar_last_logon(attrs.get('lastLogonTimestamp'))
-            attrs['userAccountControl_enabled'] = True
-            attrs.pop('userAccountControl', None)
-            
-            trabajadores.append(attrs)
-
-        conn.unbind()
-        
-        logger.info(f"Detalle departamento: {nombre_departamento} -> {len(trabajadores)} trabajadores")
-        
-        return Response({
-            'departamento': nombre_departamento,
-            'total_trabajadores': len(trabajadores),
-            'trabajadores': trabajadores,
+    
+    def proyectar(recurso):
+        estadisticas = recurso['estadisticas']
+        return {
+            'departamento': recurso['departamento'],
+            'total_trabajadores': recurso['total_trabajadores'],
+            'trabajadores': [
+                proyectar_persona_departamento(t, ATRIBUTOS_DETALLE_DEPARTAMENTO) for t in recurso['trabajadores']
+            ],
             'estadisticas': {
-                'con_email': len([t for t in trabajadores if t.get('mail')]),
-                'con_telefono': len([t for t in trabajadores if t.get('telephoneNumber')]),
-                'con_cargo': len([t for t in trabajadores if t.get('title')])
+                'con_email': estadisticas['con_email'],
+                'con_telefono': estadisticas['con_telefono'],
+                'con_cargo': estadisticas['con_cargo']
             }
-        })
-
+        }
+    
+    try:
+        return respuesta_recurso_departamento(nombre_departamento, proyectar)
     except Exception as e:
         logger.error(f"Error en detalle departamento {nombre_departamento}: {e}")
         return Response({'error': 'Error obteniendo departamento'}, 
@@ -1061,6 +2063,7 @@ def limpiar_cache_ldap(request):
                    OR key LIKE '%jefes_%' 
                    OR key LIKE '%arbol_%' 
                    OR key LIKE '%departamento_%'
+                   OR key LIKE '%cas!_%' ESCAPE '!'
             """)
             entradas_eliminadas = cursor.rowcount
         
@@ -1136,6 +2139,7 @@ def get_estadisticas_cache(request):
             'departamento_': 0,
             'arbol_': 0,
             'trabajador_detail_': 0,
+            'cas_payload_': 0,
             'total': 0
         }
         
@@ -1164,6 +2168,7 @@ def get_estadisticas_cache(request):
                         elif 'departamento_' in key: cache_patterns['departamento_'] += 1
                         elif 'arbol_' in key: cache_patterns['arbol_'] += 1
                         elif 'trabajador_detail_' in key: cache_patterns['trabajador_detail_'] += 1
+                        elif 'cas_payload_' in key: cache_patterns['cas_payload_'] += 1
                     
                     # Obtener estadísticas de expiración
                     cursor.execute("""
@@ -1189,6 +2194,10 @@ def get_estadisticas_cache(request):
             'estadisticas_cache': cache_stats,
             'keys_por_tipo': cache_patterns,
             'total_keys': cache_patterns['total'],
+            'directorio': info_directorio(),
+            'consultas_ldap': estadisticas_consultas_ldap(),
+            'ejecutor': estadisticas_ejecutor(),
+            'clasificador_cargos': info_clasificador(),
             'backend': str(type(cache)),
             'timestamp': datetime.now().isoformat()
         })
@@ -1198,13 +2207,17 @@ def get_estadisticas_cache(request):
         return Response({'error': 'Error obteniendo estadísticas'}, status=500)
 
 # Decorador de cache personalizado CORREGIDO
-def cache_response(timeout: int, key_prefix: str = ""):
-    """Decorador para cachear respuestas CON LOGGING COLORIDO"""
+def cache_response(timeout: int, key_prefix: str = "", depende_de_reglas=False):
+    """Decorador para cachear respuestas CON LOGGING COLORIDO
+    
+    Con `depende_de_reglas` la clave incluye la versión de las reglas de cargo.
+    """
     def decorator(func):
         @wraps(func)
         def wrapper(request, *args, **kwargs):
-            # Generar clave de cache única
-            cache_key = f"{key_prefix}_{func.__name__}_{request.GET.urlencode()}"
+            # Generar clave de cache canónica (incluye argumentos de ruta)
+            prefijo = f"{key_prefix}@{version_reglas()}" if depende_de_reglas else key_prefix
+            cache_key = clave_cache_vista(request, prefijo, func.__name__, kwargs)
             
             # Extraer término de búsqueda para logging
             search_term = "desconocido"
@@ -1226,7 +2239,7 @@ def cache_response(timeout: int, key_prefix: str = ""):
                     pass
             
             # Verificar cache
-            cached_response = cache.get(cache_key)
+            cached_response = cache_get_contenido(cache_key)
             if cached_response is not None:
                 # Información de TTL
                 ttl_info = ""
@@ -1251,7 +2264,7 @@ def cache_response(timeout: int, key_prefix: str = ""):
             execution_time = time.time() - start_time
             
             if response.status_code == status.HTTP_200_OK:
-                cache.set(cache_key, response.data, timeout)
+                cache_set_contenido(cache_key, response.data, timeout)
                 
                 # Información de resultados
                 result_info = ""
@@ -1283,74 +2296,102 @@ def safe_strip(value):
 
 # ========== VISTAS MEJORADAS PARA JERARQUÍA REAL ==========
 
-@api_view(['GET'])
-@cache_response(timeout=LDAP_CACHE_TIMEOUT, key_prefix="arbol_jerarquico")
-def get_arbol_jerarquico(request):
-    """Obtener estructura jerárquica REAL basada en relaciones de supervisión"""
-    conn = None
-    try:
-        logger.info("🏢 Iniciando obtención de árbol jerárquico REAL")
-        
-        # Establecer conexión LDAP
-        conn = LDAPConnectionManager.get_connection()
-        if not conn.bound:
-            logger.error("❌ No se pudo establecer conexión con LDAP")
-            return Response(
-                {'error': 'Error de conexión con el directorio activo'}, 
-                status=status.HTTP_503_SERVICE_UNAVAILABLE
-            )
+def personas_para_arbol(personas):
+    """Normalizar personas del directorio al formato que usa el árbol jerárquico"""
+    todas_las_personas = []
+    
+    for persona in personas:
+        try:
+            if not is_account_enabled(persona.get('userAccountControl')):
+                continue
+            
+            persona_data = {
+                'distinguishedName': safe_strip(persona.get('distinguishedName')),
+                'givenName': safe_strip(persona.get('givenName')),
+                'sn': safe_strip(persona.get('sn')),
+                'mail': safe_strip(persona.get('mail')),
+                'title': safe_strip(persona.get('title')),
+                'department': safe_strip(persona.get('department')),
+                'manager': safe_strip(persona.get('manager'))
+            }
+            
+            # Validar datos mínimos
+            if (persona_data['distinguishedName'] and 
+                persona_data['department'] and
+                persona_data['givenName'] and 
+                persona_data['sn']):
+                
+                todas_las_personas.append(persona_data)
+                
+        except Exception as e:
+            logger.warning(f"⚠️ Error procesando entrada LDAP: {e}")
+            continue
+    
+    return todas_las_personas
 
-        # Buscar TODAS las personas activas con sus managers
-        search_filter = "(&(objectClass=person)(company=Envases CMF S.A.))"
-        
-        logger.info(f"🔍 Buscando personas y sus relaciones en LDAP...")
-        conn.search(
-            search_base=settings.LDAP_CONFIG['BASE_DN'],
-            search_filter=search_filter,
-            attributes=[
-                'department', 'title', 'givenName', 'sn', 'mail', 
-                'manager', 'userAccountControl', 'distinguishedName'
-            ]
+def construir_datos_arbol(snapshot):
+    """Árbol jerárquico e índice de subárboles, una vez por versión del directorio
+    
+    Si el snapshot anterior ya tenía su árbol, se copia su motor de
+    jerarquía y se le aplican solo los cambios entre ambas lecturas; el
+    resultado es el mismo que construirlo de cero (ver MotorJerarquia), así
+    todos los procesos sirven el mismo árbol para una misma versión. Solo
+    se reutiliza un árbol calculado con las mismas reglas de cargo.
+    """
+    clasificador = obtener_clasificador()
+    todas_las_personas = personas_para_arbol(snapshot.personas)
+    departamentos_unicos = {persona['department'] for persona in todas_las_personas}
+    
+    logger.info(f"📊 Datos obtenidos: {len(todas_las_personas)} personas, {len(departamentos_unicos)} departamentos")
+    
+    previos = snapshot.anterior.derivado_existente(f'arbol_jerarquico@{clasificador.version}') if snapshot.anterior else None
+    motor = previos['motor'].copiar() if previos and previos.get('motor') else None
+    eventos = diferencias_directorio(previos['personas'], todas_las_personas) if motor else None
+    
+    if motor and len(eventos) <= len(todas_las_personas) * MAX_PROPORCION_CAMBIOS_INCREMENTAL:
+        nodos = dict(previos['nodos'])
+        estructura, diagnostico = actualizar_jerarquia_incremental(motor, nodos, eventos, todas_las_personas)
+    elif todas_las_personas:
+        # 🎯 NUEVA ESTRATEGIA: Construir jerarquía REAL basada en relaciones de supervisión
+        # pero manteniendo la lógica de búsqueda de jefes existente
+        # Cálculo puro y pesado: se ejecuta en el pool de procesos
+        estructura, diagnostico, motor, nodos = ejecutar_calculo(
+            'arbol_jerarquico', construir_jerarquia_real_con_logica_existente, todas_las_personas, clasificador.reglas
         )
+    else:
+        estructura, diagnostico = [], {'ciclos': [], 'huerfanos': [], 'total_ciclos': 0, 'total_huerfanos': 0}
+        motor, nodos = None, {}
+    
+    return {
+        'estructura': estructura,
+        'diagnostico': diagnostico,
+        'total_personas': len(todas_las_personas),
+        'total_departamentos': len(departamentos_unicos),
+        'indice': IndiceArbol(estructura),
+        'version': snapshot.version,
+        'version_reglas': clasificador.version,
+        # Estado para actualizar incrementalmente con el próximo snapshot
+        'personas': todas_las_personas,
+        'motor': motor,
+        'nodos': nodos
+    }
 
-        # Recolectar y procesar datos
-        todas_las_personas = []
-        departamentos_unicos = set()
-        
-        for entry in conn.entries:
-            try:
-                attrs = procesar_atributos_ldap(entry.entry_attributes_as_dict)
-                
-                if not is_account_enabled(attrs.get('userAccountControl')):
-                    continue
-                
-                persona_data = {
-                    'distinguishedName': safe_strip(attrs.get('distinguishedName')),
-                    'givenName': safe_strip(attrs.get('givenName')),
-                    'sn': safe_strip(attrs.get('sn')),
-                    'mail': safe_strip(attrs.get('mail')),
-                    'title': safe_strip(attrs.get('title')),
-                    'department': safe_strip(attrs.get('department')),
-                    'manager': safe_strip(attrs.get('manager'))
-                }
-                
-                # Validar datos mínimos
-                if (persona_data['distinguishedName'] and 
-                    persona_data['department'] and
-                    persona_data['givenName'] and 
-                    persona_data['sn']):
-                    
-                    todas_las_personas.append(persona_data)
-                    departamentos_unicos.add(persona_data['department'])
-                    
-            except Exception as e:
-                logger.warning(f"⚠️ Error procesando entrada LDAP: {e}")
-                continue
+def obtener_datos_arbol():
+    """Datos del árbol jerárquico derivados del snapshot vigente del directorio"""
+    return derivado_con_reglas(obtener_directorio(), 'arbol_jerarquico', construir_datos_arbol)
 
-        conn.unbind()
+@api_view(['GET'])
+@cache_response(timeout=LDAP_CACHE_TIMEOUT, key_prefix="arbol_jerarquico", depende_de_reglas=True)
+def get_arbol_jerarquico(request):
+    """Obtener estructura jerárquica REAL basada en relaciones de supervisión"""
+    try:
+        logger.info("🏢 Iniciando obtención de árbol jerárquico REAL")
+        
+        # Buscar TODAS las personas activas con sus managers (snapshot del directorio)
+        datos = obtener_datos_arbol()
 
         # Validar que tenemos datos
-        if not todas_las_personas:
+        if not datos['total_personas']:
             return Response({
                 "estructura": [],
                 "total_personas": 0,
@@ -1358,23 +2399,24 @@ def get_arbol_jerarquico(request):
                 "timestamp": datetime.now().isoformat(),
                 "warning": "No se encontraron personas activas en la organización"
             })
-
-        logger.info(f"📊 Datos obtenidos: {len(todas_las_personas)} personas, {len(departamentos_unicos)} departamentos")
-
-        # 🎯 NUEVA ESTRATEGIA: Construir jerarquía REAL basada en relaciones de supervisión
-        # pero manteniendo la lógica de búsqueda de jefes existente
-        estructura = construir_jerarquia_real_con_logica_existente(todas_las_personas)
         
-        logger.info(f"🎉 Árbol jerárquico REAL construido: {len(estructura)} nodos raíz")
+        logger.info(f"🎉 Árbol jerárquico REAL construido: {len(datos['estructura'])} nodos raíz")
         
         return Response({
-            "estructura": estructura,
-            "total_personas": len(todas_las_personas),
-            "total_departamentos": len(departamentos_unicos),
+            "estructura": datos['estructura'],
+            "total_personas": datos['total_personas'],
+            "total_departamentos": datos['total_departamentos'],
             "timestamp": datetime.now().isoformat(),
-            "metodo": "jerarquia_real_con_logica_existente"
+            "metodo": "jerarquia_real_con_logica_existente",
+            "diagnostico": datos['diagnostico']
         })
         
+    except LDAPException as e:
+        logger.error(f"❌ No se pudo obtener el directorio desde LDAP: {e}")
+        return Response(
+            {'error': 'Error de conexión con el directorio activo'}, 
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
     except Exception as e:
         logger.error(f"🚨 Error en árbol jerárquico: {str(e)}", exc_info=True)
         return Response(
@@ -1382,6 +2424,205 @@ def get_arbol_jerarquico(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET'])
+def get_subarbol_jerarquico(request):
+    """Subárbol de departamentos limitado en profundidad, para expandir el árbol por niveles
+    
+    Parámetros: raiz (departamento, opcional), profundidad (1-10, por defecto 1),
+    conteos (1/0, hijos y descendientes por nodo) y estadisticas (1/0).
+    """
+    raiz = request.GET.get('raiz', '').strip() or None
+    try:
+        profundidad = min(max(int(request.GET.get('profundidad', 1)), 1), MAX_PROFUNDIDAD_SUBARBOL)
+    except ValueError:
+        return Response({'error': 'profundidad debe ser un número entero'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    conteos = request.GET.get('conteos', '1') != '0'
+    estadisticas = request.GET.get('estadisticas', '0') == '1'
+    
+    try:
+        datos = obtener_datos_arbol()
+    except LDAPException as e:
+        logger.error(f"❌ No se pudo obtener el directorio desde LDAP: {e}")
+        return Response({'error': 'Error de conexión con el directorio activo'}, 
+                       status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
+    indice = datos['indice']
+    if raiz is not None:
+        nombre_raiz = indice.resolver(raiz)
+        if nombre_raiz is None:
+            return Response({'error': 'Departamento no encontrado'}, 
+                           status=status.HTTP_404_NOT_FOUND)
+        raiz = nombre_raiz
+    
+    # La respuesta solo depende de la URL y de las versiones del directorio y de las reglas
+    etag = f'"{datos["version"]}-{datos["version_reglas"]}"'
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=status.HTTP_304_NOT_MODIFIED)
+    
+    response = Response({
+        'raiz': raiz,
+        'profundidad': profundidad,
+        'nodos': indice.subarbol(raiz, profundidad, conteos, estadisticas),
+        'version_directorio': datos['version']
+    })
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={SUBARBOL_MAX_AGE}'
+    return response
+
+def construir_layout_arbol(snapshot):
+    indice = derivado_con_reglas(snapshot, 'arbol_jerarquico', construir_datos_arbol)['indice']
+    return LayoutArbol(indice.raices, indice.hijos)
+
+def parametro_decimal(request, nombre):
+    """Parámetro GET opcional como float (None si no viene); ValueError si es inválido"""
+    valor = request.GET.get(nombre, '').strip()
+    return float(valor) if valor else None
+
+@api_view(['GET'])
+def get_layout_arbol(request):
+    """Coordenadas precalculadas del organigrama de departamentos
+    
+    Cada nodo trae x, y y la extensión de su subárbol. Con x_min, x_max,
+    y_min e y_max (opcionales) se devuelven solo los nodos dentro de esa
+    ventana, para dibujar organigramas grandes por partes.
+    """
+    try:
+        ventana = {nombre: parametro_decimal(request, nombre) for nombre in ('x_min', 'x_max', 'y_min', 'y_max')}
+    except ValueError:
+        return Response({'error': 'x_min, x_max, y_min e y_max deben ser números'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        # Árbol y layout del mismo snapshot, calculados una vez por versión
+        snapshot = obtener_directorio()
+        datos = derivado_con_reglas(snapshot, 'arbol_jerarquico', construir_datos_arbol)
+        layout = derivado_con_reglas(snapshot, 'layout_arbol', construir_layout_arbol)
+    except LDAPException as e:
+        logger.error(f"❌ No se pudo obtener el directorio desde LDAP: {e}")
+        return Response({'error': 'Error de conexión con el directorio activo'}, 
+                       status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
+    etag = f'"{datos["version"]}-{datos["version_reglas"]}"'
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=status.HTTP_304_NOT_MODIFIED)
+    
+    indice = datos['indice']
+    nodos = []
+    for posicion in layout.recortar(**ventana):
+        departamento = indice.nodos[posicion['nombre']]
+        nodos.append({
+            **posicion,
+            'jefe': (departamento.get('jefe') or {}).get('nombre'),
+            'tipo_nodo': departamento.get('tipo_nodo'),
+            'total_personas': departamento.get('total_personas', 0),
+            'total_subordinados': len(indice.hijos[posicion['nombre']]),
+        })
+    
+    response = Response({
+        'nodos': nodos,
+        'total_nodos': len(layout.nodos),
+        'ancho': layout.ancho,
+        'alto': layout.alto,
+        'version_directorio': datos['version']
+    })
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={SUBARBOL_MAX_AGE}'
+    return response
+
+# ========== CADENA DE MANDO ==========
+
+ATRIBUTOS_CADENA_MANDO = ['givenName', 'sn', 'DisplayName', 'mail', 'title', 'department']
+
+def construir_indice_ancestros(snapshot):
+    return IndiceAncestros(snapshot.personas_activas)
+
+def obtener_indice_ancestros(snapshot=None):
+    """Índice de ancestros (persona -> managers) del snapshot dado o del vigente"""
+    snapshot = snapshot or obtener_directorio()
+    return snapshot.derivado('indice_ancestros', construir_indice_ancestros)
+
+def resumen_persona_cadena(indice, persona_id, nivel):
+    persona = indice.personas[persona_id]
+    resumen = {attr: safe_strip(persona.get(attr)) for attr in ATRIBUTOS_CADENA_MANDO}
+    resumen['nivel'] = nivel
+    return resumen
+
+@api_view(['GET'])
+def get_cadena_mando(request):
+    """Cadena de mando completa de una persona (jefe directo, jefe del jefe, ...)"""
+    correo = request.GET.get('correo', '').strip()
+    if not correo:
+        return Response({'error': 'Parámetro correo requerido'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        indice = obtener_indice_ancestros()
+    except LDAPException as e:
+        logger.error(f"❌ No se pudo obtener el directorio desde LDAP: {e}")
+        return Response({'error': 'Error de conexión con el directorio activo'}, 
+                       status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
+    persona_id = indice.buscar(correo)
+    if persona_id is None:
+        return Response({'error': 'Trabajador no encontrado'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    
+    cadena = [
+        resumen_persona_cadena(indice, jefe_id, nivel)
+        for nivel, jefe_id in enumerate(indice.cadena_de_mando(persona_id), start=1)
+    ]
+    
+    return Response({
+        'persona': resumen_persona_cadena(indice, persona_id, 0),
+        'cadena': cadena,
+        'total_niveles': len(cadena)
+    })
+
+@api_view(['GET'])
+def get_jefe_comun(request):
+    """Jefe común más cercano de dos personas (correo_a y correo_b)"""
+    correo_a = request.GET.get('correo_a', '').strip()
+    correo_b = request.GET.get('correo_b', '').strip()
+    if not correo_a or not correo_b:
+        return Response({'error': 'Parámetros correo_a y correo_b requeridos'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        indice = obtener_indice_ancestros()
+    except LDAPException as e:
+        logger.error(f"❌ No se pudo obtener el directorio desde LDAP: {e}")
+        return Response({'error': 'Error de conexión con el directorio activo'}, 
+                       status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
+    id_a = indice.buscar(correo_a)
+    id_b = indice.buscar(correo_b)
+    if id_a is None or id_b is None:
+        return Response({'error': 'Trabajador no encontrado'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    
+    jefe_id = indice.jefe_comun(id_a, id_b)
+    if jefe_id == -1:
+        # Sin ancestro común: pertenecen a cadenas de mando distintas
+        return Response({
+            'persona_a': resumen_persona_cadena(indice, id_a, 0),
+            'persona_b': resumen_persona_cadena(indice, id_b, 0),
+            'jefe_comun': None,
+            'distancia_a': None,
+            'distancia_b': None
+        })
+    
+    distancia_a = indice.profundidad[id_a] - indice.profundidad[jefe_id]
+    distancia_b = indice.profundidad[id_b] - indice.profundidad[jefe_id]
+    
+    return Response({
+        'persona_a': resumen_persona_cadena(indice, id_a, 0),
+        'persona_b': resumen_persona_cadena(indice, id_b, 0),
+        'jefe_comun': resumen_persona_cadena(indice, jefe_id, 0),
+        'distancia_a': distancia_a,
+        'distancia_b': distancia_b
+    })
+
 def log_departamentos_con_jefes(departamentos_con_jerarquia):
     """Registra en el log la lista de departamentos con sus respectivos jefes"""
     logger.info("\n📋 RESUMEN DE DEPARTAMENTOS Y SUS JEFES:")
@@ -1408,25 +2649,16 @@ def log_departamentos_con_jefes(departamentos_con_jerarquia):
     logger.info(f"Total departamentos procesados: {len(departamentos_con_jerarquia)}\n")
 
 
-def construir_jerarquia_real_con_logica_existente(todas_las_personas):
-    """Construir jerarquía REAL pero usando la lógica existente de búsqueda de jefes"""
-    
-    logger.info("🔨 Construyendo jerarquía real con lógica existente de jefes...")
-    
-    # 1. Primero usar la lógica EXISTENTE para encontrar jefes de departamento
-    # (Esta es la parte que quieres mantener)
-    personas_por_depto = {}
-    for persona in todas_las_personas:
-        depto = persona['department']
-        if depto not in personas_por_depto:
-            personas_por_depto[depto] = []
-        personas_por_depto[depto].append(persona)
-    
-    # Encontrar jefes usando la lógica EXISTENTE
-    departamentos_con_jerarquia = []
-    for depto_nombre, personas_depto in personas_por_depto.items():
+def construir_nodos_departamentos(motor, departamentos):
+    """Nodos del árbol para los departamentos indicados: {nombre: nodo}"""
+    nodos = {}
+    for depto_nombre in departamentos:
+        personas_depto = motor.por_departamento.get(depto_nombre)
+        if not personas_depto:
+            continue
+        
         # ✅ USAR LA LÓGICA EXISTENTE para encontrar jerarca
-        jerarca_depto = encontrar_jerarca_departamento(personas_depto, todas_las_personas)
+        jerarca_depto = motor.jerarcas[depto_nombre]
         
         # Determinar si es gerencia basado en el cargo del jerarca
         es_gerencia_nodo = jerarca_depto and es_cargo_jerarquico_valido(jerarca_depto) and any(
@@ -1442,18 +2674,68 @@ def construir_jerarquia_real_con_logica_existente(todas_las_personas):
         )
         
         if nodo_depto:
-            departamentos_con_jerarquia.append(nodo_depto)
+            nodos[depto_nombre] = nodo_depto
+    
+    return nodos
+
+def ensamblar_jerarquia(motor, nodos):
+    """Árbol y diagnóstico a partir de los nodos, en el orden de los departamentos del motor"""
+    departamentos_con_jerarquia = [
+        nodos[nombre] for nombre in motor.departamentos_ordenados() if nombre in nodos
+    ]
+    return construir_relaciones_jerarquicas_reales(departamentos_con_jerarquia, motor)
+
+def construir_jerarquia_real_con_logica_existente(todas_las_personas, reglas=None):
+    """Construir jerarquía REAL pero usando la lógica existente de búsqueda de jefes
+    
+    Devuelve (estructura, diagnostico, motor, nodos); ver
+    construir_relaciones_jerarquicas_reales. El motor y los nodos permiten
+    luego actualizar el árbol con actualizar_jerarquia_incremental.
+    `reglas` son las reglas de cargo del proceso que pide el cálculo.
+    """
+    if reglas is not None:
+        fijar_reglas(reglas)
+    
+    logger.info("🔨 Construyendo jerarquía real con lógica existente de jefes...")
+    
+    # 1. Primero usar la lógica EXISTENTE para encontrar jefes de departamento
+    # (Esta es la parte que quieres mantener). El motor indexa el directorio
+    # una vez y resuelve todos los jerarcas en una sola pasada.
+    motor = MotorJerarquia(todas_las_personas)
+    motor.resolver_jerarcas()
+    nodos = construir_nodos_departamentos(motor, motor.departamentos_ordenados())
     
     # Registrar departamentos con sus jefes antes de construir la jerarquía
-    log_departamentos_con_jefes(departamentos_con_jerarquia)
+    log_departamentos_con_jefes(list(nodos.values()))
     
     # 2. Ahora construir la jerarquía REAL basada en relaciones de supervisión
-    arbol_departamentos = construir_relaciones_jerarquicas_reales(departamentos_con_jerarquia, todas_las_personas)
+    estructura, diagnostico = ensamblar_jerarquia(motor, nodos)
+    return estructura, diagnostico, motor, nodos
+
+def actualizar_jerarquia_incremental(motor, nodos, eventos, personas):
+    """Aplicar cambios del directorio al motor y rehacer solo los nodos afectados
+    
+    Modifica `motor` y `nodos` y devuelve (estructura, diagnostico).
+    `personas` es la lista nueva completa, cuyo orden decide los empates.
+    Las relaciones entre departamentos y el árbol se vuelven a armar sobre
+    los nodos (una pasada por departamento, no por persona).
+    """
+    afectados = motor.aplicar_eventos(eventos, personas)
     
-    return arbol_departamentos
+    for nombre in afectados:
+        nodos.pop(nombre, None)
+    nodos.update(construir_nodos_departamentos(motor, afectados))
+    
+    logger.info(f"♻️ Jerarquía actualizada con {len(eventos)} cambios ({len(afectados)} departamentos reconstruidos)")
+    return ensamblar_jerarquia(motor, nodos)
 
-def construir_relaciones_jerarquicas_reales(departamentos_con_jerarquia, todas_las_personas):
-    """Construir relaciones jerárquicas reales entre departamentos basadas en supervisión"""
+def construir_relaciones_jerarquicas_reales(departamentos_con_jerarquia, motor):
+    """Construir relaciones jerárquicas reales entre departamentos basadas en supervisión
+    
+    Devuelve (arbol, diagnostico). El diagnóstico informa los ciclos de
+    supervisión entre departamentos y los departamentos huérfanos (cuyo
+    jefe reporta a un manager que no está en el directorio activo).
+    """
     
     logger.info("🔗 Construyendo relaciones jerárquicas reales...")
     
@@ -1461,7 +2743,8 @@ def construir_relaciones_jerarquicas_reales(departamentos_con_jerarquia, todas_l
     mapa_departamentos = {depto['nombre']: depto for depto in departamentos_con_jerarquia}
     
     # 1. Identificar relaciones entre departamentos basadas en los jefes
-    relaciones = {}
+    padre_de = {}
+    huerfanos = []
     
     for depto in departamentos_con_jerarquia:
         jefe = depto.get('jefe')
@@ -1470,208 +2753,51 @@ def construir_relaciones_jerarquicas_reales(departamentos_con_jerarquia, todas_l
             
         # Buscar si este jefe reporta a alguien (tiene manager)
         jefe_dn = jefe.get('distinguishedName')
-        if not jefe_dn:
+        persona_jefe = motor.por_dn.get(jefe_dn) if jefe_dn else None
+        if not persona_jefe or not persona_jefe.get('manager'):
             continue
-            
-        # Buscar el manager de este jefe en todas las personas
-        manager_jefe = None
-        for persona in todas_las_personas:
-            if persona['distinguishedName'] == jefe_dn and persona.get('manager'):
-                manager_dn = persona['manager']
-                # Buscar al manager en todas las personas
-                for manager_persona in todas_las_personas:
-                    if manager_persona['distinguishedName'] == manager_dn:
-                        manager_jefe = manager_persona
-                        break
-                break
         
-        if manager_jefe:
-            # El departamento del manager es el departamento padre
-            depto_padre = manager_jefe.get('department')
-            if depto_padre and depto_padre in mapa_departamentos and depto_padre != depto['nombre']:
-                if depto_padre not in relaciones:
-                    relaciones[depto_padre] = []
-                relaciones[depto_padre].append(depto['nombre'])
-    
-    # 2. Construir el árbol jerárquico
-    # Identificar departamentos raíz (los que no son subordinados de nadie)
-    todos_subordinados = set()
-    for subordinados in relaciones.values():
-        todos_subordinados.update(subordinados)
-    
-    departamentos_raiz = [depto for depto in departamentos_con_jerarquia 
-                         if depto['nombre'] not in todos_subordinados]
-    
-    logger.info(f"🌳 Departamentos raíz identificados: {len(departamentos_raiz)}")
-    
-    # 3. Construir árbol recursivamente
-    arbol_final = []
-    for depto_raiz in departamentos_raiz:
-        nodo_raiz = construir_nodo_con_subordinados(depto_raiz, relaciones, mapa_departamentos, set())
-        if nodo_raiz:
-            arbol_final.append(nodo_raiz)
+        manager_jefe = motor.manager_de(persona_jefe)
+        if not manager_jefe:
+            huerfanos.append({
+                'departamento': depto['nombre'],
+                'jefe': jefe.get('nombre'),
+                'manager_dn': persona_jefe['manager'],
+                'motivo': 'manager_fuera_del_directorio'
+            })
+            continue
+        
+        # El departamento del manager es el departamento padre
+        depto_padre = manager_jefe.get('department')
+        if depto_padre and depto_padre in mapa_departamentos and depto_padre != depto['nombre']:
+            padre_de[depto['nombre']] = depto_padre
+    
+    # 2. Construir el árbol jerárquico de forma iterativa (detecta ciclos)
+    arbol_final, ciclos = construir_arbol_departamentos(departamentos_con_jerarquia, padre_de)
+    
+    logger.info(f"🌳 Departamentos raíz identificados: {len(arbol_final)}")
+    for ciclo in ciclos:
+        logger.warning(f"🔁 Ciclo de supervisión entre departamentos: {' -> '.join(ciclo['departamentos'])} "
+                       f"(raíz asignada: {ciclo['raiz_asignada']})")
+    for huerfano in huerfanos:
+        logger.warning(f"🧩 Departamento huérfano: {huerfano['departamento']} (manager {huerfano['manager_dn']} no encontrado)")
+    
+    diagnostico = {
+        'ciclos': ciclos,
+        'huerfanos': huerfanos,
+        'total_ciclos': len(ciclos),
+        'total_huerfanos': len(huerfanos)
+    }
     
     # Si no se encontraron relaciones claras, devolver la estructura plana
     if not arbol_final:
         logger.info("ℹ️ No se encontraron relaciones jerárquicas claras, retornando estructura plana")
-        return departamentos_con_jerarquia
+        return departamentos_con_jerarquia, diagnostico
     
-    return arbol_final
-
-def construir_nodo_con_subordinados(depto, relaciones, mapa_departamentos, visitados):
-    """Construir nodo recursivamente con sus subordinados"""
-    
-    if depto['nombre'] in visitados:
-        return None  # Evitar ciclos
-    
-    visitados.add(depto['nombre'])
-    
-    # Crear copia del departamento para no modificar el original
-    nodo = depto.copy()
-    nodo['subordinados'] = []
-    
-    # Agregar subordinados si existen
-    if depto['nombre'] in relaciones:
-        for subordinado_nombre in relaciones[depto['nombre']]:
-            if subordinado_nombre in mapa_departamentos:
-                subordinado = mapa_departamentos[subordinado_nombre]
-                nodo_subordinado = construir_nodo_con_subordinados(
-                    subordinado, relaciones, mapa_departamentos, visitados.copy()
-                )
-                if nodo_subordinado:
-                    nodo['subordinados'].append(nodo_subordinado)
-    
-    return nodo
+    return arbol_final, diagnostico
 
 # ✅ MANTENER TODAS LAS FUNCIONES EXISTENTES SIN CAMBIOS
 
-def es_cargo_jerarquico_valido(persona):
-    """Determinar si es un cargo jerárquico válido"""
-    if not persona or not persona.get('title'):
-        return False
-        
-    titulo = persona.get('title', '').lower()
-    
-    # Cargos jerárquicos válidos (todos en minúsculas para comparación)
-    cargos_jerarquicos = [
-        'gerente general',
-        'gerente',
-        'subgerente', 
-        'jefe',
-        'jefa',
-        'especialista',  # Convertido a minúsculas
-        'encargado',
-        'encargada',
-        'coordinador',
-        'coordinadora'
-    ]
-    
-    return any(cargo in titulo for cargo in cargos_jerarquicos)
-
-def encontrar_jerarca_departamento(personas_departamento, todas_las_personas):
-    """Encontrar jerarca del departamento - VERSIÓN CORREGIDA (MANTENER ESTA LÓGICA)"""
-    if not personas_departamento:
-        return None
-    
-    logger.info(f"🔍 Buscando jerarca para departamento con {len(personas_departamento)} personas")
-    
-    # Estrategia 1: Buscar personas con cargo jerárquico DENTRO del departamento
-    jefes_internos = [p for p in personas_departamento if es_cargo_jerarquico_valido(p)]
-    
-    if jefes_internos:
-        # Ordenar por prioridad jerárquica
-        jefes_ordenados = sorted(jefes_internos, key=lambda x: obtener_prioridad_jerarquia(x.get('title', '')))
-        logger.info(f"✅ Jerarca interno encontrado: {jefes_ordenados[0]['givenName']} - {jefes_ordenados[0]['title']}")
-        return jefes_ordenados[0]
-    
-    # Estrategia 2: Buscar el MANAGER de las personas de este departamento que tenga cargo jerárquico
-    logger.info("🔍 Buscando managers jerárquicos que supervisen este departamento...")
-    
-    managers_jerarquicos = {}
-    
-    for persona in personas_departamento:
-        if persona.get('manager'):
-            manager_dn = persona['manager']
-            
-            # Buscar al manager en todas las personas
-            for potential_manager in todas_las_personas:
-                if potential_manager['distinguishedName'] == manager_dn:
-                    # ✅ CRÍTICO: Solo considerar managers con cargo jerárquico válido
-                    if es_cargo_jerarquico_valido(potential_manager):
-                        managers_jerarquicos[manager_dn] = potential_manager
-                        logger.info(f"✅ Manager jerárquico encontrado: {potential_manager['givenName']} - {potential_manager['title']} (Depto: {potential_manager['department']})")
-                    break
-    
-    if managers_jerarquicos:
-        # Ordenar managers por prioridad jerárquica y tomar el mejor
-        managers_ordenados = sorted(managers_jerarquicos.values(), 
-                                  key=lambda x: obtener_prioridad_jerarquia(x.get('title', '')))
-        mejor_manager = managers_ordenados[0]
-        logger.info(f"🎯 Mejor manager jerárquico seleccionado: {mejor_manager['givenName']} - {mejor_manager['title']}")
-        return mejor_manager
-    
-    # Estrategia 3: Buscar cualquier manager (sin filtro de cargo) que supervise este departamento
-    logger.info("🔍 Buscando cualquier manager que supervise este departamento...")
-    managers_genericos = {}
-    
-    for persona in personas_departamento:
-        if persona.get('manager'):
-            manager_dn = persona['manager']
-            
-            for potential_manager in todas_las_personas:
-                if potential_manager['distinguishedName'] == manager_dn:
-                    managers_genericos[manager_dn] = potential_manager
-                    logger.info(f"📌 Manager genérico encontrado: {potential_manager['givenName']} - {potential_manager['title']}")
-                    break
-    
-    if managers_genericos:
-        # Ordenar por prioridad jerárquica (aunque no tengan cargo específico)
-        managers_ordenados = sorted(managers_genericos.values(), 
-                                  key=lambda x: obtener_prioridad_jerarquia(x.get('title', '')))
-        mejor_manager = managers_ordenados[0]
-        logger.info(f"📌 Usando manager genérico: {mejor_manager['givenName']} - {mejor_manager['title']}")
-        return mejor_manager
-    
-    # Estrategia 4: Buscar persona sin manager (posible jefe)
-    personas_sin_manager = [p for p in personas_departamento if not p.get('manager')]
-    if personas_sin_manager:
-        logger.info(f"👤 Usando persona sin manager como representante: {personas_sin_manager[0]['givenName']}")
-        return personas_sin_manager[0]
-    
-    # Estrategia 5: Cualquier persona del departamento (último recurso)
-    if personas_departamento:
-        logger.info(f"⚠️ Usando primera persona del departamento como representante: {personas_departamento[0]['givenName']}")
-        return personas_departamento[0]
-    
-    logger.warning("❌ No se pudo encontrar ningún jerarca para el departamento")
-    return None
-
-def obtener_prioridad_jerarquia(titulo):
-    """Obtener prioridad numérica de un cargo para determinar el jerarca"""
-    if not titulo:
-        return 999
-        
-    titulo_lower = titulo.lower()
-    
-    prioridades = {
-        'gerente general': 1,
-        'gerente': 2, 
-        'subgerente': 3,
-        'jefe': 4,          
-        'jefa': 4,          
-        'especialista': 4,
-        'coordinador': 5,   
-        'coordinadora': 5,  
-        'encargado': 5,     
-        'encargada': 5
-    }
-    
-    for cargo, prioridad in prioridades.items():
-        if cargo in titulo_lower:
-            return prioridad
-    
-    return 999
-
 def construir_nodo_departamento_mejorado(nombre_departamento, personas_departamento, jerarca_depto, es_gerencia):
     """Construir nodo de departamento - VERSIÓN MEJORADA (MANTENER ESTA LÓGICA)"""
     
@@ -1753,68 +2879,11 @@ def construir_nodo_departamento_mejorado(nombre_departamento, personas_departame
 def get_lista_departamentos(request):
     """Obtener lista enriquecida de todos los departamentos con conteos de personas y subáreas"""
     try:
-        conn = LDAPConnectionManager.get_connection()
+        # 1. Obtener todas las personas activas y sus relaciones (snapshot del directorio)
+        snapshot = obtener_directorio()
         
-        # 1. Obtener todas las personas activas y sus relaciones
-        search_filter = "(&(objectClass=person)(company=Envases CMF S.A.))"
-        conn.search(
-            search_base=settings.LDAP_CONFIG['BASE_DN'],
-            search_filter=search_filter,
-            attributes=['department', 'userAccountControl', 'manager', 'distinguishedName']
-        )
-
-        deptos_info = {}
-        todas_las_personas = []
-        
-        for entry in conn.entries:
-            attrs = procesar_atributos_ldap(entry.entry_attributes_as_dict)
-            if not is_account_enabled(attrs.get('userAccountControl')):
-                continue
-                
-            depto_raw = attrs.get('department')
-            if not depto_raw:
-                continue
-                
-            nombre_norm = normalizar_nombre_departamento(depto_raw)
-            
-            if nombre_norm not in deptos_info:
-                deptos_info[nombre_norm] = {
-                    'nombre': nombre_norm,
-                    'total_personas': 0,
-                    'subareas': 0
-                }
-            
-            deptos_info[nombre_norm]['total_personas'] += 1
-            
-            todas_las_personas.append({
-                'department': nombre_norm,
-                'manager': safe_strip(attrs.get('manager')),
-                'distinguishedName': safe_strip(attrs.get('distinguishedName'))
-            })
-
-        conn.unbind()
-
-        # 2. Calcular subáreas (relaciones jerárquicas entre departamentos)
-        # Un departamento A es "padre" de B si alguien en B reporta a alguien en A
-        relaciones_vistas = set()
-        for persona in todas_las_personas:
-            if persona['manager']:
-                # Buscar al manager en la lista de personas
-                for potential_manager in todas_las_personas:
-                    if potential_manager['distinguishedName'] == persona['manager']:
-                        depto_padre = potential_manager['department']
-                        depto_hijo = persona['department']
-                        
-                        # Si reporta a alguien de otro departamento, es una relación de subárea
-                        if depto_padre != depto_hijo:
-                            relacion = (depto_padre, depto_hijo)
-                            if relacion not in relaciones_vistas:
-                                relaciones_vistas.add(relacion)
-                                if depto_padre in deptos_info:
-                                    deptos_info[depto_padre]['subareas'] += 1
-                        break
-        
-        departamentos_finales = sorted(deptos_info.values(), key=lambda x: x['nombre'])
+        # Lineal sobre el snapshot: enviarlo al pool costaría más que calcularlo aquí
+        departamentos_finales = calcular_lista_departamentos(snapshot.personas)
         logger.info(f"📋 Lista departamentos enriquecida: {len(departamentos_finales)} encontrados")
         
         return Response({
@@ -1827,8 +2896,64 @@ def get_lista_departamentos(request):
         return Response({'error': 'Error obteniendo lista de departamentos'}, 
                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def calcular_lista_departamentos(personas):
+    """Departamentos con conteo de personas activas y subáreas (una pasada por las personas)"""
+    deptos_info = {}
+    todas_las_personas = []
+    
+    for attrs in personas:
+        if not is_account_enabled(attrs.get('userAccountControl')):
+            continue
+            
+        depto_raw = attrs.get('department')
+        if not depto_raw:
+            continue
+            
+        nombre_norm = normalizar_nombre_departamento(depto_raw)
+        
+        if nombre_norm not in deptos_info:
+            deptos_info[nombre_norm] = {
+                'nombre': nombre_norm,
+                'total_personas': 0,
+                'subareas': 0
+            }
+        
+        deptos_info[nombre_norm]['total_personas'] += 1
+        
+        todas_las_personas.append({
+            'department': nombre_norm,
+            'manager': safe_strip(attrs.get('manager')),
+            'distinguishedName': safe_strip(attrs.get('distinguishedName'))
+        })
+
+    # 2. Calcular subáreas (relaciones jerárquicas entre departamentos)
+    # Un departamento A es "padre" de B si alguien en B reporta a alguien en A
+    departamento_por_dn = {}
+    for persona in todas_las_personas:
+        departamento_por_dn.setdefault(persona['distinguishedName'], persona['department'])
+    
+    relaciones_vistas = set()
+    for persona in todas_las_personas:
+        if persona['manager'] and persona['manager'] in departamento_por_dn:
+            depto_padre = departamento_por_dn[persona['manager']]
+            depto_hijo = persona['department']
+            
+            # Si reporta a alguien de otro departamento, es una relación de subárea
+            if depto_padre != depto_hijo:
+                relacion = (depto_padre, depto_hijo)
+                if relacion not in relaciones_vistas:
+                    relaciones_vistas.add(relacion)
+                    deptos_info[depto_padre]['subareas'] += 1
+    
+    return sorted(deptos_info.values(), key=lambda x: x['nombre'])
+
+@lru_cache(maxsize=1024)
 def normalizar_nombre_departamento(nombre):
-    """Normaliza el nombre del departamento para evitar duplicados por formato"""
+    """Normaliza el nombre del departamento para evitar duplicados por formato
+    
+    Se memoriza por nombre: hay pocos departamentos distintos y esta función
+    se aplica a cada persona del directorio.
+    """
     # Convertir a minúsculas y capitalizar (primera letra mayúscula)
     nombre = nombre.strip().lower()
     
@@ -1849,83 +2974,37 @@ def normalizar_nombre_departamento(nombre):
     return ' '.join(palabras_normalizadas)
         
 @api_view(['GET'])
-@cache_response(timeout=LDAP_CACHE_TIMEOUT, key_prefix="departamento_detalle")
 def get_departamento_detalle(request, nombre_departamento):
-    """Obtener detalle completo de un departamento específico"""
-    try:
-        conn = LDAPConnectionManager.get_connection()
-        
-        search_filter = f"(&(objectClass=person)(department={nombre_departamento})(company=Envases CMF S.A.))"
-        
-        conn.search(
-            search_base=settings.LDAP_CONFIG['BASE_DN'],
-            search_filter=search_filter,
-            attributes=['givenName', 'sn', 'mail', 'title', 'department', 
-                       'telephoneNumber', 'userAccountControl', 'manager']
-        )
-
-        trabajadores = []
-        for entry in conn.entries:
-            attrs = procesar_atributos_ldap(entry.entry_attributes_as_dict)
-            
-            if not is_account_enabled(attrs.get('userAccountControl')):
-                continue
-            
-            trabajador = {
-                'givenName': attrs.get('givenName', ''),
-                'sn': attrs.get('sn', ''),
-                'mail': attrs.get('mail', ''),
-                'title': attrs.get('title', ''),
-                'telephoneNumber': attrs.get('telephoneNumber', ''),
-                'manager': attrs.get('manager', ''),
-                'userAccountControl_enabled': True
-            }
-            
-            trabajadores.append(trabajador)
-        
-        conn.unbind()
-        
-        # Encontrar jerarca del departamento
-        todas_las_personas = trabajadores  # Para este contexto, usamos solo los trabajadores del depto
-        jerarca_depto = encontrar_jerarca_departamento(trabajadores, todas_las_personas)
-        
-        # Contar cargos jerárquicos
-        cargos_jerarquicos = [t for t in trabajadores if es_cargo_jerarquico_valido(t)]
-        
-        logger.info(f"📊 Detalle departamento '{nombre_departamento}': {len(trabajadores)} trabajadores, {len(cargos_jerarquicos)} cargos jerárquicos")
-        
-        return Response({
-            'departamento': nombre_departamento,
-            'total_trabajadores': len(trabajadores),
-            'jerarca': jerarca_depto,
-            'trabajadores': trabajadores,
+    """Obtener detalle completo de un departamento específico (adaptador del recurso unificado)"""
+    def proyectar(recurso):
+        campos = ['givenName', 'sn', 'mail', 'title', 'telephoneNumber', 'manager']
+        estadisticas = recurso['estadisticas']
+        return {
+            'departamento': recurso['departamento'],
+            'total_trabajadores': recurso['total_trabajadores'],
+            'jerarca': proyectar_persona_departamento(recurso['jefe'], campos),
+            'trabajadores': [proyectar_persona_departamento(t, campos) for t in recurso['trabajadores']],
             'estadisticas': {
-                'cargos_jerarquicos': len(cargos_jerarquicos),
-                'con_cargo_especifico': len([t for t in trabajadores if t.get('title')]),
-                'con_telefono': len([t for t in trabajadores if t.get('telephoneNumber')]),
-                'con_email': len([t for t in trabajadores if t.get('mail')])
+                'cargos_jerarquicos': estadisticas['cargos_jerarquicos'],
+                'con_cargo_especifico': estadisticas['con_cargo'],
+                'con_telefono': estadisticas['con_telefono'],
+                'con_email': estadisticas['con_email']
             }
-        })
-
+        }
+    
+    try:
+        return respuesta_recurso_departamento(nombre_departamento, proyectar)
     except Exception as e:
         logger.error(f"🚨 Error en detalle departamento {nombre_departamento}: {e}")
         return Response({'error': 'Error obteniendo departamento'}, 
                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
+
 @api_view(['GET'])
-@cache_response(timeout=LDAP_CACHE_TIMEOUT, key_prefix="resumen_organizacion")
+@cache_response(timeout=LDAP_CACHE_TIMEOUT, key_prefix="resumen_organizacion", depende_de_reglas=True)
 def get_resumen_organizacion(request):
     """Resumen ejecutivo de toda la organización"""
     try:
-        conn = LDAPConnectionManager.get_connection()
-        
-        search_filter = "(&(objectClass=person)(company=Envases CMF S.A.))"
-        
-        conn.search(
-            search_base=settings.LDAP_CONFIG['BASE_DN'],
-            search_filter=search_filter,
-            attributes=['department', 'title', 'userAccountControl']
-        )
+        snapshot = obtener_directorio()
 
         departamentos_todos = set()  # Para todos los departamentos (37)
         departamentos_activos = set()  # Solo departamentos con personal activo
@@ -1933,12 +3012,10 @@ def get_resumen_organizacion(request):
         total_personas_activas = 0
         total_personas_todas = 0
         
-        for entry in conn.entries:
-            attrs = procesar_atributos_ldap(entry.entry_attributes_as_dict)
-            
+        for attrs in snapshot.personas:
             depto = attrs.get('department')
             titulo = attrs.get('title', '')
-            cuenta_activa = is_account_enabled(attrs.get('userAccountControl'))
+            cuenta_activa = attrs['activo']
             
             if depto and depto.strip():
                 depto_normalizado = normalizar_nombre_departamento(depto.strip())
@@ -1955,7 +3032,7 @@ def get_resumen_organizacion(request):
                     if es_cargo_jerarquico_valido({'title': titulo}):
                         cargos_jerarquicos += 1
         
-        conn.unbind()
+        grafo = obtener_grafo_organizacion()
         
         logger.info(f"📈 Resumen organización: {len(departamentos_todos)} deptos totales, {len(departamentos_activos)} deptos activos, {total_personas_activas} personas activas")
         
@@ -1966,6 +3043,8 @@ def get_resumen_organizacion(request):
             'total_personas_todas': total_personas_todas,  # Todas las personas
             'total_cargos_jerarquicos': cargos_jerarquicos,
             'promedio_por_departamento': round(total_personas_activas / len(departamentos_activos), 2) if departamentos_activos else 0,
+            'span_de_control': grafo.resumen_span_de_control(),
+            'profundidad_departamentos': grafo.estadisticas_departamentos(),
             'timestamp': datetime.now().isoformat(),
             'nota': 'total_departamentos incluye todos los departamentos existentes (activos e inactivos)'
         })
@@ -1975,6 +3054,51 @@ def get_resumen_organizacion(request):
         return Response({'error': 'Error obteniendo resumen'}, 
                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def calcular_grafo_organizacion(personas_activas):
+    """Grafo columnar a partir de las personas activas (ejecutable en el pool de procesos)"""
+    indice = IndiceAncestros(personas_activas)
+    return GrafoOrganizacion(indice.personas, indice.padre, indice.profundidad)
+
+def obtener_grafo_organizacion(snapshot=None):
+    """Grafo columnar persona -> manager del snapshot dado o del vigente
+    
+    Comparte ids con el índice de ancestros solo si ambos vienen del mismo
+    snapshot: quien use los dos debe pasarles el mismo objeto.
+    """
+    snapshot = snapshot or obtener_directorio()
+    return snapshot.derivado(
+        'grafo_organizacion',
+        lambda snapshot: ejecutar_calculo('grafo_organizacion', calcular_grafo_organizacion, snapshot.personas_activas)
+    )
+
+@api_view(['GET'])
+def get_estadisticas_jefe(request):
+    """Reportes directos e indirectos y profundidad del equipo de una persona"""
+    correo = request.GET.get('correo', '').strip()
+    if not correo:
+        return Response({'error': 'Parámetro correo requerido'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        # Un solo snapshot: los ids del índice indexan los arreglos del grafo
+        snapshot = obtener_directorio()
+        indice = obtener_indice_ancestros(snapshot)
+        grafo = obtener_grafo_organizacion(snapshot)
+    except LDAPException as e:
+        logger.error(f"❌ No se pudo obtener el directorio desde LDAP: {e}")
+        return Response({'error': 'Error de conexión con el directorio activo'}, 
+                       status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
+    persona_id = indice.buscar(correo)
+    if persona_id is None:
+        return Response({'error': 'Trabajador no encontrado'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    
+    return Response({
+        'persona': resumen_persona_cadena(indice, persona_id, 0),
+        **grafo.estadisticas_persona(persona_id)
+    })
+
 # ========== FUNCIONES COMPATIBILIDAD ==========
 
 @api_view(['GET'])
@@ -2012,148 +3136,39 @@ def get_resumen_supervision(request):
         )
 @api_view(['GET'])
 @handle_ldap_errors
-@cache_response(timeout=LDAP_CACHE_TIMEOUT, key_prefix="departamento_completo")
 def departamento_completo(request):
-    """Vista consolidada que devuelve TODOS los datos del departamento en una sola respuesta"""
+    """Vista consolidada que devuelve TODOS los datos del departamento en una sola respuesta
+    
+    Adaptador del recurso unificado (api/departamentos/<nombre>/).
+    """
     nombre_departamento = request.GET.get('nombre', '').strip()
     
     if not nombre_departamento:
         return Response({'error': 'Nombre de departamento requerido'}, 
                        status=status.HTTP_400_BAD_REQUEST)
-
-    try:
-        conn = LDAPConnectionManager.get_connection()
-        
-        # 1. BUSCAR TODOS LOS TRABAJADORES DEL DEPARTAMENTO
-        search_filter = f"(&(objectClass=person)(department={nombre_departamento})(company=Envases CMF S.A.))"
-        
-        conn.search(
-            search_base=settings.LDAP_CONFIG['BASE_DN'],
-            search_filter=search_filter,
-            attributes=[
-                'givenName', 'sn', 'mail', 'title', 'department',
-                'telephoneNumber', 'userAccountControl', 'manager',
-                'distinguishedName'
-            ]
-        )
-
-        trabajadores_departamento = []
-        for entry in conn.entries:
-            attrs = procesar_atributos_ldap(entry.entry_attributes_as_dict)
-            
-            # Solo cuentas habilitadas
-            if not is_account_enabled(attrs.get('userAccountControl')):
-                continue
-            
-            trabajador = {
-                'givenName': attrs.get('givenName', ''),
-                'sn': attrs.get('sn', ''),
-                'mail': attrs.get('mail', ''),
-                'title': attrs.get('title', ''),
-                'telephoneNumber': attrs.get('telephoneNumber', ''),
-                'manager': attrs.get('manager', ''),
-                'distinguishedName': attrs.get('distinguishedName', ''),
-                'userAccountControl_enabled': True
-            }
-            
-            trabajadores_departamento.append(trabajador)
-
-        # 2. BUSCAR TODAS LAS PERSONAS DE LA ORGANIZACIÓN para encontrar jefes correctamente
-        todas_las_personas = []
-        search_filter_todas = "(&(objectClass=person)(company=Envases CMF S.A.))"
-        
-        conn.search(
-            search_base=settings.LDAP_CONFIG['BASE_DN'],
-            search_filter=search_filter_todas,
-            attributes=[
-                'givenName', 'sn', 'mail', 'title', 'department',
-                'telephoneNumber', 'userAccountControl', 'manager',
-                'distinguishedName'
-            ]
-        )
-        
-        for entry in conn.entries:
-            attrs = procesar_atributos_ldap(entry.entry_attributes_as_dict)
-            
-            if not is_account_enabled(attrs.get('userAccountControl')):
-                continue
-            
-            persona = {
-                'givenName': attrs.get('givenName', ''),
-                'sn': attrs.get('sn', ''),
-                'mail': attrs.get('mail', ''),
-                'title': attrs.get('title', ''),
-                'department': attrs.get('department', ''),
-                'telephoneNumber': attrs.get('telephoneNumber', ''),
-                'manager': attrs.get('manager', ''),
-                'distinguishedName': attrs.get('distinguishedName', ''),
-                'userAccountControl_enabled': True
-            }
-            
-            todas_las_personas.append(persona)
-
-        # 3. ENCONTRAR JEFE DEL DEPARTAMENTO usando TODAS las personas
-        jerarca_depto = encontrar_jerarca_departamento(trabajadores_departamento, todas_las_personas)
-        
-        # 4. OBTENER DATOS COMPLETOS DEL JEFE (si existe)
-        jefe_completo = None
-        if jerarca_depto and jerarca_depto.get('distinguishedName'):
-            try:
-                # Buscar datos completos del jefe por distinguishedName (más preciso)
-                jefe_dn = jerarca_depto['distinguishedName']
-                jefe_search_filter = f"(distinguishedName={jefe_dn})"
-                conn.search(
-                    search_base=settings.LDAP_CONFIG['BASE_DN'],
-                    search_filter=jefe_search_filter,
-                    attributes=[
-                        'givenName', 'sn', 'mail', 'title', 'department',
-                        'telephoneNumber', 'userAccountControl', 'manager',
-                        'distinguishedName'
-                    ]
-                )
-                
-                if conn.entries:
-                    jefe_entry = conn.entries[0]
-                    jefe_completo = procesar_atributos_ldap(jefe_entry.entry_attributes_as_dict)
-                    # Solo incluir si la cuenta está habilitada
-                    if not is_account_enabled(jefe_completo.get('userAccountControl')):
-                        jefe_completo = None
-                    else:
-                        jefe_completo['userAccountControl_enabled'] = True
-                        jefe_completo.pop('userAccountControl', None)
-            except Exception as e:
-                logger.warning(f"Error obteniendo datos completos del jefe {jerarca_depto.get('mail')}: {e}")
-
-        conn.unbind()
-
-        # 5. CONSTRUIR RESPUESTA CONSOLIDADA
-        respuesta = {
-            'departamento': nombre_departamento,
-            'total_trabajadores': len(trabajadores_departamento),
-            'jefe': jerarca_depto,
-            'jefe_completo': jefe_completo,
-            'trabajadores': trabajadores_departamento,
+    
+    def proyectar(recurso):
+        campos = ['givenName', 'sn', 'mail', 'title', 'telephoneNumber', 'manager', 'distinguishedName']
+        estadisticas = recurso['estadisticas']
+        return {
+            'departamento': recurso['departamento'],
+            'total_trabajadores': recurso['total_trabajadores'],
+            'jefe': proyectar_persona_departamento(recurso['jefe'], ATRIBUTOS_JEFE_COMPLETO),
+            'jefe_completo': recurso['jefe_completo'],
+            'trabajadores': [proyectar_persona_departamento(t, campos) for t in recurso['trabajadores']],
             'estadisticas': {
-                'con_email': len([t for t in trabajadores_departamento if t.get('mail')]),
-                'con_telefono': len([t for t in trabajadores_departamento if t.get('telephoneNumber')]),
-                'con_cargo': len([t for t in trabajadores_departamento if t.get('title')]),
-                'cargos_jerarquicos': len([t for t in trabajadores_departamento if es_cargo_jerarquico_valido(t)]),
-                'sin_manager': len([t for t in trabajadores_departamento if not t.get('manager')])
+                'con_email': estadisticas['con_email'],
+                'con_telefono': estadisticas['con_telefono'],
+                'con_cargo': estadisticas['con_cargo'],
+                'cargos_jerarquicos': estadisticas['cargos_jerarquicos'],
+                'sin_manager': estadisticas['sin_manager']
             },
             'timestamp': datetime.now().isoformat(),
-            'metadatos': {
-                'jerarca_encontrado': jerarca_depto is not None,
-                'jerarca_es_interno': jerarca_depto and any(
-                    p['distinguishedName'] == jerarca_depto['distinguishedName'] 
-                    for p in trabajadores_departamento
-                ) if jerarca_depto else False
-            }
+            'metadatos': recurso['metadatos']
         }
-
-        logger.info(f"📊 Departamento completo '{nombre_departamento}': {len(trabajadores_departamento)} trabajadores, jefe: {jerarca_depto['givenName'] if jerarca_depto else 'No asignado'}")
-        
-        return Response(respuesta)
-
+    
+    try:
+        return respuesta_recurso_departamento(nombre_departamento, proyectar)
     except Exception as e:
         logger.error(f"🚨 Error en departamento completo {nombre_departamento}: {e}")
         return Response({'error': 'Error obteniendo datos del departamento'}, 